@@ -0,0 +1,110 @@
+"""micro-benchmark of the business onboarding throughput: the businesses added one by one through the add_business
+flow (a location check, two insert_one and a find_one per business) vs the bulk import of the same rows
+(a batch location check and an insert_many per chunk). the country boundaries are synthetic boxes around the
+stand-in countries, so the remote reverse geocoder is never called.
+
+run from the voyage-backend directory:
+    python -m benchmarks.bench_business_import
+    python -m benchmarks.bench_business_import --rows 5000 --mongo-uri mongodb://localhost:27017   (a local mongod)
+"""
+import argparse
+import io
+import logging
+import random
+import time
+
+from benchmarks.fake_services import COUNTRY_CENTERS
+from src.processors.data_validator import DataValidator
+from src.resources.country_boundaries import CountryBoundaryIndex
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.resources.mongo_client_pool import MongoClientPool
+from src.resources.mongo_db_resource import MongoDBResource
+from src.services.business_clients_service import BusinessService
+from src.services.business_import_service import BusinessImportService
+
+CSV_FIELDS = ["business_name", "business_type", "business_phone", "business_email", "business_country",
+              "business_contact_person", "business_contact_person_phone", "credits_bought",
+              "business_match_interest_points", "business_latitude", "business_longitude"]
+
+
+def make_boundaries() -> CountryBoundaryIndex:
+    boundaries = CountryBoundaryIndex(path=None).load()
+    features = []
+    for latitude, longitude, country_code in COUNTRY_CENTERS.values():
+        box = [[longitude - 3, latitude - 3], [longitude + 3, latitude - 3], [longitude + 3, latitude + 3],
+               [longitude - 3, latitude + 3], [longitude - 3, latitude - 3]]
+        features.append({"properties": {"ISO_A2": country_code.upper()},
+                         "geometry": {"type": "Polygon", "coordinates": [box]}})
+    boundaries.load_geojson({"features": features})
+    return boundaries
+
+
+def make_rows(count: int, seed: int) -> list[dict[str, str]]:
+    rand = random.Random(seed)
+    rows = []
+    for number in range(count):
+        country_name = rand.choice(list(COUNTRY_CENTERS))
+        latitude, longitude, _ = COUNTRY_CENTERS[country_name]
+        rows.append({"business_name": f"Business {number}", "business_type": "restaurant",
+                     "business_phone": "050-1234567", "business_email": f"business{number}@mail.com",
+                     "business_country": country_name, "business_contact_person": "Partner",
+                     "business_contact_person_phone": "050-7654321", "credits_bought": "100",
+                     "business_match_interest_points": "food,history",
+                     "business_latitude": f"{latitude + rand.uniform(-1, 1):.5f}",
+                     "business_longitude": f"{longitude + rand.uniform(-1, 1):.5f}"})
+    return rows
+
+
+def to_csv(rows: list[dict[str, str]]) -> str:
+    lines = [",".join(CSV_FIELDS)]
+    lines.extend(",".join(f'"{row[field]}"' for field in CSV_FIELDS) for row in rows)
+    return "\n".join(lines) + "\n"
+
+
+def make_client_pool(mongo_uri: str) -> MongoClientPool:
+    if mongo_uri:
+        return MongoClientPool(mongo_uri, health_check_interval=0)
+    import mongomock
+    return MongoClientPool("mongodb://localhost", health_check_interval=0, client_factory=mongomock.MongoClient)
+
+
+def one_by_one(rows: list[dict[str, str]], db_resource: MongoDBResource, data_validator: DataValidator) -> float:
+    start_time = time.perf_counter()
+    for row in rows:
+        service = BusinessService(dict(row), db_resource)
+        service.data_validator = data_validator
+        service.add_new_business()
+    return time.perf_counter() - start_time
+
+
+def bulk_import(rows: list[dict[str, str]], db_resource: MongoDBResource, data_validator: DataValidator) -> float:
+    start_time = time.perf_counter()
+    service = BusinessImportService(db_resource, data_validator)
+    report = service.import_rows(service.read_rows(io.StringIO(to_csv(rows)), "csv"))
+    assert report["inserted"] == len(rows), report["results"][:3]
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--mongo-uri", help="a local mongod (by default - an in-memory mongomock)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    rows = make_rows(args.rows, args.seed)
+    data_validator = DataValidator(geo_cache=GeoValidationCache(), country_boundaries=make_boundaries())
+    print(f"{args.rows} businesses")
+    for name, func in (("one by one", one_by_one), ("bulk import", bulk_import)):
+        client_pool = make_client_pool(args.mongo_uri)
+        db_resource = MongoDBResource(client_pool)
+        db_resource.business_collection.drop()
+        db_resource.business_clients_collection.drop()
+        elapsed_seconds = func(rows, db_resource, data_validator)
+        print(f"{name:>12}: {elapsed_seconds:8.2f} seconds {args.rows / elapsed_seconds:10.0f} rows/second")
+        client_pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""micro-benchmark of the country resolution path of a trip request: the old lookups (pycountry_convert is called
+for the country name by each step of the request - the recommendations, the prompt of every attempt and the saved
+trip - and for the country code by every coordinates check) vs the precomputed country table (the country is
+resolved once per request, and a coordinates check is a dict lookup).
+
+run from the voyage-backend directory:
+    python -m benchmarks.bench_country_lookup
+    python -m benchmarks.bench_country_lookup --requests 5000 --checks 45
+"""
+import argparse
+import logging
+import statistics
+import time
+
+from pycountry_convert import country_alpha2_to_country_name, country_name_to_country_alpha2
+from pycountry_convert import country_mappings
+
+from src.resources.country_table import CountryTable
+from src.services.user_service import MAX_ITINERARY_ATTEMPTS
+
+COUNTRY_CODES = ["IT", "FR", "ES", "GR", "JP", "us", "GB", "PT"]
+# the country name lookups of a request with a single attempt - prepare, recommendations, prompt and the saved trip
+NAME_LOOKUPS = 4
+
+
+def old_request(country_code: str, attempts: int, checks: int) -> None:
+    for _ in range(NAME_LOOKUPS + attempts - 1):
+        c_name = country_alpha2_to_country_name(country_code.upper(), cn_name_format="default")
+    for _ in range(checks):
+        country_name_to_country_alpha2(c_name)
+
+
+def table_request(table: CountryTable, country_code: str, checks: int) -> None:
+    country = table.resolve_country_code(country_code)
+    for _ in range(checks):
+        table.get_country_code(country.name)
+
+
+def measure(func, requests: int) -> list[float]:
+    latencies = []
+    for request_number in range(requests):
+        country_code = COUNTRY_CODES[request_number % len(COUNTRY_CODES)]
+        start = time.perf_counter()
+        func(country_code)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def measure_cold_start() -> tuple[float, float]:
+    """the first lookup of a process - pycountry_convert builds its maps, the table is built by the warm-up"""
+    for cached_map in (country_mappings.map_countries, country_mappings.map_country_name_to_country_alpha2,
+                       country_mappings.map_country_alpha2_to_country_name):
+        cached_map.cache_clear()
+    start = time.perf_counter()
+    country_alpha2_to_country_name("IT")
+    old_seconds = time.perf_counter() - start
+    for cached_map in (country_mappings.map_countries, country_mappings.map_country_name_to_country_alpha2,
+                       country_mappings.map_country_alpha2_to_country_name):
+        cached_map.cache_clear()
+    start = time.perf_counter()
+    CountryTable().load()
+    return old_seconds, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--checks", type=int, default=30, help="the coordinates checks of a request")
+    parser.add_argument("--attempts", type=int, default=1, choices=range(1, MAX_ITINERARY_ATTEMPTS + 1))
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    old_cold_seconds, table_build_seconds = measure_cold_start()
+    table = CountryTable().load()
+    old = sorted(measure(lambda code: old_request(code, args.attempts, args.checks), args.requests))
+    precomputed = sorted(measure(lambda code: table_request(table, code, args.checks), args.requests))
+
+    print(f"first lookup of the process: pycountry_convert {old_cold_seconds * 1000:.1f} ms, "
+          f"country table build (warm-up) {table_build_seconds * 1000:.1f} ms")
+    print(f"{args.requests} requests, {args.attempts} attempts and {args.checks} coordinates checks per request")
+    print(f"{'path':>14} {'p50 (us)':>10} {'p95 (us)':>10} {'mean (us)':>10}")
+    for name, latencies in (("pycountry", old), ("country table", precomputed)):
+        print(f"{name:>14} {statistics.median(latencies) * 1000:>10.1f} "
+              f"{latencies[int(len(latencies) * 0.95)] * 1000:>10.1f} {statistics.mean(latencies) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
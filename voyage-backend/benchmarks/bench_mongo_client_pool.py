@@ -0,0 +1,70 @@
+"""benchmark of the per-request mongo overhead:
+a new MongoClient + ping per request (the old MongoDBResource behaviour) vs the shared MongoClientPool.
+
+run from the voyage-backend directory:
+    python -m benchmarks.bench_mongo_client_pool                                  (mongomock stand-in)
+    python -m benchmarks.bench_mongo_client_pool --uri mongodb://localhost:27017  (local mongod)
+"""
+import argparse
+import statistics
+import time
+
+from pymongo.mongo_client import MongoClient
+
+from src.resources.mongo_client_pool import MongoClientPool
+from src.resources.mongo_db_resource import MongoDBResource
+
+
+def get_client_factory(uri: str):
+    if uri:
+        return MongoClient
+    import mongomock
+    return mongomock.MongoClient
+
+
+def per_request_client(client_factory, uri: str) -> None:
+    # the old behaviour - a new client (SRV lookup, TLS handshake, new pool) and a ping for each request
+    client = client_factory(uri)
+    client.admin.command('ping')
+    client["business_db"]["businesses"].find_one({"business_country": "Italy"})
+    client.close()
+
+
+def pooled_client(client_pool: MongoClientPool) -> None:
+    db_resource = MongoDBResource(client_pool)
+    db_resource.business_collection.find_one({"business_country": "Italy"})
+
+
+def measure(func, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(title: str, latencies: list[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{title:<28} mean {statistics.mean(latencies):8.3f} ms   p50 {statistics.median(latencies):8.3f} ms"
+          f"   p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="", help="mongodb uri of a local mongod (default: mongomock stand-in)")
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    uri = args.uri or "mongodb://localhost:27017"
+    client_factory = get_client_factory(args.uri)
+
+    client_pool = MongoClientPool(uri, health_check_interval=0, client_factory=client_factory)
+    print(f"{args.requests} requests against {'mongod at ' + args.uri if args.uri else 'mongomock'}")
+    report("new client + ping / request", measure(lambda: per_request_client(client_factory, uri), args.requests))
+    report("shared client pool", measure(lambda: pooled_client(client_pool), args.requests))
+    client_pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""micro-benchmark of the trip prompt build time and size, by the number of the recommended businesses:
+a request of MAX_ITINERARY_ATTEMPTS attempts, with the prompt rebuilt from scratch (the json model rendered again and
+a new request section) on every attempt - the old behaviour - vs the compiled prompt sections.
+
+run from the voyage-backend directory:
+    python -m benchmarks.bench_prompt_builder
+    python -m benchmarks.bench_prompt_builder --businesses 0 10 100 1000 --requests 200
+"""
+import argparse
+import statistics
+import time
+
+from src.processors import prompt_builder
+from src.processors.prompt_builder import PromptBuilder
+from src.services.user_service import MAX_ITINERARY_ATTEMPTS
+
+REQUIRED_KEYS = {"country-code": "IT", "budget": "Moderate", "season": "summer", "participants": "couple",
+                 "duration": "7 days", "interest-points": "food,history,wineries"}
+OPTIONAL_KEYS = {"city": "Rome", "accommodation_type": "hotel"}
+ERRORS = {"the location of Trattoria 3 is not in Italy": "invalid location"}
+
+
+def make_recommendations(count: int) -> list[dict[str, str]]:
+    return [{"business_name": f"Business {number}", "business_type": "restaurant", "business_country": "Italy",
+             "business_description": f"a family restaurant, number {number} of the campaign"}
+            for number in range(count)]
+
+
+def rebuilt_prompts(recommendations: list[dict[str, str]]) -> list[str]:
+    # the old behaviour - the json model and the request section are rendered again for every attempt
+    prompts = []
+    for attempt in range(MAX_ITINERARY_ATTEMPTS):
+        prompt_builder.render_json_model()
+        prompts.append(PromptBuilder()
+                       .with_required_keys(REQUIRED_KEYS)
+                       .with_optional_keys(OPTIONAL_KEYS)
+                       .with_optional_business_recommendations(recommendations)
+                       .with_error_identification(ERRORS if attempt else {})
+                       .build())
+    return prompts
+
+
+def compiled_prompts(recommendations: list[dict[str, str]]) -> list[str]:
+    builder = (PromptBuilder()
+               .with_required_keys(REQUIRED_KEYS)
+               .with_optional_keys(OPTIONAL_KEYS)
+               .with_optional_business_recommendations(recommendations))
+    return [builder.with_error_identification(ERRORS if attempt else {}).build()
+            for attempt in range(MAX_ITINERARY_ATTEMPTS)]
+
+
+def measure(func, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--businesses", type=int, nargs="+", default=[0, 10, 100, 1000])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests of {MAX_ITINERARY_ATTEMPTS} prompts each, time per request")
+    print(f"{'businesses':>10} {'prompt chars':>13} {'~tokens':>8} {'rebuilt (ms)':>13} {'compiled (ms)':>14}"
+          f" {'speedup':>8}")
+    for count in args.businesses:
+        recommendations = make_recommendations(count)
+        prompts = compiled_prompts(recommendations)
+        assert prompts == rebuilt_prompts(recommendations)
+        rebuilt = statistics.median(measure(lambda: rebuilt_prompts(recommendations), args.requests))
+        compiled = statistics.median(measure(lambda: compiled_prompts(recommendations), args.requests))
+        print(f"{count:>10} {len(prompts[-1]):>13} {len(prompts[-1]) // 4:>8} {rebuilt:>13.3f} {compiled:>14.3f}"
+              f" {rebuilt / compiled:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
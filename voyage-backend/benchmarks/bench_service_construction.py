@@ -0,0 +1,77 @@
+"""micro-benchmark of the per-request construction cost of the request services: the old wiring (a new mongo
+resource, a new geocoder with its HTTP session and SSL context, and new builders in every request) vs the
+ServiceContainer of the serving process (the request creates only its own state).
+
+run from the voyage-backend directory:
+    python -m benchmarks.bench_service_construction
+    python -m benchmarks.bench_service_construction --requests 2000
+"""
+import argparse
+import logging
+import statistics
+import time
+
+import mongomock
+
+from src.processors.data_validator import DataValidator, create_geo_locator
+from src.resources.mongo_client_pool import MongoClientPool
+from src.resources.mongo_db_resource import MongoDBResource
+from src.services.business_clients_service import BusinessService
+from src.services.service_container import ServiceContainer
+from src.services.user_service import UserService
+
+TRIP_REQUEST = {"budget": "Moderate", "season": "summer", "participants": "couple", "duration": "7 days",
+                "country-code": "IT", "interest-points": "food,history"}
+
+
+def old_user_service(client_pool: MongoClientPool) -> UserService:
+    service = UserService(dict(TRIP_REQUEST), MongoDBResource(client_pool))
+    # every request created its own geocoder
+    service.data_validator = DataValidator(geo_locator=create_geo_locator())
+    return service
+
+
+def old_business_service(client_pool: MongoClientPool) -> BusinessService:
+    service = BusinessService({}, MongoDBResource(client_pool))
+    service.data_validator = DataValidator(geo_locator=create_geo_locator())
+    return service
+
+
+def measure(func, requests: int) -> list[float]:
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    client_pool = MongoClientPool("mongodb://localhost", health_check_interval=0,
+                                  client_factory=mongomock.MongoClient)
+    services = ServiceContainer(client_pool)
+    # the first request of the process creates the shared components
+    services.create_user_service(dict(TRIP_REQUEST)).data_validator.geo_locator
+
+    print(f"{args.requests} requests, construction time per request")
+    print(f"{'service':>16} {'old p50 (ms)':>13} {'old p95 (ms)':>13} {'container p50 (ms)':>19} "
+          f"{'container p95 (ms)':>19}")
+    for name, old_func, container_func in (
+            ("UserService", lambda: old_user_service(client_pool),
+             lambda: services.create_user_service(dict(TRIP_REQUEST))),
+            ("BusinessService", lambda: old_business_service(client_pool),
+             lambda: services.create_business_service({}))):
+        old = sorted(measure(old_func, args.requests))
+        container = sorted(measure(container_func, args.requests))
+        print(f"{name:>16} {statistics.median(old):>13.3f} {old[int(len(old) * 0.95)]:>13.3f} "
+              f"{statistics.median(container):>19.3f} {container[int(len(container) * 0.95)]:>19.3f}")
+    client_pool.close()
+
+
+if __name__ == '__main__':
+    main()
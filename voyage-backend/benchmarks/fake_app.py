@@ -0,0 +1,39 @@
+"""the backend app wired to the local stand-ins of the load test - the fake generative AI, the stubbed geo services
+(see fake_services.py) and an in-memory mongomock (or a local mongod).
+
+the stand-ins url is taken from the FAKE_SERVICES_URL environment variable, so the same app can be served by any
+server - the load test boots it in-process, or run it on its own:
+    FAKE_SERVICES_URL=http://127.0.0.1:8081 python -m benchmarks.fake_app                      (dev server)
+    FAKE_SERVICES_URL=http://127.0.0.1:8081 gunicorn -c gunicorn.conf.py benchmarks.fake_app:app (production)
+set LOAD_TEST_MONGO_URI to use a local mongod instead of mongomock.
+"""
+import os
+
+from benchmarks.fake_services import get_environment, FakeGenerativeModel
+
+# the environment must be set before the backend modules read their constants
+for key, value in get_environment(os.getenv("FAKE_SERVICES_URL", "http://127.0.0.1:8081")).items():
+    os.environ.setdefault(key, value)
+# every request of the load test should be generated and validated, unless asked otherwise
+os.environ.setdefault("ITINERARY_CACHE_ENABLED", "false")
+
+import main
+from src.resources import generative_ai_resource
+from src.resources.mongo_db_resource import shared_mongo_client_pool
+
+
+def install_fakes() -> None:
+    generative_ai_resource.model = FakeGenerativeModel(os.environ["FAKE_SERVICES_URL"])
+    mongo_uri = os.getenv("LOAD_TEST_MONGO_URI")
+    shared_mongo_client_pool.uri = mongo_uri or "mongodb://localhost:27017"
+    if not mongo_uri:
+        import mongomock
+        shared_mongo_client_pool.client_factory = mongomock.MongoClient
+
+
+install_fakes()
+app = main.app
+
+
+if __name__ == '__main__':
+    main.run_dev_server()
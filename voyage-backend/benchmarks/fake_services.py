@@ -0,0 +1,265 @@
+"""local stand-ins of the third party services of the backend, for the offline load test:
+- a fake generative AI (gemini) endpoint - answers the itinerary and the repair prompts with generated itineraries,
+  with a configurable latency and rates of truncated JSON, markdown fenced JSON (only without the JSON mode) and
+  invalid locations
+- a stub of the places autocomplete endpoint
+- a stub of the nominatim reverse geocoder
+all of them are served by a single local http server, that also counts the calls for the load test report.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, asdict
+from types import SimpleNamespace
+from typing import Any
+
+import requests
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+
+# the supported destinations of the fake generative AI - the center and the alpha-2 code of each country
+COUNTRY_CENTERS = {"Italy": (41.9, 12.5, "it"),
+                   "France": (48.85, 2.35, "fr"),
+                   "Spain": (40.42, -3.7, "es"),
+                   "Greece": (37.98, 23.73, "gr"),
+                   "Japan": (35.68, 139.69, "jp")}
+# the max distance (in degrees) of a generated place from its country center
+COUNTRY_RADIUS_DEGREES = 1.0
+INVALID_PLACE_PREFIX = "Nowhere"
+CONTENT_PARTS = ["morning_activity", "afternoon_activity", "evening_activity"]
+
+
+@dataclass
+class FakeServicesConfig:
+    gemini_latency: float = 1.0
+    gemini_jitter: float = 0.3
+    invalid_json_rate: float = 0.05
+    fenced_json_rate: float = 0.1
+    invalid_location_rate: float = 0.05
+    geo_latency: float = 0.05
+    # the number of distinct places of each country - a smaller pool means more geo cache hits
+    place_pool_size: int = 500
+    seed: int = 7
+
+
+class FakeServices:
+    """the state of the stand-ins - the generated places registry (for the autocomplete stub) and the calls
+    counters"""
+
+    def __init__(self, config: FakeServicesConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.places = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+        self.app = self.create_app()
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = {}
+
+    def sleep(self, latency: float, jitter: float = 0.0) -> None:
+        if latency > 0:
+            time.sleep(max(0.0, self.random.gauss(latency, jitter) if jitter else latency))
+
+    def get_place(self, country_name: str, prefix: str, part: str) -> dict[str, str]:
+        """a place of the country from the pool (or an invalid one, by the invalid location rate)"""
+
+        with self._lock:
+            is_invalid = self.random.random() < self.config.invalid_location_rate
+            place_number = self.random.randrange(self.config.place_pool_size)
+        if is_invalid:
+            return self.make_entry(part, f"{INVALID_PLACE_PREFIX} {place_number}", 0.0, -30.0)
+        center_lat, center_lon, _ = COUNTRY_CENTERS.get(country_name, COUNTRY_CENTERS["Italy"])
+        # the coordinates of a place are derived from its number, so the same place always has the same location
+        place_random = random.Random(f"{country_name}-{place_number}")
+        latitude = center_lat + place_random.uniform(-COUNTRY_RADIUS_DEGREES, COUNTRY_RADIUS_DEGREES)
+        longitude = center_lon + place_random.uniform(-COUNTRY_RADIUS_DEGREES, COUNTRY_RADIUS_DEGREES)
+        name = f"{prefix} {place_number}"
+        self.places[name.lower()] = country_name
+        return self.make_entry(part, name, latitude, longitude)
+
+    @staticmethod
+    def make_entry(part: str, name: str, latitude: float, longitude: float) -> dict[str, str]:
+        prefix = "restaurant" if part == "restaurants_recommendations" else \
+            "accommodation" if part == "accommodation_recommendations" else "content"
+        entry = {f"{prefix}_name": name, f"{prefix}_type": "site",
+                 f"{prefix}_latitude": f"{latitude:.5f}", f"{prefix}_longitude": f"{longitude:.5f}"}
+        if prefix == "content":
+            entry["content_description"] = f"a visit to {name}"
+        return entry
+
+    def generate_itinerary(self, prompt: str) -> dict[str, Any]:
+        country_name = self.get_prompt_country(prompt)
+        days_match = re.search(r"the vacation duration should be: (\d+)", prompt)
+        num_days = int(days_match.group(1)) if days_match else 2
+        business_names = re.findall(r"Business name: (.+?), Business type", prompt)
+        days = []
+        for day in range(1, num_days + 1):
+            day_itinerary = {"day": day}
+            for part in CONTENT_PARTS:
+                day_itinerary[part] = [self.get_place(country_name, "Site", part)]
+            day_itinerary["restaurants_recommendations"] = [
+                self.get_place(country_name, "Trattoria", "restaurants_recommendations")]
+            day_itinerary["accommodation_recommendations"] = [
+                self.get_place(country_name, "Hotel", "accommodation_recommendations")]
+            days.append(day_itinerary)
+        # publish the recommended businesses, like a well behaved model
+        for business_name, day_itinerary in zip(business_names, days):
+            center_lat, center_lon, _ = COUNTRY_CENTERS.get(country_name, COUNTRY_CENTERS["Italy"])
+            self.places[business_name.lower()] = country_name
+            day_itinerary["morning_activity"][0] = self.make_entry("morning_activity", business_name,
+                                                                   center_lat, center_lon)
+        return {"trip_itinerary": days}
+
+    def generate_replacements(self, prompt: str) -> dict[str, Any]:
+        country_name = self.get_prompt_country(prompt)
+        replacements = []
+        for day, part, index in re.findall(r"day: (\d+), part: (\w+), index: (\d+)", prompt):
+            replacements.append({"day": int(day), "part": part, "index": int(index),
+                                 "entry": self.get_place(country_name, "Landmark", part)})
+        return {"replacements": replacements}
+
+    @staticmethod
+    def get_prompt_country(prompt: str) -> str:
+        country_match = (re.search(r"the vacation destination should be: (.+)", prompt)
+                         or re.search(r"trip itinerary to (.+?) for", prompt))
+        return country_match.group(1).strip() if country_match else "Italy"
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        self.count("gemini_calls")
+        self.sleep(self.config.gemini_latency, self.config.gemini_jitter)
+        if "the following entries of the itinerary are not valid" in prompt:
+            self.count("gemini_repair_calls")
+            body = self.generate_replacements(prompt)
+        else:
+            body = self.generate_itinerary(prompt)
+        text = json.dumps(body)
+        with self._lock:
+            is_invalid_json = self.random.random() < self.config.invalid_json_rate
+            # a JSON mode response is never wrapped in markdown code fences
+            is_fenced = not json_mode and self.random.random() < self.config.fenced_json_rate
+        if is_invalid_json:
+            self.count("gemini_invalid_json")
+            # a truncated response, like a response that hit the max output tokens
+            text = text[:len(text) // 2]
+        if is_fenced:
+            self.count("gemini_fenced_json")
+            text = f"```json\n{text}\n```"
+        return text
+
+    def create_app(self) -> Flask:
+        app = Flask("fake_services")
+
+        @app.route("/gemini/generate", methods=["POST"])
+        def generate():
+            body = request.get_json()
+            text = self.generate(body["prompt"], body.get("json_mode", False))
+            return jsonify({"text": text, "total_tokens": len(text) // 4})
+
+        @app.route("/places/autocomplete/json")
+        def autocomplete():
+            self.count("autocomplete_calls")
+            self.sleep(self.config.geo_latency)
+            name = request.args.get("input", "")
+            country_name = self.places.get(name.lower())
+            predictions = [{"description": f"{name}, {country_name}"}] if country_name else []
+            return jsonify({"predictions": predictions, "status": "OK"})
+
+        @app.route("/reverse")
+        def reverse():
+            self.count("nominatim_calls")
+            self.sleep(self.config.geo_latency)
+            latitude, longitude = float(request.args["lat"]), float(request.args["lon"])
+            for country_name, (center_lat, center_lon, country_code) in COUNTRY_CENTERS.items():
+                if (abs(latitude - center_lat) <= COUNTRY_RADIUS_DEGREES * 1.5
+                        and abs(longitude - center_lon) <= COUNTRY_RADIUS_DEGREES * 1.5):
+                    return jsonify({"display_name": country_name, "lat": str(latitude), "lon": str(longitude),
+                                    "address": {"country": country_name, "country_code": country_code}})
+            return jsonify({"error": "Unable to geocode"})
+
+        @app.route("/stats", methods=["GET", "DELETE"])
+        def stats():
+            if request.method == "DELETE":
+                self.reset()
+            return jsonify(self.get_stats())
+
+        return app
+
+
+class FakeServicesServer:
+    """serve the stand-ins on a local port from a background thread"""
+
+    def __init__(self, config: FakeServicesConfig, host: str = "127.0.0.1", port: int = 0):
+        self.services = FakeServices(config)
+        self.server = make_server(host, port, self.services.app, threaded=True)
+        self.url = f"http://{host}:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-services", daemon=True)
+
+    def start(self) -> 'FakeServicesServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+    def get_config(self) -> dict[str, Any]:
+        return asdict(self.services.config)
+
+
+def get_environment(services_url: str) -> dict[str, str]:
+    """the environment variables that point the backend at the stand-ins (and lift the rate limits of the real
+    hosts, that don't apply to them)"""
+
+    return {"FAKE_SERVICES_URL": services_url,
+            "PLACES_AUTOCOMPLETE_URL": f"{services_url}/places/autocomplete/json",
+            "NOMINATIM_DOMAIN": services_url.split("://", 1)[1],
+            "NOMINATIM_SCHEME": "http",
+            "AUTOCOMPLETE_RATE_LIMIT": "0",
+            "NOMINATIM_RATE_LIMIT": "0",
+            "GEMINI_REQUESTS_PER_MINUTE": "60000",
+            # the remote (stubbed) reverse geocoder is measured, not the offline boundaries
+            "COUNTRY_BOUNDARIES_PATH": ""}
+
+
+class FakeGenerativeModel:
+    """drop-in replacement of genai.GenerativeModel that calls the fake generative AI endpoint"""
+
+    def __init__(self, services_url: str):
+        self.generate_url = f"{services_url}/gemini/generate"
+        self.session = requests.Session()
+
+    def generate_content(self, message, generation_config: dict[str, Any] = None,
+                         request_options: dict[str, Any] = None, stream: bool = False, **kwargs):
+        timeout = (request_options or {}).get("timeout")
+        json_mode = (generation_config or {}).get("response_mime_type") == "application/json"
+        response = self.session.post(self.generate_url, json={"prompt": message, "json_mode": json_mode},
+                                     timeout=timeout)
+        response.raise_for_status()
+        res = self.to_response(response.json())
+        if stream:
+            return iter([SimpleNamespace(text=res.text[i:i + 256], candidates=res.candidates,
+                                         usage_metadata=res.usage_metadata)
+                         for i in range(0, len(res.text), 256)])
+        return res
+
+    async def generate_content_async(self, message, generation_config: dict[str, Any] = None,
+                                     request_options: dict[str, Any] = None, **kwargs):
+        return await asyncio.to_thread(self.generate_content, message, generation_config, request_options)
+
+    @staticmethod
+    def to_response(body: dict[str, Any]) -> SimpleNamespace:
+        return SimpleNamespace(text=body["text"],
+                               candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"))],
+                               usage_metadata=SimpleNamespace(total_token_count=body["total_tokens"]))
@@ -0,0 +1,276 @@
+"""offline load test of the backend - drives build_trip and add_business at a configurable concurrency against the
+local stand-ins of the generative AI, mongo and the geo services, and reports the latency percentiles, the
+throughput, the generative AI retries per trip, the external calls per trip and the JSON parse-failure rate.
+
+run from the voyage-backend directory:
+    python -m benchmarks.load_test                                   (boots the app in-process)
+    python -m benchmarks.load_test --trips 200 --concurrency 16 --gemini-latency 2 --output results.json
+    python -m benchmarks.load_test --compare baseline.json           (fails on a p95 / throughput regression)
+    python -m benchmarks.load_test --json-mode                       (the generative AI JSON mode)
+    python -m benchmarks.load_test --speculative                     (the speculative first attempt)
+to load test an app served by another server (e.g. gunicorn), start the stand-ins and point the app at them:
+    python -m benchmarks.load_test --services-port 8081 --url http://127.0.0.1:8080
+    (with the app served by: FAKE_SERVICES_URL=http://127.0.0.1:8081 <server> benchmarks.fake_app:app)
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks.fake_services import FakeServicesConfig, FakeServicesServer, COUNTRY_CENTERS
+
+BUILD_TRIP_PATH = "/api/v1/users_app/build_trip"
+ADD_BUSINESS_PATH = "/api/v1/business_app/add_business"
+METRICS_PATH = "/api/v1/management/metrics"
+# the app metrics of the parse-failure rate, the token spend and the autocomplete connections reuse, by their name
+# prefix
+APP_COUNTERS = {"voyage_gemini_attempts_total": "gemini_attempts",
+                "voyage_gemini_tokens_total": "gemini_tokens",
+                "voyage_speculative_tokens_total{outcome=\"wasted\"}": "speculative_wasted_tokens",
+                "voyage_json_parse_failures_total": "json_parse_failures",
+                "voyage_json_recovered_responses_total": "json_recovered_responses",
+                "voyage_autocomplete_http_new_connections": "autocomplete_new_connections",
+                "voyage_autocomplete_http_reused_connections": "autocomplete_reused_connections"}
+COUNTRY_CODES = {"Italy": "IT", "France": "FR", "Spain": "ES", "Greece": "GR", "Japan": "JP"}
+INTEREST_POINTS = ["food", "history", "nature", "art", "nightlife", "shopping"]
+# the allowed regression (ratio) of the compared results
+MAX_P95_REGRESSION = 1.2
+MIN_THROUGHPUT_RATIO = 0.8
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent))]
+
+
+def make_trip_request(rand: random.Random) -> dict[str, str]:
+    country_name = rand.choice(list(COUNTRY_CODES))
+    return {"budget": rand.choice(["Low", "Moderate", "High"]),
+            "season": rand.choice(["summer", "winter", "spring", "autumn"]),
+            "participants": rand.choice(["couple", "family", "friends", "solo"]),
+            "duration": f"{rand.randint(2, 5)} days",
+            "country-code": COUNTRY_CODES[country_name],
+            "interest-points": ",".join(rand.sample(INTEREST_POINTS, 2))}
+
+
+def make_business_request(rand: random.Random, number: int) -> dict[str, str]:
+    country_name = rand.choice(list(COUNTRY_CODES))
+    center_lat, center_lon, _ = COUNTRY_CENTERS[country_name]
+    return {"business_name": f"Load Test Business {number}", "business_type": "restaurant",
+            "business_phone": "0500000000", "business_email": f"business{number}@example.com",
+            "business_country": country_name, "business_contact_person": "load test",
+            "business_contact_person_phone": "0500000000", "credits_bought": "1000",
+            "business_match_interest_points": ",".join(rand.sample(INTEREST_POINTS, 2)),
+            "business_latitude": f"{center_lat:.5f}", "business_longitude": f"{center_lon:.5f}"}
+
+
+class InProcessApp:
+    """serve the fake app from a background thread of this process"""
+
+    def __init__(self, services_url: str):
+        os.environ["FAKE_SERVICES_URL"] = services_url
+        from benchmarks import fake_app
+        fake_app.main.init_worker()
+        self.server = make_server("127.0.0.1", 0, fake_app.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, name="load-test-app", daemon=True).start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def run_requests(url: str, path: str, bodies: list[dict[str, str]], concurrency: int) -> dict[str, Any]:
+    """post the bodies at the concurrency, and summarise the latencies and the status codes"""
+
+    sessions = threading.local()
+
+    def post(body: dict[str, str]) -> tuple[float, int]:
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        start_time = time.perf_counter()
+        try:
+            status_code = sessions.session.post(f"{url}{path}", data=body, timeout=600).status_code
+        except requests.RequestException:
+            status_code = 0
+        return (time.perf_counter() - start_time) * 1000, status_code
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(post, bodies))
+    duration = time.perf_counter() - start_time
+    latencies = sorted(latency for latency, _ in results)
+    status_codes = {}
+    for _, status_code in results:
+        status_codes[str(status_code)] = status_codes.get(str(status_code), 0) + 1
+    return {"requests": len(bodies), "duration_seconds": duration,
+            "requests_per_second": len(bodies) / duration if duration else 0.0,
+            "p50_ms": percentile(latencies, 0.50), "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99), "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+            "status_codes": status_codes,
+            "errors": sum(count for code, count in status_codes.items() if not code.startswith("2"))}
+
+
+def get_services_stats(services_url: str, reset: bool = False) -> dict[str, int]:
+    response = requests.request("DELETE" if reset else "GET", f"{services_url}/stats", timeout=10)
+    return response.json()
+
+
+def get_per_trip_stats(calls: dict[str, int], trips: int) -> dict[str, float]:
+    gemini_calls = calls.get("gemini_calls", 0)
+    geo_calls = calls.get("autocomplete_calls", 0) + calls.get("nominatim_calls", 0)
+    return {"gemini_calls_per_trip": gemini_calls / trips if trips else 0.0,
+            "retries_per_trip": max(0, gemini_calls - trips) / trips if trips else 0.0,
+            "external_calls_per_trip": (gemini_calls + geo_calls) / trips if trips else 0.0,
+            "geo_calls_per_trip": geo_calls / trips if trips else 0.0}
+
+
+def get_app_counters(url: str) -> dict[str, float]:
+    """the generative AI attempts, the JSON parse and the connections counters of the app, from its metrics endpoint
+    (with gunicorn, the sums of all the workers)"""
+
+    try:
+        response = requests.get(f"{url}{METRICS_PATH}", timeout=10)
+        response.raise_for_status()
+    except requests.RequestException:
+        return {}
+    counters = {}
+    for line in response.text.splitlines():
+        if line.startswith("#") or " " not in line:
+            continue
+        name, value = line.rsplit(" ", 1)
+        for prefix, counter in APP_COUNTERS.items():
+            if name.startswith(prefix):
+                counters[counter] = counters.get(counter, 0.0) + float(value)
+    return counters
+
+
+def get_parse_stats(before: dict[str, float], after: dict[str, float]) -> dict[str, float]:
+    delta = {counter: after.get(counter, 0.0) - before.get(counter, 0.0) for counter in APP_COUNTERS.values()}
+    attempts = delta["gemini_attempts"]
+    return {"gemini_attempts": attempts, "json_parse_failures": delta["json_parse_failures"],
+            "json_recovered_responses": delta["json_recovered_responses"],
+            "parse_failure_rate": delta["json_parse_failures"] / attempts if attempts else 0.0,
+            "autocomplete_new_connections": delta["autocomplete_new_connections"],
+            "autocomplete_reused_connections": delta["autocomplete_reused_connections"],
+            "gemini_tokens": delta["gemini_tokens"], "speculative_wasted_tokens": delta["speculative_wasted_tokens"]}
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """:return: the regressions of the results against the baseline"""
+
+    regressions = []
+    for scenario in ("build_trip", "add_business"):
+        current, previous = results.get(scenario), baseline.get(scenario)
+        if not current or not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * MAX_P95_REGRESSION:
+            regressions.append(f"{scenario}: p95 {current['p95_ms']:.0f} ms vs {previous['p95_ms']:.0f} ms")
+        if current["requests_per_second"] < previous["requests_per_second"] * MIN_THROUGHPUT_RATIO:
+            regressions.append(f"{scenario}: {current['requests_per_second']:.2f} rps vs "
+                               f"{previous['requests_per_second']:.2f} rps")
+    return regressions
+
+
+def report(title: str, summary: dict[str, Any]) -> None:
+    print(f"{title:<14} {summary['requests']:5d} requests  {summary['requests_per_second']:8.2f} rps   "
+          f"p50 {summary['p50_ms']:8.1f} ms   p95 {summary['p95_ms']:8.1f} ms   p99 {summary['p99_ms']:8.1f} ms   "
+          f"errors {summary['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="", help="url of an already served fake app (default: boot in-process)")
+    parser.add_argument("--services-port", type=int, default=0, help="port of the stand-ins (default: any free)")
+    parser.add_argument("--trips", type=int, default=50)
+    parser.add_argument("--businesses", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="mean fake generation latency (seconds)")
+    parser.add_argument("--gemini-jitter", type=float, default=0.3)
+    parser.add_argument("--invalid-json-rate", type=float, default=0.05, help="rate of the truncated responses")
+    parser.add_argument("--fenced-json-rate", type=float, default=0.1,
+                        help="rate of the markdown fenced responses (without the JSON mode)")
+    parser.add_argument("--json-mode", action="store_true",
+                        help="request JSON typed responses (of the in-process app, set GEMINI_JSON_MODE otherwise)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="race concurrent generations on the first attempt (of the in-process app, set "
+                             "GEMINI_SPECULATIVE_ENABLED otherwise)")
+    parser.add_argument("--invalid-location-rate", type=float, default=0.05)
+    parser.add_argument("--geo-latency", type=float, default=0.05, help="autocomplete/nominatim latency (seconds)")
+    parser.add_argument("--place-pool-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="", help="save the results as json")
+    parser.add_argument("--compare", default="", help="a previous results json to compare against")
+    args = parser.parse_args()
+    # the access log of every stand-in call would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    config = FakeServicesConfig(gemini_latency=args.gemini_latency, gemini_jitter=args.gemini_jitter,
+                                invalid_json_rate=args.invalid_json_rate, fenced_json_rate=args.fenced_json_rate,
+                                invalid_location_rate=args.invalid_location_rate, geo_latency=args.geo_latency,
+                                place_pool_size=args.place_pool_size, seed=args.seed)
+    services = FakeServicesServer(config, port=args.services_port).start()
+    if args.json_mode:
+        os.environ["GEMINI_JSON_MODE"] = "true"
+    if args.speculative:
+        os.environ["GEMINI_SPECULATIVE_ENABLED"] = "true"
+    app = None if args.url else InProcessApp(services.url)
+    url = args.url or app.url
+    rand = random.Random(args.seed)
+    print(f"stand-ins at {services.url}, app at {url}")
+
+    results = {"config": {**services.get_config(), "trips": args.trips, "businesses": args.businesses,
+                          "concurrency": args.concurrency, "url": url if args.url else "in-process"}}
+    # the businesses first - so the trips have recommendations to publish
+    get_services_stats(services.url, reset=True)
+    business_bodies = [make_business_request(rand, number) for number in range(args.businesses)]
+    results["add_business"] = run_requests(url, ADD_BUSINESS_PATH, business_bodies, args.concurrency)
+    report("add_business", results["add_business"])
+
+    get_services_stats(services.url, reset=True)
+    trip_bodies = [make_trip_request(rand) for _ in range(args.trips)]
+    counters_before = get_app_counters(url)
+    results["build_trip"] = run_requests(url, BUILD_TRIP_PATH, trip_bodies, args.concurrency)
+    calls = get_services_stats(services.url)
+    results["build_trip"].update({"external_calls": calls, **get_per_trip_stats(calls, args.trips),
+                                  **get_parse_stats(counters_before, get_app_counters(url))})
+    report("build_trip", results["build_trip"])
+    trip_stats = results["build_trip"]
+    print(f"{'':<14} retries/trip {trip_stats['retries_per_trip']:.2f}   "
+          f"external calls/trip {trip_stats['external_calls_per_trip']:.2f}   calls: {calls}")
+    print(f"{'':<14} parse failures {trip_stats['json_parse_failures']:.0f} of {trip_stats['gemini_attempts']:.0f} "
+          f"attempts ({trip_stats['parse_failure_rate']:.1%})   recovered responses "
+          f"{trip_stats['json_recovered_responses']:.0f}")
+    print(f"{'':<14} autocomplete connections: new {trip_stats['autocomplete_new_connections']:.0f}   "
+          f"reused {trip_stats['autocomplete_reused_connections']:.0f}")
+    print(f"{'':<14} gemini tokens/trip {trip_stats['gemini_tokens'] / max(1, args.trips):.0f}   "
+          f"speculative wasted tokens {trip_stats['speculative_wasted_tokens']:.0f}")
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+        print(f"saved the results to {args.output}")
+    if app is not None:
+        app.stop()
+    services.stop()
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
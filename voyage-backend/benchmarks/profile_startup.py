@@ -0,0 +1,92 @@
+"""startup profile of a serving process: the import time of the app (python -X importtime) by package, and the
+duration of each step of its warm-up. every measurement is made in a fresh interpreter, like a new worker that is
+not forked from a preloaded master.
+
+run from the voyage-backend directory:
+    python -m benchmarks.profile_startup
+    python -m benchmarks.profile_startup --top 25 --no-warm-up
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# a line of python -X importtime: "import time: self [us] | cumulative | imported package"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+WARM_UP_SCRIPT = """
+import json, time
+start_time = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start_time
+durations = main.warm_up()
+print(json.dumps({"import_seconds": round(import_seconds, 3), "warm_up_seconds": durations}))
+"""
+
+
+def run_python(args: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+
+
+def profile_imports(module: str) -> tuple[float, dict[str, float], list[tuple[str, float]]]:
+    """import the module in a fresh interpreter with -X importtime.
+    :return: the total import seconds, the self import seconds by top level package, and the cumulative import
+        seconds of the modules imported directly by the module"""
+
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    total_seconds = 0.0
+    packages = defaultdict(float)
+    direct_imports = []
+    # a module is listed after its own imports, so the children of a top level import are the preceding lines
+    children = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        packages[name.split(".")[0]] += int(self_us) / 1e6
+        if len(indent) == 2:
+            children.append((name, int(cumulative_us) / 1e6))
+        elif not indent:
+            if name == module:
+                total_seconds = int(cumulative_us) / 1e6
+                direct_imports = children
+            children = []
+    return total_seconds, dict(packages), direct_imports
+
+
+def profile_warm_up() -> dict:
+    result = run_python(["-c", WARM_UP_SCRIPT])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="the module of the app")
+    parser.add_argument("--top", type=int, default=15, help="the number of packages and imports to show")
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false", help="profile the imports only")
+    args = parser.parse_args()
+
+    total_seconds, packages, direct_imports = profile_imports(args.module)
+    print(f"import {args.module}: {total_seconds * 1000:.1f} ms")
+    print(f"\n{'package':<28} {'self import (ms)':>17}")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28} {seconds * 1000:>17.1f}")
+    print(f"\n{'imported by ' + args.module:<50} {'cumulative (ms)':>16}")
+    for name, seconds in sorted(direct_imports, key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<50} {seconds * 1000:>16.1f}")
+
+    if args.warm_up and args.module == "main":
+        startup = profile_warm_up()
+        print(f"\nimport main (without -X importtime): {startup['import_seconds'] * 1000:.1f} ms")
+        for step, seconds in startup["warm_up_seconds"].items():
+            print(f"warm up {step:<27} {seconds * 1000:>8.1f} ms")
+        print(f"ready to serve after {(startup['import_seconds'] + sum(startup['warm_up_seconds'].values())):.2f} "
+              f"seconds (a worker forked from a preloaded master skips both)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""gunicorn configuration of the production serving mode - pre-fork workers, each one serving with threads:
+    gunicorn -c gunicorn.conf.py wsgi:app
+every setting can be overridden through the environment variables below.
+a graceful reload (new workers, the in-flight requests are completed by the old ones): kill -HUP <master pid>
+
+the settings are read here and not from src.helpers.constants - importing the app modules in the master would
+freeze their constants (and resources) before the app is loaded. the metrics hooks only import
+src.helpers.metrics, which reads no settings.
+"""
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("GUNICORN_WORKERS", str(2 * (os.cpu_count() or 1) + 1)))
+# each worker serves its requests with threads - a request mostly waits for the generative AI and the validators
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# a trip generation (with its retries) can take minutes
+timeout = int(os.getenv("GUNICORN_TIMEOUT_SECONDS", "300"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT_SECONDS", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE_SECONDS", "5"))
+# recycle the workers after this number of requests (0 - never), with a jitter so they don't restart together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+# load and warm up the app once in the master and fork it - a new (or recycled) worker starts with the imported
+# modules and the loaded geo indexes (shared copy-on-write), and only creates its own connections
+preload_app = os.getenv("GUNICORN_PRELOAD_APP", "true").lower() == "true"
+accesslog = "-"
+# the workers write their metrics snapshots into this directory, a scrape (answered by any worker) renders the sum
+# of all the workers. it is exported before the app is loaded, so every worker reads it from its constants
+metrics_multiprocess_dir = os.getenv("METRICS_MULTIPROCESS_DIR")
+if not metrics_multiprocess_dir:
+    metrics_multiprocess_dir = os.environ["METRICS_MULTIPROCESS_DIR"] = tempfile.mkdtemp(prefix="voyage-metrics-")
+
+
+def on_starting(server):
+    """the metrics start from zero - remove the snapshots of a previous run of the server"""
+    from src.helpers.metrics import clear_multiprocess_dir
+    clear_multiprocess_dir(metrics_multiprocess_dir)
+
+
+def when_ready(server):
+    """with preload - warm up the app once in the master (the heavy modules and the geo indexes), before the workers
+    are forked"""
+    if server.cfg.preload_app:
+        import main
+        main.warm_up()
+
+
+def post_worker_init(worker):
+    """per-worker initialisation - the mongo pool, the generative AI client and the geo indexes of the worker"""
+    import main
+    main.init_worker(forked_from_loaded_app=worker.cfg.preload_app)
+
+
+def child_exit(server, worker):
+    """keep the counters of an exited (or recycled) worker in the metrics archive, so the sums don't go back"""
+    from src.helpers.metrics import mark_process_dead
+    mark_process_dead(metrics_multiprocess_dir, worker.pid)
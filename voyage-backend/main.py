@@ -1,12 +1,36 @@
 import sys
 sys.path.append('/app//voyage-backend')
 sys.path.append('/')
-from src.services.user_service import UserService
-from src.services.business_clients_service import BusinessService
+from src.services.business_import_service import BusinessImportService
+from src.services.service_container import ServiceContainer
+from src.resources.mongo_db_resource import shared_mongo_client_pool
+from src.resources.accounting_write_behind_queue import AccountingWriteBehindQueue
+from src.resources.itinerary_cache import ItineraryCache
+from src.resources.trip_job_queue import TripJobQueue
+from src.resources.geo_validation_cache import shared_geo_validation_cache
+from src.resources.country_boundaries import shared_country_boundaries
+from src.resources.country_table import shared_country_table
+from src.resources import generative_ai_resource
+from src.processors.data_validator import DataValidator, autocomplete_http_client, import_geo_libraries
+from src.processors.response_builder import ResponseBuilder
+from src.helpers.metrics import shared_metrics
+from src.helpers.single_flight import SingleFlight
+from src.helpers.constants import (ACCOUNTING_WRITE_BEHIND, ITINERARY_CACHE_ENABLED, GEO_CACHE_PERSISTENT,
+                                   COUNTRY_BOUNDARIES_PATH, COUNTRY_BOUNDARIES_URL, SERVER_PORT, TRIP_JOBS_ENABLED,
+                                   ITINERARY_COALESCING_ENABLED, METRICS_MULTIPROCESS_DIR, METRICS_SNAPSHOT_SECONDS)
+import requests
+import atexit
+import click
+import io
+import json
+import os
+import time
 import traceback
-from flask import Flask, request, Response, jsonify
+from flask import Flask, request, Response, jsonify, stream_with_context
 from flask_cors import CORS
-from src.helpers.error_handling import MissingExpectedKeyInRequestBodyError, CouldNotGetValidResponseFromThirdParty, ConvertAIResponseToJsonError
+from src.helpers.error_handling import (MissingExpectedKeyInRequestBodyError, CouldNotGetValidResponseFromThirdParty,
+                                       ConvertAIResponseToJsonError, MongoConnectionError, CountryNameError,
+                                       InvalidImportFormatError)
 import logging as logger
 
 
@@ -16,13 +40,140 @@ logger.basicConfig(level=logger.INFO)
 app = Flask(__name__)
 CORS(app)
 
+# the app owns the process-wide mongo client pool - it connects on the first request and closed on shutdown
+mongo_client_pool = shared_mongo_client_pool
+atexit.register(mongo_client_pool.close)
+# optional background queue for the billing writes - registered after the pool, so it is flushed before it closes
+accounting_queue = AccountingWriteBehindQueue(mongo_client_pool) if ACCOUNTING_WRITE_BEHIND else None
+if accounting_queue is not None:
+    atexit.register(accounting_queue.close)
+# process-wide cache of validated itineraries
+itinerary_cache = ItineraryCache() if ITINERARY_CACHE_ENABLED else None
+# concurrent identical trip requests of this process share a single generation
+itinerary_single_flight = SingleFlight() if ITINERARY_COALESCING_ENABLED else None
+# process-wide cache of the place-name and coordinates validations, persisted to mongo if enabled
+geo_validation_cache = shared_geo_validation_cache
+if GEO_CACHE_PERSISTENT:
+    geo_validation_cache.use_persistent_store(mongo_client_pool)
+# the shared components of the request services, a request creates only its own state
+services = ServiceContainer(mongo_client_pool, accounting_queue, itinerary_cache, itinerary_single_flight)
+# optional background jobs of the trip generation - the pending jobs are resumed when a serving process starts
+trip_job_queue = TripJobQueue(mongo_client_pool, services.create_user_service) if TRIP_JOBS_ENABLED else None
+if trip_job_queue is not None:
+    atexit.register(trip_job_queue.close)
+atexit.register(autocomplete_http_client.close)
+# the stats of the caches and of the generative AI calls are read by the metrics endpoint
+shared_metrics.register_stats("voyage_geo_validation_cache", "geo validation cache stats",
+                              geo_validation_cache.get_stats)
+shared_metrics.register_stats("voyage_generative_ai", "generative AI calls and tokens stats",
+                              generative_ai_resource.token_accounting.get_stats)
+shared_metrics.register_stats("voyage_autocomplete_http", "place-autocomplete connections and circuit breaker stats",
+                              autocomplete_http_client.get_stats)
+shared_metrics.register_stats("voyage_mongo", "mongo client pool stats",
+                              lambda: {"healthy": int(mongo_client_pool.is_healthy())})
+if itinerary_cache is not None:
+    shared_metrics.register_stats("voyage_itinerary_cache", "itinerary cache stats", itinerary_cache.get_stats)
+if accounting_queue is not None:
+    shared_metrics.register_stats("voyage_accounting_queue", "accounting write-behind queue stats",
+                                  lambda: {"pending": accounting_queue.pending()})
+if itinerary_single_flight is not None:
+    shared_metrics.register_stats("voyage_itinerary_coalescing", "identical in-flight trip requests stats",
+                                  itinerary_single_flight.get_stats)
+if trip_job_queue is not None:
+    shared_metrics.register_stats("voyage_trip_jobs", "background trip jobs stats", trip_job_queue.get_stats)
+
+
+def ensure_db_indexes():
+    """create the DB indexes on startup, the server can still start (and retry on requests) if mongo is down"""
+    try:
+        services.get_db_resource().ensure_indexes()
+    except MongoConnectionError as e:
+        logger.error(f"could not create the DB indexes on startup: {e.error_string}")
+
+
+def init_worker(forked_from_loaded_app: bool = False):
+    """initialise the resources of a serving process before its first request - the mongo pool, the generative AI
+    client and the warmed up modules and geo indexes, the metrics snapshots of the process, and resume the pending
+    trip jobs.
+    :param forked_from_loaded_app: the app was loaded before the fork (gunicorn preload) - the inherited mongo
+        client and the background threads of the parent process can't be used, so they are recreated"""
+
+    if forked_from_loaded_app:
+        mongo_client_pool.reset_after_fork()
+        services.restart_after_fork()
+        if accounting_queue is not None:
+            accounting_queue.restart_after_fork()
+        if trip_job_queue is not None:
+            trip_job_queue.restart_after_fork()
+    if METRICS_MULTIPROCESS_DIR:
+        shared_metrics.enable_multiprocess(METRICS_MULTIPROCESS_DIR, METRICS_SNAPSHOT_SECONDS)
+    warm_up()
+    ensure_db_indexes()
+    try:
+        generative_ai_resource.init_client()
+    except Exception as e:
+        logger.error(f"could not create the generative AI client on startup: {e}")
+    warm_up_geo_cache()
+    resume_trip_jobs()
+
+
+def warm_up_geo_cache():
+    """load the persisted geo validation results into the cache of this serving process (it holds a connection, so
+    it is done after the fork)"""
+    if not GEO_CACHE_PERSISTENT:
+        return
+    try:
+        geo_validation_cache.warm_up_from_store()
+    except Exception as e:
+        logger.error(f"could not warm up the geo validation cache on startup: {e}")
+
+
+def resume_trip_jobs():
+    if trip_job_queue is None:
+        return
+    try:
+        trip_job_queue.resume_pending_jobs()
+    except MongoConnectionError as e:
+        logger.error(f"could not resume the trip jobs on startup: {e.error_string}")
+
+
+def load_geo_indexes():
+    """load the read only geo indexes - when loaded before the fork, they are shared by the workers"""
+    shared_country_table.load()
+    shared_country_boundaries.load()
+    DataValidator.load_offline_reverse_geocoder()
+
+
+def warm_up() -> dict[str, float]:
+    """import the heavy modules (that are not imported by the app modules) and load the read only geo indexes ahead
+    of the first request. a preloaded app is warmed up once before the fork (the workers share the loaded modules),
+    otherwise each worker warms itself up. nothing that holds a connection is created here, and a warmed up step is
+    not repeated.
+    :return: the duration of each step in seconds"""
+
+    durations = {}
+    for step, warm_up_step in [("generative_ai_model", generative_ai_resource.get_model),
+                               ("geo_libraries", import_geo_libraries),
+                               ("geo_indexes", load_geo_indexes)]:
+        start_time = time.perf_counter()
+        warm_up_step()
+        durations[step] = round(time.perf_counter() - start_time, 3)
+    logger.info(f"warmed up the serving process (seconds): {durations}")
+    return durations
+
+
+def run_dev_server():
+    """the flask development server (a single process with the debugger) - for local development only"""
+    init_worker()
+    app.run(host='0.0.0.0', port=SERVER_PORT, debug=True, use_reloader=False, threaded=True)
+
 
 @app.route("/api/v1/business_app/add_business", methods=['POST'])
 def add_business():
     request_body = dict(request.form)
     logger.info(
         f"business_app perform post request for assign new business to the DB's with the requested headers: {str(request_body)}")
-    service = BusinessService(request_body)
+    service = services.create_business_service(request_body)
     try:
         return service.add_new_business()
     except MissingExpectedKeyInRequestBodyError as e:
@@ -32,15 +183,44 @@ def add_business():
         return Response(f"unknown error: {e}", 500)
 
 
+@app.route("/api/v1/business_app/import_businesses", methods=['POST'])
+def import_businesses():
+    """bulk import of businesses - a CSV or an NDJSON body (by the format query argument or the content type),
+    a row per business with the add_business fields. returns a result per row."""
+    try:
+        import_format = BusinessImportService.get_import_format(request.args.get("format") or request.content_type)
+    except InvalidImportFormatError as e:
+        return Response(e.error_string, e.error_status_code)
+    logger.info(f"business_app perform post request for a bulk import of businesses ({import_format})")
+    service = services.create_business_import_service()
+    try:
+        rows = service.read_rows(io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline=""), import_format)
+        return ResponseBuilder.build_business_response(service.import_rows(rows), 200, 'import-report')
+    except MongoConnectionError as e:
+        return Response(e.error_string, e.error_status_code)
+    except CouldNotGetValidResponseFromThirdParty as e:
+        return Response(e.error_string, e.error_status_code)
+    except Exception as e:
+        logger.error(f"got unexpected error:\n{str(e)}\n{str(traceback.format_exc())}\n")
+        return Response(f"unknown error: {e}", 500)
+
+
 @app.route('/api/v1/users_app/build_trip', methods=['POST'])
 def users_handler():
     request_body = dict(request.form)
     logger.info(f"user_app perform get request for building a new trip with the requested headers: {str(request_body)}")
-    service = UserService(request_body)
+    service = services.create_user_service(request_body)
     try:
+        if trip_job_queue is not None and service.is_async_request():
+            # validate the request, and generate the trip in the background
+            job_id, _ = trip_job_queue.submit(request_body, service.get_trip_request_key())
+            job = trip_job_queue.get_job(str(job_id))
+            return {"job_id": str(job_id), "status": job["status"], "status_code": 202}, 202
         return service.build_trip()
     except MissingExpectedKeyInRequestBodyError as e:
         return Response(e.error_string, e.error_status_code)
+    except CountryNameError as e:
+        return Response(e.error_string, e.error_status_code)
     except CouldNotGetValidResponseFromThirdParty as e:
         return Response(e.error_string, e.error_status_code)
     except ConvertAIResponseToJsonError as e:
@@ -50,12 +230,124 @@ def users_handler():
         return Response("unknown error", 500)
 
 
+@app.route('/api/v1/users_app/trip_jobs/<job_id>', methods=['GET'])
+def trip_job_status_handler(job_id):
+    """poll the status of a background trip job - pending, running, done or failed"""
+    if trip_job_queue is None:
+        return Response("trip jobs are disabled", 404)
+    try:
+        job = trip_job_queue.get_job(job_id)
+    except Exception as e:
+        logger.error(f"got unexpected error:\n{str(e)}\n{str(traceback.format_exc())}\n")
+        return Response("unknown error", 500)
+    if job is None:
+        return Response(f"unknown trip job: {job_id}", 404)
+    job_status = {"job_id": job_id, "status": job["status"], "created_at": job["created_at"],
+                  "updated_at": job["updated_at"]}
+    if job["status"] == "done":
+        job_status["trip_id"] = str(job["trip_id"])
+    elif job["status"] == "failed":
+        job_status["error"] = job.get("error")
+    return jsonify(job_status)
+
+
+@app.route('/api/v1/users_app/trip_jobs/<job_id>/result', methods=['GET'])
+def trip_job_result_handler(job_id):
+    """the itinerary of a done background trip job (202 while it is still in progress)"""
+    if trip_job_queue is None:
+        return Response("trip jobs are disabled", 404)
+    try:
+        job = trip_job_queue.get_job(job_id)
+        if job is None:
+            return Response(f"unknown trip job: {job_id}", 404)
+        if job["status"] == "failed":
+            return Response(job.get("error", "unknown error"), job.get("status_code", 500))
+        if job["status"] != "done":
+            return {"job_id": job_id, "status": job["status"], "status_code": 202}, 202
+        json_itinerary = services.get_db_resource().get_generated_trip_from_db(job["trip_id"])
+        return ResponseBuilder.build_business_response(json_itinerary['trip_itinerary'], 200, "trip_itinerary")
+    except Exception as e:
+        logger.error(f"got unexpected error:\n{str(e)}\n{str(traceback.format_exc())}\n")
+        return Response("unknown error", 500)
+
+
+@app.route('/api/v1/users_app/build_trip_stream', methods=['POST'])
+def users_stream_handler():
+    """the streaming variant of build_trip - newline delimited json events, a line for each valid day as soon as it
+    is generated, and a final line with the trip ID"""
+    request_body = dict(request.form)
+    logger.info(f"user_app perform streaming request for building a new trip with the requested headers: "
+                f"{str(request_body)}")
+    service = services.create_user_service(request_body)
+    try:
+        events = service.build_trip_stream()
+    except MissingExpectedKeyInRequestBodyError as e:
+        return Response(e.error_string, e.error_status_code)
+    except CountryNameError as e:
+        return Response(e.error_string, e.error_status_code)
+    except CouldNotGetValidResponseFromThirdParty as e:
+        return Response(e.error_string, e.error_status_code)
+    except ConvertAIResponseToJsonError as e:
+        return Response(e.error_string, e.error_status_code)
+    except Exception as e:
+        logger.error(f"got unexpected error:\n{str(e)}\n{str(traceback.format_exc())}\n")
+        return Response("unknown error", 500)
+
+    def generate_lines():
+        try:
+            for event in events:
+                yield json.dumps(event, default=str) + "\n"
+        except Exception as e:
+            logger.error(f"got unexpected error while streaming:\n{str(e)}\n{str(traceback.format_exc())}\n")
+            yield json.dumps({"event": "error", "error": "unknown error", "status_code": 500}) + "\n"
+
+    return Response(stream_with_context(generate_lines()), mimetype="application/x-ndjson")
+
+
+@app.cli.command("download-country-boundaries")
+def download_country_boundaries():
+    """download the country polygons for the offline point-in-country validation:
+    flask --app main download-country-boundaries"""
+    response = requests.get(COUNTRY_BOUNDARIES_URL, timeout=60)
+    response.raise_for_status()
+    with open(COUNTRY_BOUNDARIES_PATH, "wb") as boundaries_file:
+        boundaries_file.write(response.content)
+    print(f"saved the country boundaries to {COUNTRY_BOUNDARIES_PATH}")
+
+
+@app.cli.command("import-businesses")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "format_name", help="csv or ndjson (by default - by the file extension)")
+@click.option("--report", "report_path", type=click.Path(dir_okay=False), help="save the per-row report as json")
+def import_businesses_command(path, format_name, report_path):
+    """bulk import of the businesses of a CSV or an NDJSON file:
+    flask --app main import-businesses listings.csv --report report.json"""
+    import_format = BusinessImportService.get_import_format(format_name or os.path.splitext(path)[1])
+    service = services.create_business_import_service()
+    with open(path, encoding="utf-8-sig", newline="") as import_file:
+        try:
+            report = service.import_rows(service.read_rows(import_file, import_format))
+        except CouldNotGetValidResponseFromThirdParty as e:
+            raise click.ClickException(e.error_string)
+    if report_path:
+        with open(report_path, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+    print(f"imported {report['inserted']} of {report['rows']} rows ({report['failed']} failed) in "
+          f"{report['elapsed_seconds']} seconds, {report['rows_per_second']} rows/second")
+
+
 @app.route('/api/v1/management/health')
 def get_health():
     logger.debug("management perform get request for health check")
     return jsonify({"status": "ok"})
 
 
+@app.route('/api/v1/management/metrics')
+def get_metrics():
+    logger.debug("management perform get request for metrics")
+    return Response(shared_metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True, use_reloader=False, threaded=True)
+    run_dev_server()
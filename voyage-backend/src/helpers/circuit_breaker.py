@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class CircuitBreaker:
+    """thread-safe circuit breaker of a third party service.
+    after `failure_threshold` consecutive failures the circuit opens and the calls fail fast (without waiting for the
+    timeouts of a provider that is down) for `reset_seconds`, then a single trial call is let through (half open) -
+    its success closes the circuit, and its failure opens it again."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._opened = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow_request(self) -> bool:
+        """:return: True if the call can be made, False if it should fail fast"""
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and
+                                                 self._consecutive_failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                self._opened += 1
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"open": int(self._state != self.CLOSED), "opened": self._opened, "rejected": self._rejected}
@@ -1,11 +1,143 @@
+import os
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
 # users API constants
 NEW_TRIP_EXPECTED_REQUEST_PROPERTIES = ['budget', 'season', 'participants', 'duration', 'country-code',
                                         'interest-points']
 NEW_TRIP_OPTIONAL_REQUEST_PROPERTIES = ['accommodation_type', 'transportation_type', 'city', 'area']
+# request property to skip the itinerary cache lookup ("true" to generate a new itinerary)
+NEW_TRIP_BYPASS_CACHE_PROPERTY = 'bypass-cache'
+# request property to run the trip generation as a background job ("true" to get a job ID immediately)
+NEW_TRIP_ASYNC_PROPERTY = 'async'
 
 # business api constants
 NEW_BUSINESS_EXPECTED_REQUEST_PROPERTIES = ['business_name', 'business_type', 'business_phone', 'business_email',
                                             'business_country', 'business_contact_person',
                                             'business_contact_person_phone', 'credits_bought',
                                             'business_match_interest_points', 'business_latitude', 'business_longitude']
-NEW_BUSINESS_OPTIONAL_REQUEST_PROPERTIES = ['business_description']
+NEW_BUSINESS_OPTIONAL_REQUEST_PROPERTIES = ['business_description', 'business_city', 'business_area',
+                                            'business_accommodation_type']
+# the rows of a bulk business import are validated and inserted in chunks of this size
+BUSINESS_IMPORT_CHUNK_SIZE = int(os.getenv("BUSINESS_IMPORT_CHUNK_SIZE", "500"))
+
+# mongo client pool constants (can be overridden through the environment variables)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+
+# itinerary accounting constants - write the billing updates in the background instead of in the request
+ACCOUNTING_WRITE_BEHIND = os.getenv("ACCOUNTING_WRITE_BEHIND", "false").lower() == "true"
+ACCOUNTING_FLUSH_INTERVAL_SECONDS = float(os.getenv("ACCOUNTING_FLUSH_INTERVAL_SECONDS", "1"))
+ACCOUNTING_MAX_BATCH_SIZE = int(os.getenv("ACCOUNTING_MAX_BATCH_SIZE", "500"))
+
+# itinerary cache constants
+ITINERARY_CACHE_ENABLED = os.getenv("ITINERARY_CACHE_ENABLED", "true").lower() == "true"
+ITINERARY_CACHE_MAX_SIZE = int(os.getenv("ITINERARY_CACHE_MAX_SIZE", "1000"))
+ITINERARY_CACHE_TTL_SECONDS = float(os.getenv("ITINERARY_CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+ITINERARY_CACHE_USE_GENERATED_TRIPS = os.getenv("ITINERARY_CACHE_USE_GENERATED_TRIPS", "true").lower() == "true"
+# concurrent identical trip requests wait on a single generation (the same key as the itinerary cache)
+ITINERARY_COALESCING_ENABLED = os.getenv("ITINERARY_COALESCING_ENABLED", "true").lower() == "true"
+# the max time that a coalesced request waits for the identical in-flight generation
+ITINERARY_COALESCING_WAIT_SECONDS = float(os.getenv("ITINERARY_COALESCING_WAIT_SECONDS", "180"))
+
+# sponsored businesses ranking constants - the top ranked businesses that fit the token budget are offered
+BUSINESS_RANKING_TOP_K = int(os.getenv("BUSINESS_RANKING_TOP_K", "5"))
+# the max (estimated) tokens of the recommended businesses section of the prompt
+BUSINESS_RANKING_TOKEN_BUDGET = int(os.getenv("BUSINESS_RANKING_TOKEN_BUDGET", "400"))
+BUSINESS_RANKING_WEIGHTS = {"interest_points": float(os.getenv("BUSINESS_RANKING_INTEREST_POINTS_WEIGHT", "0.4")),
+                            "location": float(os.getenv("BUSINESS_RANKING_LOCATION_WEIGHT", "0.2")),
+                            "credits": float(os.getenv("BUSINESS_RANKING_CREDITS_WEIGHT", "0.2")),
+                            "fairness": float(os.getenv("BUSINESS_RANKING_FAIRNESS_WEIGHT", "0.2"))}
+# a published business can be matched to a near-miss name in the itinerary (e.g. "Trattoria da Mario"). off by
+# default - a match charges the business credits
+PUBLISHED_BUSINESS_FUZZY_MATCHING = os.getenv("PUBLISHED_BUSINESS_FUZZY_MATCHING", "false").lower() == "true"
+PUBLISHED_BUSINESS_FUZZY_CUTOFF = float(os.getenv("PUBLISHED_BUSINESS_FUZZY_CUTOFF", "0.85"))
+
+# itinerary validation constants
+PLACES_AUTOCOMPLETE_URL = os.getenv("PLACES_AUTOCOMPLETE_URL",
+                                    "https://restaurant-api.wolt.com/v1/google/places/autocomplete/json")
+VALIDATION_MAX_WORKERS = int(os.getenv("VALIDATION_MAX_WORKERS", "32"))
+VALIDATION_MAX_IN_FLIGHT = int(os.getenv("VALIDATION_MAX_IN_FLIGHT", "256"))
+# the kept-alive HTTP session of the place-autocomplete validator (shared by the validation workers)
+AUTOCOMPLETE_POOL_SIZE = int(os.getenv("AUTOCOMPLETE_POOL_SIZE", str(VALIDATION_MAX_WORKERS)))
+AUTOCOMPLETE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("AUTOCOMPLETE_CONNECT_TIMEOUT_SECONDS", "3"))
+AUTOCOMPLETE_READ_TIMEOUT_SECONDS = float(os.getenv("AUTOCOMPLETE_READ_TIMEOUT_SECONDS", "10"))
+AUTOCOMPLETE_MAX_RETRIES = int(os.getenv("AUTOCOMPLETE_MAX_RETRIES", "2"))
+AUTOCOMPLETE_RETRY_BACKOFF_SECONDS = float(os.getenv("AUTOCOMPLETE_RETRY_BACKOFF_SECONDS", "0.2"))
+AUTOCOMPLETE_RETRY_JITTER_SECONDS = float(os.getenv("AUTOCOMPLETE_RETRY_JITTER_SECONDS", "0.2"))
+# the autocomplete calls fail fast for the reset time after this many consecutive failures
+AUTOCOMPLETE_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("AUTOCOMPLETE_CIRCUIT_FAILURE_THRESHOLD", "5"))
+AUTOCOMPLETE_CIRCUIT_RESET_SECONDS = float(os.getenv("AUTOCOMPLETE_CIRCUIT_RESET_SECONDS", "30"))
+# the autocomplete host was always called without verifying its certificate
+AUTOCOMPLETE_VERIFY_TLS = os.getenv("AUTOCOMPLETE_VERIFY_TLS", "false").lower() == "true"
+# the reverse geocoder host (e.g. a self-hosted nominatim, or the stub of the load test)
+NOMINATIM_DOMAIN = os.getenv("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.getenv("NOMINATIM_SCHEME", "https")
+# max requests per second for each of the validation hosts (the public nominatim policy is 1 request per second)
+VALIDATION_HOST_RATE_LIMITS = {urlparse(PLACES_AUTOCOMPLETE_URL).hostname: float(os.getenv("AUTOCOMPLETE_RATE_LIMIT",
+                                                                                           "20")),
+                               NOMINATIM_DOMAIN: float(os.getenv("NOMINATIM_RATE_LIMIT", "1"))}
+
+# geo validation cache constants
+# the persistent tier is shared by the processes and survives a restart, but every miss of the in-process tier costs
+# a mongo round trip on the validation path - opt-in
+GEO_CACHE_PERSISTENT = os.getenv("GEO_CACHE_PERSISTENT", "false").lower() == "true"
+GEO_CACHE_MAX_SIZE = int(os.getenv("GEO_CACHE_MAX_SIZE", "50000"))
+GEO_CACHE_TTL_SECONDS = float(os.getenv("GEO_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+GEO_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("GEO_CACHE_NEGATIVE_TTL_SECONDS", str(24 * 60 * 60)))
+# the coordinates are snapped to a grid of this size (in degrees, 0.01 is about 1 km)
+GEO_CACHE_GRID_DEGREES = float(os.getenv("GEO_CACHE_GRID_DEGREES", "0.01"))
+
+# offline country boundaries constants - a geojson of the country polygons (e.g. natural earth admin 0 countries)
+COUNTRY_BOUNDARIES_PATH = os.getenv("COUNTRY_BOUNDARIES_PATH",
+                                    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                 "configuration", "country_boundaries.geojson"))
+COUNTRY_BOUNDARIES_URL = os.getenv("COUNTRY_BOUNDARIES_URL",
+                                   "https://raw.githubusercontent.com/nvkelso/natural-earth-vector/master/geojson/"
+                                   "ne_50m_admin_0_countries.geojson")
+COUNTRY_BOUNDARIES_GRID_DEGREES = float(os.getenv("COUNTRY_BOUNDARIES_GRID_DEGREES", "5"))
+# points closer than this to a border (in degrees, 0.05 is about 5 km) are checked with the remote reverse geocoder
+COUNTRY_BOUNDARIES_BORDER_MARGIN_DEGREES = float(os.getenv("COUNTRY_BOUNDARIES_BORDER_MARGIN_DEGREES", "0.05"))
+
+# generative AI client constants
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-pro")
+# request JSON typed responses that are constrained to the response schema (supported by the gemini-1.5 models)
+GEMINI_JSON_MODE = os.getenv("GEMINI_JSON_MODE", str(GEMINI_MODEL_NAME.startswith("gemini-1.5"))).lower() == "true"
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+# the concurrency and the rate limits are per serving process (divide the project quota by the gunicorn workers)
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+# hedging fires a second generation when the first one is slower than the p95 latency (it costs extra tokens)
+GEMINI_HEDGING_ENABLED = os.getenv("GEMINI_HEDGING_ENABLED", "false").lower() == "true"
+# the hedging delay until there are enough latency samples for the p95
+GEMINI_HEDGE_DELAY_SECONDS = float(os.getenv("GEMINI_HEDGE_DELAY_SECONDS", "20"))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# speculative generation (opt-in) - the first attempt of a trip launches a few generations concurrently, with
+# different temperatures, and takes the first valid itinerary instead of retrying serially (it costs extra tokens)
+GEMINI_SPECULATIVE_ENABLED = os.getenv("GEMINI_SPECULATIVE_ENABLED", "false").lower() == "true"
+GEMINI_SPECULATIVE_GENERATIONS = int(os.getenv("GEMINI_SPECULATIVE_GENERATIONS", "3"))
+GEMINI_SPECULATIVE_TEMPERATURES = [float(temperature) for temperature in
+                                   os.getenv("GEMINI_SPECULATIVE_TEMPERATURES", "0.4,0.8,1.0").split(",")]
+# the cost cap - the estimated tokens of the concurrent generations of a request (by the average tokens of a call)
+GEMINI_SPECULATIVE_MAX_TOKENS = int(os.getenv("GEMINI_SPECULATIVE_MAX_TOKENS", "24000"))
+
+# serving constants (the production server settings are in gunicorn.conf.py)
+SERVER_PORT = int(os.getenv("PORT", "8080"))
+# the serving processes share their metrics through the snapshots in this directory (set up by gunicorn.conf.py), a
+# scrape renders the sum of all the processes. unset - the metrics of this process only
+METRICS_MULTIPROCESS_DIR = os.getenv("METRICS_MULTIPROCESS_DIR")
+# how often a serving process writes its metrics snapshot (it is also written when the process is scraped and exits)
+METRICS_SNAPSHOT_SECONDS = float(os.getenv("METRICS_SNAPSHOT_SECONDS", "5"))
+
+# background trip jobs constants
+TRIP_JOBS_ENABLED = os.getenv("TRIP_JOBS_ENABLED", "true").lower() == "true"
+TRIP_JOBS_MAX_WORKERS = int(os.getenv("TRIP_JOBS_MAX_WORKERS", "4"))
+# the max number of jobs that wait for a worker in this process, more jobs are rejected with 503
+TRIP_JOBS_MAX_PENDING = int(os.getenv("TRIP_JOBS_MAX_PENDING", "100"))
+# a running job that was not updated for this long belongs to a dead worker and is resumed
+TRIP_JOBS_STALE_SECONDS = float(os.getenv("TRIP_JOBS_STALE_SECONDS", "900"))
+# how often a serving process looks for the stale jobs (0 - only when it starts)
+TRIP_JOBS_SWEEP_SECONDS = float(os.getenv("TRIP_JOBS_SWEEP_SECONDS", "60"))
@@ -34,6 +34,12 @@ class ConvertAIResponseToJsonError(Exception):
         self.error_status_code = error_status_code
 
 
+class InvalidImportFormatError(Exception):
+    def __init__(self, error_string, error_status_code):
+        self.error_string = error_string
+        self.error_status_code = error_status_code
+
+
 class CouldNotGetValidResponseFromThirdParty(Exception):
     def __init__(self, error_string, error_status_code):
         self.error_string = error_string
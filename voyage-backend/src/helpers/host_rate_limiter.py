@@ -0,0 +1,37 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """thread-safe per-host rate limiter - spaces the calls to each host by 1 / (requests per second).
+    hosts without a configured rate are not limited."""
+
+    def __init__(self, requests_per_second_by_host: dict[str, float]):
+        self.min_interval_by_host = {host: 1.0 / rate for host, rate in requests_per_second_by_host.items()
+                                     if rate > 0}
+        self._next_slot_by_host = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        return urlparse(url).hostname or url
+
+    def acquire(self, host: str) -> float:
+        """block until the next call to the host is allowed.
+        :param host: the host name (or a full url)
+        :return: the time (in seconds) that the caller waited"""
+
+        host = self.get_host(host) if "/" in host else host
+        min_interval = self.min_interval_by_host.get(host)
+        if min_interval is None:
+            return 0.0
+        with self._lock:
+            # reserve the next free slot of the host, the waiting itself is done outside the lock
+            now = time.monotonic()
+            slot = max(now, self._next_slot_by_host.get(host, now))
+            self._next_slot_by_host[host] = slot + min_interval
+        wait_time = slot - now
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
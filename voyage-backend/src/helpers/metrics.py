@@ -0,0 +1,418 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable
+
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# the upper bounds (in seconds) of the latency histograms - from a cache hit to a generation with its retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0)
+# the snapshots of the multiprocess mode - a file per serving process, and the counters of the exited processes
+SNAPSHOT_FILE_PATTERN = "metrics_*.json"
+ARCHIVE_FILE_NAME = "archive.json"
+
+
+def format_labels(label_names: tuple[str, ...], label_values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """a monotonic counter, optionally split by labels"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_label_values(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self.get_label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self.get_label_values(labels), 0.0)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(label_values), value] for label_values, value in self._values.items()]
+
+    def with_values(self, values: list) -> "Counter":
+        """a copy of the counter with the values of a snapshot"""
+        counter = Counter(self.name, self.documentation, self.label_names)
+        counter._values = {tuple(label_values): value for label_values, value in values}
+        return counter
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """a histogram of fixed buckets - an observation is a bisect and three additions under a lock, cheap enough for
+    the hot path"""
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # by the label values - [the count of each bucket (not cumulative) and of +Inf, the sum, the count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        bucket_index = bisect_left(self.buckets, value)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            values[0][bucket_index] += 1
+            values[1] += value
+            values[2] += 1
+
+    def get_count(self, **labels) -> int:
+        values = self._values.get(tuple(str(labels.get(name, "")) for name in self.label_names))
+        return values[2] if values else 0
+
+    def get_sum(self, **labels) -> float:
+        values = self._values.get(tuple(str(labels.get(name, "")) for name in self.label_names))
+        return values[1] if values else 0.0
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [[list(key), list(counts), total, count] for key, (counts, total, count) in self._values.items()]
+
+    def with_values(self, values: list) -> "Histogram":
+        """a copy of the histogram with the values of a snapshot"""
+        histogram = Histogram(self.name, self.documentation, self.label_names, self.buckets)
+        histogram._values = {tuple(label_values): [list(counts), total, count]
+                             for label_values, counts, total, count in values if len(counts) == len(self.buckets) + 1}
+        return histogram
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in
+                            self._values.items())
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if upper_bound == float("inf") else format_value(upper_bound)
+                labels = format_labels(self.label_names, label_values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def merge_snapshot_values(merged_values: list, values: list) -> list:
+    """the sum of the values of two snapshots of a metric - [label values, value] for a counter, and [label values,
+    bucket counts, sum, count] for a histogram"""
+    merged = {tuple(entry[0]): entry for entry in merged_values}
+    for entry in values:
+        key = tuple(entry[0])
+        current = merged.get(key)
+        if current is None:
+            merged[key] = entry
+            continue
+        merged[key] = [entry[0]] + [[a + b for a, b in zip(current_value, value)] if isinstance(value, list)
+                                    else current_value + value for current_value, value in zip(current[1:], entry[1:])]
+    return list(merged.values())
+
+
+def read_snapshot(path: str) -> dict:
+    try:
+        with open(path) as snapshot_file:
+            return json.load(snapshot_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.error(f"MetricsRegistry: could not read the metrics snapshot {path}: {e}")
+        return {}
+
+
+def write_snapshot_file(path: str, snapshot: dict) -> None:
+    """write to a temporary file and rename it, so a scrape never reads a partial snapshot"""
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w") as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def get_snapshot_path(directory: str, process_id: Any) -> str:
+    return os.path.join(directory, f"metrics_{process_id}.json")
+
+
+def mark_process_dead(directory: str, process_id: Any) -> None:
+    """add the counters and the histograms of an exited process to the archive of the multiprocess directory (its
+    gauges are dropped), so the sum of the processes doesn't go back when a worker is recycled.
+    called by the gunicorn master - the only writer of the archive"""
+    snapshot_path = get_snapshot_path(directory, process_id)
+    snapshot = read_snapshot(snapshot_path)
+    if snapshot:
+        archive_path = os.path.join(directory, ARCHIVE_FILE_NAME)
+        archive = read_snapshot(archive_path).get("metrics", {})
+        for name, values in snapshot.get("metrics", {}).items():
+            archive[name] = merge_snapshot_values(archive.get(name, []), values)
+        write_snapshot_file(archive_path, {"metrics": archive})
+    if os.path.exists(snapshot_path):
+        os.remove(snapshot_path)
+
+
+def clear_multiprocess_dir(directory: str) -> None:
+    """remove the snapshots of a previous run of the server (the counters start from zero, as after a restart)"""
+    paths = glob.glob(os.path.join(directory, SNAPSHOT_FILE_PATTERN)) + glob.glob(os.path.join(directory, "*.tmp"))
+    for path in paths + [os.path.join(directory, ARCHIVE_FILE_NAME)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class MetricsRegistry:
+    """process-wide registry of the metrics, rendered in the prometheus text format.
+    the stats of the existing components (the caches, the generative AI accounting) are exposed as gauges that are
+    read only when the metrics are scraped.
+    in the multiprocess mode (the gunicorn workers) every process writes a snapshot of its metrics into a shared
+    directory, and a scrape (answered by any of the workers) renders the sum of the counters and the histograms of all
+    the processes, and the gauges of each live process by its pid."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._stats_callbacks = {}
+        self._lock = threading.Lock()
+        self.multiprocess_dir = None
+        self.process_id = None
+        self._snapshots_stopped = None
+
+    def counter(self, name: str, documentation: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, documentation, label_names, buckets))
+
+    def _get_or_create(self, name: str, factory: Callable[[], Any]) -> Any:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+    def register_stats(self, prefix: str, documentation: str, get_stats: Callable[[], dict[str, Any]]) -> None:
+        """expose the numeric values of a stats dict as the gauges <prefix>_<key>"""
+        with self._lock:
+            self._stats_callbacks[prefix] = (documentation, get_stats)
+
+    def get_stat_values(self) -> list[tuple[str, str, float]]:
+        """the name, the documentation and the value of each gauge"""
+        stat_values = []
+        with self._lock:
+            callbacks = sorted(self._stats_callbacks.items())
+        for prefix, (documentation, get_stats) in callbacks:
+            try:
+                stats = get_stats()
+            except Exception as e:
+                logger.error(f"MetricsRegistry: could not collect the stats of {prefix}: {e}")
+                continue
+            for key, value in sorted(stats.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                stat_values.append((f"{prefix}_{key}", documentation, value))
+        return stat_values
+
+    def collect_stats(self) -> list[str]:
+        lines = []
+        for name, documentation, value in self.get_stat_values():
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {format_value(value)}"])
+        return lines
+
+    def enable_multiprocess(self, directory: str, snapshot_seconds: float, process_id: Any = None) -> None:
+        """write the snapshots of this process into the shared directory - when it is scraped, every
+        snapshot_seconds (0 - only when it is scraped) and when it exits. called after the fork, the values that were
+        inherited from the parent process are dropped (every worker would count them again).
+        :param process_id: the process ID of the snapshot (the pid by default)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+        self.multiprocess_dir = directory
+        self.process_id = process_id if process_id is not None else os.getpid()
+        self._snapshots_stopped = threading.Event()
+        self.write_snapshot()
+        if snapshot_seconds:
+            threading.Thread(target=self._write_snapshots_periodically, args=(snapshot_seconds,),
+                             name="metrics-snapshots", daemon=True).start()
+        atexit.register(self.write_snapshot)
+
+    def _write_snapshots_periodically(self, snapshot_seconds: float) -> None:
+        snapshots_stopped = self._snapshots_stopped
+        while not snapshots_stopped.wait(snapshot_seconds):
+            try:
+                self.write_snapshot()
+            except Exception as e:
+                logger.error(f"MetricsRegistry: could not write the metrics snapshot: {e}")
+
+    def disable_multiprocess(self) -> None:
+        if self._snapshots_stopped is not None:
+            self._snapshots_stopped.set()
+        atexit.unregister(self.write_snapshot)
+        self.multiprocess_dir = None
+        self.process_id = None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        return {"metrics": {name: metric.snapshot() for name, metric in metrics.items()},
+                "stats": [list(stat_value) for stat_value in self.get_stat_values()]}
+
+    def write_snapshot(self) -> None:
+        if self.multiprocess_dir is None:
+            return
+        write_snapshot_file(get_snapshot_path(self.multiprocess_dir, self.process_id), self.snapshot())
+
+    def collect_processes(self) -> list[str]:
+        """the metrics of all the processes of the multiprocess directory, this process included"""
+        self.write_snapshot()
+        merged_values = read_snapshot(os.path.join(self.multiprocess_dir, ARCHIVE_FILE_NAME)).get("metrics", {})
+        stats_by_name = {}
+        for path in sorted(glob.glob(os.path.join(self.multiprocess_dir, SNAPSHOT_FILE_PATTERN))):
+            snapshot = read_snapshot(path)
+            for name, values in snapshot.get("metrics", {}).items():
+                merged_values[name] = merge_snapshot_values(merged_values.get(name, []), values)
+            process_id = os.path.basename(path)[len("metrics_"):-len(".json")]
+            for name, documentation, value in snapshot.get("stats", []):
+                stats_by_name.setdefault(name, (documentation, []))[1].append((process_id, value))
+
+        lines = []
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        for metric in metrics:
+            lines.extend(metric.with_values(merged_values.get(metric.name, [])).collect())
+        for name, (documentation, values) in sorted(stats_by_name.items()):
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} gauge"])
+            lines.extend(f"{name}{format_labels(('pid',), (process_id,))} {format_value(value)}"
+                         for process_id, value in sorted(values))
+        return lines
+
+    def render(self) -> str:
+        if self.multiprocess_dir is not None:
+            return "\n".join(self.collect_processes()) + "\n"
+        lines = []
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        for metric in metrics:
+            lines.extend(metric.collect())
+        lines.extend(self.collect_stats())
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer:
+    """the stage timings of a single request - every stage is observed in the stage duration histogram, and the
+    breakdown of the request is logged when it is done"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages = {}
+        self._start_time = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start_time
+            self.stages[stage] = self.stages.get(stage, 0.0) + duration
+            STAGE_DURATION.observe(duration, operation=self.operation, stage=stage)
+
+    def log_summary(self) -> None:
+        total = time.perf_counter() - self._start_time
+        breakdown = ", ".join(f"{stage}: {duration * 1000:.0f} ms" for stage, duration in self.stages.items())
+        logger.info(f"{self.operation} took {total * 1000:.0f} ms ({breakdown})")
+
+
+@contextmanager
+def time_call(histogram: Histogram, **labels):
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start_time, **labels)
+
+
+# the process-wide registry and the metrics of the hot path
+shared_metrics = MetricsRegistry()
+
+STAGE_DURATION = shared_metrics.histogram("voyage_stage_duration_seconds",
+                                          "the duration of each stage of the requests", ("operation", "stage"))
+GEMINI_ATTEMPTS = shared_metrics.counter("voyage_gemini_attempts_total",
+                                         "the itinerary generation attempts", ("mode",))
+GEMINI_REQUEST_DURATION = shared_metrics.histogram("voyage_gemini_request_duration_seconds",
+                                                   "the duration of the generative AI calls", ("outcome",))
+GEMINI_TOKENS = shared_metrics.counter("voyage_gemini_tokens_total", "the tokens of the generative AI calls")
+SPECULATIVE_GENERATIONS = shared_metrics.counter("voyage_speculative_generations_total",
+                                                 "the speculative generations by their outcome - won, lost (invalid "
+                                                 "or failed), discarded (finished after the winner) and cancelled",
+                                                 ("outcome",))
+SPECULATIVE_TOKENS = shared_metrics.counter("voyage_speculative_tokens_total",
+                                            "the tokens of the speculative generations - used by the winner, or "
+                                            "wasted", ("outcome",))
+JSON_PARSE_FAILURES = shared_metrics.counter("voyage_json_parse_failures_total",
+                                             "the generative AI responses that are not a valid JSON")
+JSON_RECOVERED_RESPONSES = shared_metrics.counter("voyage_json_recovered_responses_total",
+                                                  "the generative AI responses that were parsed after a recovery",
+                                                  ("reason",))
+VALIDATION_FAILURES = shared_metrics.counter("voyage_validation_failures_total",
+                                             "the itinerary validation failures by the error type", ("error_type",))
+COALESCED_REQUESTS = shared_metrics.counter("voyage_coalesced_requests_total",
+                                            "the trip requests that waited on an identical in-flight generation",
+                                            ("outcome",))
+GEMINI_CALLS_SAVED = shared_metrics.counter("voyage_gemini_calls_saved_total",
+                                            "the generative AI calls that were saved by the request coalescing")
+EXTERNAL_CALLS = shared_metrics.counter("voyage_external_calls_total",
+                                        "the calls to the third party validation services", ("service", "outcome"))
+EXTERNAL_CALL_DURATION = shared_metrics.histogram("voyage_external_call_duration_seconds",
+                                                  "the duration of the third party validation calls", ("service",))
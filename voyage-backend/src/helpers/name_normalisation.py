@@ -0,0 +1,12 @@
+import re
+import unicodedata
+from typing import Any
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalise_name(name: Any) -> str:
+    """casefold, strip the accents and turn the punctuation and the whitespace runs into a single space"""
+    decomposed = unicodedata.normalize("NFKD", str(name or ""))
+    without_accents = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(NON_WORD_PATTERN.sub(" ", without_accents.casefold()).split())
@@ -0,0 +1,69 @@
+import threading
+from typing import Any, Callable, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """coalesce concurrent calls with the same key - the first caller (the leader) runs the function, and the callers
+    that arrive while it is running wait for it and share its result (or its error).
+    a key is forgotten as soon as its call is done, so a later call runs the function again."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: Hashable, function: Callable[[], Any], timeout: float = None) -> tuple[Any, bool]:
+        """
+        :param key: the key of identical calls
+        :param function: the call, without arguments
+        :param timeout: the max time (in seconds) that a waiter waits for the leader, the leader is not limited
+        :return: the result, and whether it was shared from the call of another caller
+        :raise TimeoutError: the leader didn't finish before the timeout of the waiter
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                is_leader = True
+            else:
+                call.waiters += 1
+                is_leader = False
+        if is_leader:
+            return self._run_leader(key, call, function), False
+        if not call.done.wait(timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"the identical in-flight call did not finish in {timeout} seconds")
+        with self._lock:
+            self.shared += 1
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def _run_leader(self, key: Hashable, call: _Call, function: Callable[[], Any]) -> Any:
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"leaders": self.leaders, "shared": self.shared, "timeouts": self.timeouts,
+                    "in_flight": len(self._calls)}
@@ -12,6 +12,9 @@ class BusinessData(BaseModel):
     business_match_interest_points: list[str]
     business_country: str
     business_description: str = None
+    business_city: str = None
+    business_area: str = None
+    business_accommodation_type: str = None
     appearance_counter: int = 0
     business_longitude: str
     business_latitude: str
@@ -0,0 +1,15 @@
+from typing import Optional
+from pydantic import BaseModel
+from ..models.content import Content
+from ..models.accommodation_recommendation import AccommodationRecommendation
+from ..models.restaurant_recommendation import RestaurantRecommendation
+
+
+class EntryReplacement(BaseModel):
+    day: int
+    part: str
+    index: int
+    # the replacement entry of the part (the other two are null) - a typed response schema can't hold a union
+    content: Optional[Content]
+    restaurant: Optional[RestaurantRecommendation]
+    accommodation: Optional[AccommodationRecommendation]
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+from ..models.entry_replacement import EntryReplacement
+
+
+class ItineraryRepair(BaseModel):
+    replacements: list[EntryReplacement]
@@ -0,0 +1,107 @@
+from typing import Any
+
+from .prompt_builder import PromptBuilder
+from ..helpers.constants import BUSINESS_RANKING_TOP_K, BUSINESS_RANKING_TOKEN_BUDGET, BUSINESS_RANKING_WEIGHTS
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# a rough estimation of the tokens of a prompt text (gemini averages ~4 characters per token)
+CHARS_PER_TOKEN = 4
+
+
+class BusinessRanker:
+    """select the sponsored businesses that are offered in the prompt, out of all the businesses that match the user
+    search. every candidate gets a weighted score of:
+    - interest_points: the share of the requested interest points that the business matches
+    - location: an exact city/area match (a business without the field matches any value, so it gets half)
+    - credits: the credits that the business client has left, relative to the richest candidate
+    - fairness: the businesses that appeared less get a higher score
+    and the top K candidates that fit the token budget are selected."""
+
+    def __init__(self, top_k: int = BUSINESS_RANKING_TOP_K, token_budget: int = BUSINESS_RANKING_TOKEN_BUDGET,
+                 weights: dict[str, float] = None):
+        """
+        :param top_k: the max number of the selected businesses
+        :param token_budget: the max estimated tokens of the selected businesses lines in the prompt
+        :param weights: the weight of each score component (interest_points, location, credits, fairness)
+        """
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.weights = {**BUSINESS_RANKING_WEIGHTS, **(weights or {})}
+
+    @staticmethod
+    def normalise(value: Any) -> str:
+        return " ".join(str(value).split()).casefold()
+
+    @staticmethod
+    def estimate_tokens(business: dict[str, Any]) -> int:
+        return len(PromptBuilder.get_business_line(1, business)) // CHARS_PER_TOKEN + 1
+
+    def get_location_score(self, business: dict[str, Any], user_search: dict[str, Any]) -> float:
+        scores = []
+        for search_key, business_field in (("city", "business_city"), ("area", "business_area")):
+            if not user_search.get(search_key):
+                continue
+            if not business.get(business_field):
+                scores.append(0.5)
+            else:
+                scores.append(float(self.normalise(business[business_field]) ==
+                                    self.normalise(user_search[search_key])))
+        return sum(scores) / len(scores) if scores else 0.0
+
+    def score(self, business: dict[str, Any], user_search: dict[str, Any], max_credits_left: float,
+              max_appearances: float) -> dict[str, float]:
+        """:return: the score components and the total weighted score of the business"""
+
+        interest_points = {self.normalise(point) for point in user_search.get("interest-points", []) if point}
+        business_points = {self.normalise(point) for point in business.get("business_match_interest_points") or []}
+        components = {
+            "interest_points": len(interest_points & business_points) / len(interest_points) if interest_points
+            else 0.0,
+            "location": self.get_location_score(business, user_search),
+            "credits": (business.get("credits_left") or 0) / max_credits_left if max_credits_left > 0 else 0.0,
+            "fairness": 1.0 - (business.get("appearance_counter") or 0) / max_appearances if max_appearances > 0
+            else 1.0,
+        }
+        components["total"] = sum(self.weights.get(name, 0.0) * value for name, value in components.items())
+        return components
+
+    def select(self, candidates: list[dict[str, Any]], user_search: dict[str, Any]) -> list[dict[str, Any]]:
+        """rank the candidates and select the top K that fit the token budget - a candidate that doesn't fit is
+        skipped, so a shorter one can still be selected.
+        :param candidates: the businesses that match the user search (get_match_business_to_user_search)
+        :param user_search: the user search, same format as in get_match_business_to_user_search
+        :return: the selected businesses, the best first"""
+
+        if not candidates:
+            return []
+        max_credits_left = max(business.get("credits_left") or 0 for business in candidates)
+        max_appearances = max(business.get("appearance_counter") or 0 for business in candidates)
+        scored = [(self.score(business, user_search, max_credits_left, max_appearances), business)
+                  for business in candidates]
+        # the ties are broken by the ID, so an identical search gets the same selection (and the same cache key)
+        scored.sort(key=lambda item: (-item[0]["total"], str(item[1].get("_id"))))
+
+        selected = []
+        used_tokens = 0
+        for scores, business in scored:
+            if len(selected) >= self.top_k:
+                break
+            tokens = self.estimate_tokens(business)
+            if used_tokens + tokens > self.token_budget:
+                continue
+            selected.append((scores, business))
+            used_tokens += tokens
+        self.log_selection(selected, len(candidates), used_tokens, user_search)
+        return [business for _, business in selected]
+
+    def log_selection(self, selected: list[tuple[dict[str, float], dict[str, Any]]], candidates_count: int,
+                      used_tokens: int, user_search: dict[str, Any]) -> None:
+        """log the offered businesses and their scores, for the billing audits"""
+        selection = [{"business_id": str(business.get("_id")), "business_client_id":
+                      str(business.get("business_client_id")), "score": round(scores["total"], 3)}
+                     for scores, business in selected]
+        logger.info(f"BusinessRanker: selected {len(selected)} of {candidates_count} businesses "
+                    f"(~{used_tokens} of {self.token_budget} tokens) for the search "
+                    f"{user_search.get('country')}/{user_search.get('interest-points')}: {selection}")
@@ -1,18 +1,67 @@
+import threading
 from enum import Enum
-from typing import Union, Any
+from typing import Union, Any, TYPE_CHECKING
 from ..helpers.error_handling import ThirdPartyDataValidatorError
 from ..helpers.error_handling import CountryNameError
-from geopy.geocoders import Nominatim
-import reverse_geocoder as rg
+from ..helpers.constants import (PLACES_AUTOCOMPLETE_URL, VALIDATION_HOST_RATE_LIMITS, NOMINATIM_DOMAIN,
+                                 NOMINATIM_SCHEME, AUTOCOMPLETE_VERIFY_TLS)
+from ..helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from ..helpers.host_rate_limiter import HostRateLimiter
+from ..helpers.metrics import EXTERNAL_CALLS, EXTERNAL_CALL_DURATION, time_call
+from .validation_engine import ValidationEngine, shared_validation_engine
+from ..resources.geo_validation_cache import GeoValidationCache, shared_geo_validation_cache
+from ..resources.country_boundaries import CountryBoundaryIndex, shared_country_boundaries
+from ..resources.pooled_http_client import PooledHttpClient
+from ..resources.country_table import shared_country_table
 import requests
 import json
-import geopy
 import logging as logger
 
-from pycountry_convert import country_name_to_country_alpha2
+# geopy and reverse_geocoder (with scipy) are imported on their first use - most locations are validated by the
+# autocomplete and the offline country boundaries, and the serving process warms them up before its first request
+if TYPE_CHECKING:
+    from geopy.geocoders import Nominatim
 
 logger.basicConfig(level=logger.INFO)
 
+# the process-wide rate limiter of the third party validation hosts
+host_rate_limiter = HostRateLimiter(VALIDATION_HOST_RATE_LIMITS)
+# the process-wide kept-alive session of the place-autocomplete validator
+autocomplete_http_client = PooledHttpClient("location validator", verify=AUTOCOMPLETE_VERIFY_TLS)
+# the process-wide reverse geocoder (a geocoder creates its own HTTP session and SSL context, so it is created once)
+_shared_geo_locator = None
+_shared_geo_locator_lock = threading.Lock()
+
+
+def create_geo_locator() -> 'Nominatim':
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent="voyage_project", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+
+
+def get_shared_geo_locator() -> 'Nominatim':
+    """return the process-wide geocoder, create it on the first call"""
+    global _shared_geo_locator
+    if _shared_geo_locator is None:
+        with _shared_geo_locator_lock:
+            if _shared_geo_locator is None:
+                _shared_geo_locator = create_geo_locator()
+    return _shared_geo_locator
+
+
+def import_geo_libraries() -> None:
+    """import the geocoder libraries ahead of the first remote validation, without creating a geocoder (it holds the
+    connections of its process)"""
+    import geopy.geocoders  # noqa: F401
+    import geopy.point  # noqa: F401
+
+
+def reset_shared_geo_locator() -> None:
+    """forget the geocoder inherited from the parent process (its pooled connections belong to the parent), the
+    forked worker creates its own on the first use"""
+    global _shared_geo_locator
+    with _shared_geo_locator_lock:
+        _shared_geo_locator = None
+
 
 class validationErrors(Enum):
     TRIP_ITINERARY_MISSING = "invalid json format: missing 'trip_itinerary' as main key in the json"
@@ -36,29 +85,116 @@ class errorsType(Enum):
 
 
 class DataValidator:
-    def __init__(self):
+    ITINERARY_PART_KEYS = ['morning_activity', 'afternoon_activity', 'evening_activity',
+                           'restaurants_recommendations', 'accommodation_recommendations']
+
+    def __init__(self, validation_engine: ValidationEngine = None, geo_cache: GeoValidationCache = None,
+                 country_boundaries: CountryBoundaryIndex = None, geo_locator: 'Nominatim' = None):
+        # the validation state of the current request - the validation components are shared by the process
         self.errors = {}
-        self.geo_locator = Nominatim(user_agent="voyage_project")
+        # the entries (content dicts) that failed the location validation of the last itinerary
+        self.invalid_entries = []
+        self.entry_latencies = []
+        # offline point-in-country results of the current itinerary, by (latitude, longitude)
+        self.offline_coordinates_results = {}
+        self._geo_locator = geo_locator
+        self.validation_engine = validation_engine if validation_engine is not None else shared_validation_engine
+        self.geo_cache = geo_cache if geo_cache is not None else shared_geo_validation_cache
+        self.country_boundaries = country_boundaries if country_boundaries is not None else shared_country_boundaries
+
+    @property
+    def geo_locator(self) -> 'Nominatim':
+        # the shared geocoder is resolved on the first remote validation, most requests are answered offline
+        if self._geo_locator is None:
+            self._geo_locator = get_shared_geo_locator()
+        return self._geo_locator
 
     def verify_long_lat_in_country(self, longitude: str, latitude: str, c_name: str) -> bool:
+        """verify that the coordinates are in the country.
+        the offline country boundaries answer first, the remote reverse geocoder is used only if they can't decide
+        (no boundaries file, or a point near a border) and its result is cached by the coordinates snapped to the
+        cache grid."""
+
+        is_valid = self.offline_coordinates_results.get((str(latitude), str(longitude)))
+        if is_valid is None:
+            is_valid = self.country_boundaries.is_point_in_country(latitude, longitude, self.get_country_code(c_name))
+        if is_valid is not None:
+            return is_valid
+        cache_key = self.geo_cache.get_coordinates_key(latitude, longitude, c_name)
+        is_valid = self.geo_cache.get(cache_key)
+        if is_valid is None:
+            is_valid = self.verify_long_lat_in_country_by_geocoder(longitude, latitude, c_name)
+            self.geo_cache.set(cache_key, is_valid)
+        return is_valid
+
+    def verify_long_lats_in_countries(self, coordinates: list[tuple[Any, Any, str]]) -> list[bool]:
+        """the batch version of verify_long_lat_in_country - the offline country boundaries answer all the points
+        (of any country) with a single query, and only the points that can't be decided offline are verified one by
+        one.
+        :param coordinates: list of (latitude, longitude, country name)
+        :return: list of is valid, in the coordinates order"""
+
+        offline_results = [None] * len(coordinates)
+        if coordinates and self.country_boundaries.is_available():
+            country_codes = {c_name: self.get_country_code(c_name).upper() for _, _, c_name in coordinates}
+            lookups = self.country_boundaries.lookup([(latitude, longitude) for latitude, longitude, _ in coordinates])
+            for index, ((_, _, c_name), (found_code, is_near_border)) in enumerate(zip(coordinates, lookups)):
+                if not is_near_border:
+                    offline_results[index] = found_code is not None and found_code == country_codes[c_name]
+        return [is_valid if is_valid is not None else self.verify_long_lat_in_country(longitude, latitude, c_name)
+                for (latitude, longitude, c_name), is_valid in zip(coordinates, offline_results)]
+
+    @staticmethod
+    def load_offline_reverse_geocoder() -> None:
+        """load the cities index of the offline reverse geocoder (the fallback of nominatim) ahead of the first
+        request - it takes a few seconds"""
+        import reverse_geocoder as rg
+        rg.RGeocoder(mode=2, verbose=False)
+
+    def verify_long_lat_in_country_by_geocoder(self, longitude: str, latitude: str, c_name: str) -> bool:
+        from geopy.point import Point
         c_code = self.get_country_code(c_name)
-        location = geopy.point.Point(float(latitude), float(longitude))
+        location = Point(float(latitude), float(longitude))
         try:
-            res = self.geo_locator.reverse(location)
+            host_rate_limiter.acquire(self.geo_locator.domain)
+            with time_call(EXTERNAL_CALL_DURATION, service="nominatim"):
+                res = self.geo_locator.reverse(location)
+            EXTERNAL_CALLS.inc(service="nominatim", outcome="ok")
         except Exception as e:
+            EXTERNAL_CALLS.inc(service="nominatim", outcome="error")
             logger.error(f"Could not get location from the third party location validator: {str(e)}, returning true "
                          f"to proceed")
+            import reverse_geocoder as rg
             coordinates = (float(latitude), float(longitude))
             results = rg.search(coordinates)
-            if c_code.lower() not in results[0]['cc'].lower():
-                return False
-        if c_code.lower() not in res.raw['address']['country_code'].lower():
+            return c_code.lower() in results[0]['cc'].lower()
+        if res is None or c_code.lower() not in res.raw['address']['country_code'].lower():
             return False
         return True
 
+    def prefetch_offline_coordinates_results(self, entries: list[dict[Any, Any]], requested_country_name: str) -> None:
+        """answer the point-in-country of all the entries coordinates with a single batch query of the offline
+        country boundaries"""
+
+        points = []
+        for content in entries:
+            latitude, longitude = self.get_content_coordinates(content)
+            try:
+                points.append((str(latitude), str(longitude), float(latitude), float(longitude)))
+            except (TypeError, ValueError):
+                continue
+        if not points or not self.country_boundaries.is_available():
+            return
+        results = self.country_boundaries.are_points_in_country([(lat, lon) for _, _, lat, lon in points],
+                                                                self.get_country_code(requested_country_name))
+        for (latitude, longitude, _, _), is_valid in zip(points, results):
+            if is_valid is not None:
+                self.offline_coordinates_results[(latitude, longitude)] = is_valid
+
     def verify_valid_raw_itinerary(self, json_raw_itinerary: Any,
                                    requested_country_name: str,
                                    requested_city_name: str = None) -> bool:
+        self.invalid_entries = []
         # first - validate the expected json header
         if not self.validate_required_data_in_structure('trip_itinerary', json_raw_itinerary.keys(),
                                                         validationErrors.TRIP_ITINERARY_MISSING.value):
@@ -69,20 +205,78 @@ class DataValidator:
             self.errors[validationErrors.TRIP_ITINERARY_NOT_LIST.value] = errorsType.INVALID_FORMAT.value
             return False
 
-        # perform the next validation for each day in the list of trip_itinerary
-        is_valid_data = True
+        # validate that all the expected keys are in each day itinerary - required to perform the next validation
         for day_itinerary in json_raw_itinerary['trip_itinerary']:
-            # validate that all the expected keys are in the day itinerary - required to perform the next validation
             if not self.validate_require_keys_in_day_itinerary(day_itinerary):
                 return False
-            try:
-                # validate the data in the day itinerary
-                if not self.validate_data_in_day_itinerary(day_itinerary, requested_country_name, requested_city_name):
-                    is_valid_data = False
-            except ThirdPartyDataValidatorError as e:
-                raise e
 
-        return is_valid_data
+        # validate the data of all the days at once - all the entries of the itinerary are validated concurrently
+        try:
+            return self.validate_entries_concurrently(self.get_itinerary_entries(json_raw_itinerary['trip_itinerary']),
+                                                      requested_country_name)
+        except ThirdPartyDataValidatorError as e:
+            raise e
+
+    @classmethod
+    def get_itinerary_entries(cls, days: list[dict[str, Any]]) -> list[dict[Any, Any]]:
+        """return all the contents (activities, restaurants and accommodations) of the days, in the days order"""
+        entries = []
+        for day_itinerary in days:
+            for part in cls.ITINERARY_PART_KEYS:
+                entries.extend(day_itinerary.get(part, None) or [])
+        return entries
+
+    def validate_entries_concurrently(self, entries: list[dict[Any, Any]], requested_country_name: str) -> bool:
+        """validate the location of all the entries concurrently,
+        the errors of the invalid entries are added to the errors dict in the entries order,
+        and the invalid entries themselves are added to the invalid entries list.
+        :return: True if all the entries are valid, False otherwise"""
+
+        try:
+            self.prefetch_offline_coordinates_results(entries, requested_country_name)
+        except CountryNameError as e:
+            logger.error(f"DataValidator: could not prefetch the offline coordinates results: {e.error_string}")
+        results = self.validation_engine.validate_entries(
+            entries, lambda content, errors: self.validate_content_entry(content, requested_country_name, errors))
+        flag_res_validation = True
+        for result in results:
+            self.errors.update(result.errors)
+            self.entry_latencies.append((self.get_content_name(result.entry), result.latency_ms))
+            if not result.is_valid:
+                self.invalid_entries.append(result.entry)
+                flag_res_validation = False
+        if results:
+            slowest_name, slowest_latency = max(self.entry_latencies[-len(results):], key=lambda item: item[1])
+            logger.info(f"DataValidator: validated {len(results)} entries, slowest: {slowest_name} "
+                        f"({slowest_latency:.0f} ms)")
+        return flag_res_validation
+
+    def validate_content_entry(self, content: dict[Any, Any], requested_country_name: str,
+                               errors: dict[str, str]) -> bool:
+        """validate a single content by its name, and if it failed by its long-lat.
+        :param errors: the dict to add the content errors to
+        :return: True if the content location is valid, False otherwise"""
+
+        if not self.validate_content_data_by_name(content, requested_country_name, errors):
+            # if it failed, validation through lang-lat will be performed,
+            if not self.validate_content_data_by_long_lat(content, requested_country_name, errors):
+                # if the validation failed, add an error to the error list
+                errors[(f"found invalid location: {content} may not is not in the requested "
+                        f"location")] = errorsType.INVALID_LOCATION.value
+                return False
+        return True
+
+    @staticmethod
+    def get_content_name(content: dict[Any, Any]) -> str:
+        return content.get('content_name') or content.get('restaurant_name') or content.get('accommodation_name')
+
+    @staticmethod
+    def get_content_coordinates(content: dict[Any, Any]) -> tuple[Any, Any]:
+        """return the (latitude, longitude) of the content, None for a missing value"""
+        for prefix in ('content', 'restaurant', 'accommodation'):
+            if f'{prefix}_latitude' in content and f'{prefix}_longitude' in content:
+                return content[f'{prefix}_latitude'], content[f'{prefix}_longitude']
+        return None, None
 
     def validate_required_data_in_structure(self,
                                             data: str,
@@ -127,33 +321,20 @@ class DataValidator:
         :param requested_city_name: The city name to be validated.
         :return: True if the data in the day itinerary is valid, False otherwise."""
 
-        part_keys = ['morning_activity', 'afternoon_activity', 'evening_activity', 'restaurants_recommendations',
-                     'accommodation_recommendations']
-        flag_res_validation = True
-        # for each of the expected parts in the day itinerary, validate the content
-        for part in part_keys:
-            # get the match contents list for the match part if exists.
-            content_lst = day_itinerary.get(part, None)
-            if content_lst is not None:
-                for content in content_lst:
-                    try:
-                        if not self.validate_content_data_by_name(content, requested_country_name):
-                            # if it failed, validation through lang-lat will be performed,
-                            if not self.validate_content_data_by_long_lat(content, requested_country_name):
-                                # if the validation failed, add an error to the error list
-                                self.errors[(f"found invalid location: {content} may not is not in the requested "
-                                             f"location")] = errorsType.INVALID_LOCATION.value
-                                flag_res_validation = False
-                    except ThirdPartyDataValidatorError as e:
-                        raise e
-        return flag_res_validation
+        try:
+            return self.validate_entries_concurrently(self.get_itinerary_entries([day_itinerary]),
+                                                      requested_country_name)
+        except ThirdPartyDataValidatorError as e:
+            raise e
 
-    def validate_content_data_by_name(self, content: dict[Any, Any], requested_country_name: str) -> bool:
+    def validate_content_data_by_name(self, content: dict[Any, Any], requested_country_name: str,
+                                      errors: dict[str, str] = None) -> bool:
+        errors = self.errors if errors is None else errors
         # if the content does not include the name key, add an error to the error list
         if ('content_name' not in content.keys() and 'restaurant_name' not in content.keys() and
                 'accommodation_name' not in content.keys()):
-            self.errors[(f"invalid json format: missing name for the content "
-                         f"(could be content, restaurant or accommodation)")] = errorsType.MISSING_REQUIRED_KEY.value
+            errors[(f"invalid json format: missing name for the content "
+                    f"(could be content, restaurant or accommodation)")] = errorsType.MISSING_REQUIRED_KEY.value
             return False
         try:
             # get the match key - name
@@ -161,18 +342,26 @@ class DataValidator:
                 else 'restaurant_name' if 'restaurant_name' in content.keys() \
                 else 'accommodation_name'
             # validate the location of the content, using the third party location validator by the name of the content
-            return self.validate_content_location(content[key], requested_country_name)
+            # (or the cached result of a previous validation of the same name)
+            cache_key = self.geo_cache.get_name_key(content[key], requested_country_name)
+            is_valid = self.geo_cache.get(cache_key)
+            if is_valid is None:
+                is_valid = self.validate_content_location(content[key], requested_country_name)
+                self.geo_cache.set(cache_key, is_valid)
+            return is_valid
         except ThirdPartyDataValidatorError as e:
             raise e
 
-    def validate_content_data_by_long_lat(self, content: dict[Any, Any], requested_country_name: str) -> bool:
+    def validate_content_data_by_long_lat(self, content: dict[Any, Any], requested_country_name: str,
+                                          errors: dict[str, str] = None) -> bool:
+        errors = self.errors if errors is None else errors
         # first need to verify that the lang-lat exists
         if (('content_latitude' not in content.keys() or 'content_longitude' not in content.keys())
                 and ('restaurant_latitude' not in content.keys() or 'restaurant_longitude' not in content.keys())
                 and (
                         'accommodation_latitude' not in content.keys() or 'accommodation_longitude' not in content.keys())):
-            self.errors[(f"invalid json format: missing name for the content "
-                         f"(could be content, restaurant or accommodation)")] = errorsType.MISSING_REQUIRED_KEY.value
+            errors[(f"invalid json format: missing name for the content "
+                    f"(could be content, restaurant or accommodation)")] = errorsType.MISSING_REQUIRED_KEY.value
             return False
         key_lat = 'content_latitude' if 'content_latitude' in content.keys() \
             else 'restaurant_latitude' if 'restaurant_latitude' in content.keys() \
@@ -195,8 +384,17 @@ class DataValidator:
 
         logger.info(f"Validating content location: {content_name}")
         # perform get request to get the location prediction
-        data = requests.get(
-            f"https://restaurant-api.wolt.com/v1/google/places/autocomplete/json?input={content_name}", verify=False)
+        host_rate_limiter.acquire(PLACES_AUTOCOMPLETE_URL)
+        try:
+            with time_call(EXTERNAL_CALL_DURATION, service="autocomplete"):
+                data = autocomplete_http_client.get(PLACES_AUTOCOMPLETE_URL, params={"input": content_name})
+        except CouldNotGetValidResponseFromThirdParty:
+            EXTERNAL_CALLS.inc(service="autocomplete", outcome="circuit_open")
+            raise
+        except requests.RequestException:
+            EXTERNAL_CALLS.inc(service="autocomplete", outcome="error")
+            raise
+        EXTERNAL_CALLS.inc(service="autocomplete", outcome="ok" if data.status_code == 200 else "error")
         # check if the request status code is 200, if not raise an error
         if data.status_code != 200:
             logger.error(f"Could not get response from third party location validator, status code: {data.status_code}")
@@ -250,10 +448,6 @@ class DataValidator:
         return True
 
     @staticmethod
-    def get_country_code(country_name: str):
-        try:  # try to get the country code from the country name
-            country_code = country_name_to_country_alpha2(country_name)
-        except Exception as e:
-            raise CountryNameError(f"Could not get country name from country code: "
-                                   f"{country_name}", 400)
-        return country_code
+    def get_country_code(country_name: str) -> str:
+        # a lookup in the precomputed country table, raises CountryNameError for an unknown country
+        return shared_country_table.get_country_code(country_name)
@@ -0,0 +1,115 @@
+import json
+import re
+from typing import Any
+
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+ITINERARY_KEY = '"trip_itinerary"'
+# the markdown code fences that wrap a generated json (```json ... ```)
+CODE_FENCE_PATTERN = re.compile(r"^```[\w-]*[ \t]*\n?|\n?```$")
+
+
+def strip_code_fences(text: str) -> str:
+    return CODE_FENCE_PATTERN.sub("", text.strip()).strip()
+
+
+class IncrementalItineraryParser:
+    """incremental parser of a streamed itinerary json.
+    the generated text is fed chunk by chunk, and every day object of the "trip_itinerary" list is returned as
+    soon as its closing brace arrives - without waiting for the rest of the json."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.days = []
+        self._position = 0
+        self._list_start = None
+        self._depth = 0
+        self._day_start = None
+        self._in_string = False
+        self._escaped = False
+        self.finished = False
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        """add a chunk of the generated text.
+        :return: the days that have been completed by this chunk"""
+
+        self.buffer += chunk
+        if self._list_start is None and not self._find_list_start():
+            return []
+        completed_days = []
+        while self._position < len(self.buffer) and not self.finished:
+            char = self.buffer[self._position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._day_start = self._position
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0 and char == ']':
+                    # the end of the trip_itinerary list
+                    self.finished = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and char == '}' and self._day_start is not None:
+                        day = self._parse_day(self.buffer[self._day_start:self._position + 1])
+                        if day is not None:
+                            completed_days.append(day)
+                        self._day_start = None
+            self._position += 1
+        self.days.extend(completed_days)
+        return completed_days
+
+    def _find_list_start(self) -> bool:
+        key_index = self.buffer.find(ITINERARY_KEY)
+        if key_index == -1:
+            return False
+        list_index = self.buffer.find('[', key_index + len(ITINERARY_KEY))
+        if list_index == -1:
+            return False
+        self._list_start = list_index
+        self._position = list_index + 1
+        return True
+
+    @staticmethod
+    def parse_text(text: str) -> tuple[Any, Any]:
+        """tolerant parsing of a whole generated response - the markdown code fences are stripped, and if the json
+        is still not valid (e.g. a response that was truncated by the max output tokens), the complete days of the
+        itinerary are recovered.
+        :return: the parsed json and how it was recovered - None (a valid json), "fenced" or "truncated".
+            the json is None if nothing could be recovered"""
+
+        try:
+            return json.loads(text), None
+        except json.JSONDecodeError:
+            pass
+        stripped_text = strip_code_fences(text)
+        try:
+            return json.loads(stripped_text), "fenced"
+        except json.JSONDecodeError:
+            pass
+        parser = IncrementalItineraryParser()
+        parser.feed(stripped_text)
+        if not parser.days:
+            return None, None
+        logger.info(f"IncrementalItineraryParser: recovered {len(parser.days)} complete days of a truncated "
+                    f"itinerary")
+        return {"trip_itinerary": parser.days}, "truncated"
+
+    @staticmethod
+    def _parse_day(day_text: str) -> Any:
+        try:
+            day = json.loads(day_text)
+        except json.JSONDecodeError:
+            logger.error(f"IncrementalItineraryParser: could not parse a day of the itinerary: {day_text}")
+            return None
+        return day if isinstance(day, dict) else None
@@ -1,29 +1,108 @@
-from pycountry_convert import country_alpha2_to_country_name
-from ..helpers.error_handling import CountryNameError
+import json
+from typing import Any
+
+from ..resources.country_table import shared_country_table
 from ..models.day_itinerary import DayItinerary
 from ..models.content import Content
 from ..models.generated_trip import GeneratedTrip
+from ..models.entry_replacement import EntryReplacement
+from ..models.itinerary_repair import ItineraryRepair
 from ..models.accommodation_recommendation import AccommodationRecommendation
 from ..models.restaurant_recommendation import RestaurantRecommendation
 
 
+def render_json_model() -> str:
+    """render the json model of the GeneratedTrip class, to be used in the prompt generation."""
+
+    content_template = Content(content_name="<content name>",
+                               content_type="<content type>",
+                               content_description="<content_description>",
+                               content_latitude="<content_latitude>",
+                               content_longitude="<content_longitude>")
+    restaurant_template = RestaurantRecommendation(restaurant_name="<restaurant_name>",
+                                                   restaurant_type="<restaurant_type>",
+                                                   restaurant_latitude="<restaurant_latitude>",
+                                                   restaurant_longitude="<restaurant_longitude>")
+    accommodation_template = AccommodationRecommendation(accommodation_name="<accommodation_name>",
+                                                         accommodation_type="<accommodation_type>",
+                                                         accommodation_latitude="<accommodation_latitude>",
+                                                         accommodation_longitude="<accommodation_longitude>")
+    fist_day_itinerary = DayItinerary(day=1,
+                                      morning_activity=[content_template],
+                                      afternoon_activity=[content_template],
+                                      evening_activity=[content_template],
+                                      restaurants_recommendations=[restaurant_template],
+                                      accommodation_recommendations=[accommodation_template])
+    second_day_itinerary = DayItinerary(day=2,
+                                        morning_activity=[content_template],
+                                        afternoon_activity=[content_template],
+                                        evening_activity=[content_template],
+                                        restaurants_recommendations=[restaurant_template],
+                                        accommodation_recommendations=[accommodation_template])
+    trip_itinerary_template = GeneratedTrip(trip_itinerary=[fist_day_itinerary, second_day_itinerary])
+
+    return trip_itinerary_template.model_dump_json()
+
+
+def render_repair_json_model() -> str:
+    """render the json model of the replacements response of a repair prompt."""
+
+    content_template = Content(content_name="<content name>",
+                               content_type="<content type>",
+                               content_description="<content_description>",
+                               content_latitude="<content_latitude>",
+                               content_longitude="<content_longitude>")
+    replacement_template = EntryReplacement(day=1, part="<the part of the replaced entry>", index=0,
+                                            content=content_template, restaurant=None, accommodation=None)
+    return ItineraryRepair(replacements=[replacement_template]).model_dump_json()
+
+
+# the static sections of the prompts - the json models don't depend on the request, so they are rendered once
+TRIP_JSON_MODEL = render_json_model()
+REPAIR_JSON_MODEL = render_repair_json_model()
+TRIP_PROMPT_INSTRUCTIONS = (f'Please provide a response in a structured JSON format that matches the '
+                            f'following model: {TRIP_JSON_MODEL}\n'
+                            f'Please pay attention to include only the specific site name in the '
+                            f'"content_name", field. (e.g. "content_name": "Cinque Terre" instead of '
+                            f'"a day trip to Cinque Terre" that should be a part of the '
+                            f'"content_description" field).\n'
+                            f'very important - each content must have longitudes and latitudes to '
+                            f'validate the correctness of the data and all the requested fields must '
+                            f'be completed.\n')
+
+
 class PromptBuilder:
+    """builds the prompts of a trip request.
+    the request sections (the trip properties and the recommended businesses) are assembled once and reused by
+    every attempt of the request, a retry prompt only adds the errors of the previous attempt."""
+
     def __init__(self):
         self.required_keys = {}
         self.optional_keys = {}
+        self.country_name = None
         self.optional_business_recommendations = {}
         self.error_identification = []
+        self._request_prompt = None
 
     def with_required_keys(self, headers: dict[str, str]) -> 'PromptBuilder':
         self.required_keys = headers
+        self._request_prompt = None
         return self
 
     def with_optional_keys(self, headers: dict[str, str]) -> 'PromptBuilder':
         self.optional_keys = headers
+        self._request_prompt = None
+        return self
+
+    def with_country_name(self, country_name: str) -> 'PromptBuilder':
+        """the country name of the request, resolved once by the request (by default - from the country code)"""
+        self.country_name = country_name
+        self._request_prompt = None
         return self
 
     def with_optional_business_recommendations(self, lines_from_table) -> 'PromptBuilder':
         self.optional_business_recommendations = lines_from_table
+        self._request_prompt = None
         return self
 
     def with_error_identification(self, found_errors: list[str]) -> 'PromptBuilder':
@@ -31,12 +110,9 @@ class PromptBuilder:
         return self
 
     def get_country_code(self) -> str:
-        try:
-            c_name = country_alpha2_to_country_name(self.required_keys.get('country-code'), cn_name_format="default")
-        except Exception as e:
-            raise CountryNameError(f"Could not get country name from country code: "
-                                   f"{self.required_keys.get('country-code')}", 400)
-        return c_name
+        if self.country_name is not None:
+            return self.country_name
+        return shared_country_table.get_country_name(self.required_keys.get('country-code'))
 
     def get_business_activities(self) -> str:
         str_recommendations = ("to the result trip itinerary, please add at least one of the following activities ("
@@ -48,41 +124,61 @@ class PromptBuilder:
     def get_json_model() -> str:
         """This function is used to get the json model of the GeneratedTrip class
         to be used in the prompt generation."""
+        return TRIP_JSON_MODEL
 
-        content_template = Content(content_name="<content name>",
-                                   content_type="<content type>",
-                                   content_description="<content_description>",
-                                   content_latitude="<content_latitude>",
-                                   content_longitude="<content_longitude>")
-        restaurant_template = RestaurantRecommendation(restaurant_name="<restaurant_name>",
-                                                       restaurant_type="<restaurant_type>",
-                                                       restaurant_latitude="<restaurant_latitude>",
-                                                       restaurant_longitude="<restaurant_longitude>")
-        accommodation_template = AccommodationRecommendation(accommodation_name="<accommodation_name>",
-                                                             accommodation_type="<accommodation_type>",
-                                                             accommodation_latitude="<accommodation_latitude>",
-                                                             accommodation_longitude="<accommodation_longitude>")
-        fist_day_itinerary = DayItinerary(day=1,
-                                          morning_activity=[content_template],
-                                          afternoon_activity=[content_template],
-                                          evening_activity=[content_template],
-                                          restaurants_recommendations=[restaurant_template],
-                                          accommodation_recommendations=[accommodation_template])
-        second_day_itinerary = DayItinerary(day=2,
-                                            morning_activity=[content_template],
-                                            afternoon_activity=[content_template],
-                                            evening_activity=[content_template],
-                                            restaurants_recommendations=[restaurant_template],
-                                            accommodation_recommendations=[accommodation_template])
-        trip_itinerary_template = GeneratedTrip(trip_itinerary=[fist_day_itinerary, second_day_itinerary])
-
-        return trip_itinerary_template.model_dump_json()
+    @staticmethod
+    def get_repair_json_model() -> str:
+        """This function is used to get the json model of the replacements response of a repair prompt."""
+        return REPAIR_JSON_MODEL
 
-    def build(self) -> str:
+    def build_repair_prompt(self, invalid_entries: list[dict[str, Any]]) -> str:
+        """build a compact prompt that asks to replace only the invalid entries of an itinerary.
+        :param invalid_entries: the positions of the invalid entries - {"day", "part", "index", "entry"}
+        :return: the repair prompt"""
+
+        c_name = self.get_country_code()
+        prompt_parts = [f"You are a great trip planner. I have a trip itinerary to {c_name} for "
+                        f"{self.required_keys.get('participants')} in the {self.required_keys.get('season')} with "
+                        f"a {self.required_keys.get('budget')} budget, the main interest points are: "
+                        f"{self.required_keys.get('interest-points')}.\n"]
+        if self.optional_keys and self.optional_keys.get('city'):
+            prompt_parts.append(f"the city should be: {self.optional_keys.get('city')}\n")
+        if self.optional_keys and self.optional_keys.get('area'):
+            prompt_parts.append(f"the area should be: {self.optional_keys.get('area')}\n")
+        prompt_parts.append("the following entries of the itinerary are not valid:\n")
+        for entry_number, invalid_entry in enumerate(invalid_entries, start=1):
+            prompt_parts.append(f"{entry_number})    day: {invalid_entry['day']}, part: {invalid_entry['part']}, "
+                                f"index: {invalid_entry['index']}, entry: {json.dumps(invalid_entry['entry'])}\n")
+        if self.error_identification:
+            prompt_parts.append(f"the following errors were found: {self.error_identification}\n")
+        prompt_parts.append(f"Please replace only these entries with real places in {c_name}, each replacement must "
+                            f"have the same fields as the entry it replaces (with the same day, part and index) - "
+                            f"the replacement of an activity is the \"content\", of a restaurant the \"restaurant\" "
+                            f"and of an accommodation the \"accommodation\" (the other two are null), and provide a response in a structured JSON format that matches the following model: "
+                            f"{self.get_repair_json_model()}\n"
+                            f"very important - each entry must have longitudes and latitudes to validate the "
+                            f"correctness of the data and all the requested fields must be completed.\n")
+        return "".join(prompt_parts)
+
+    @staticmethod
+    def get_business_line(business_num: int, business: dict[str, Any]) -> str:
+        """the line of a recommended business in the prompt"""
+        business_line = (f"{business_num})    Business name: {business.get('business_name')}, "
+                         f"Business type: {business.get('business_type')}, "
+                         f"business country: {business.get('business_country')}")
+        if business.get('business_description'):
+            return business_line + f", Business description: {business.get('business_description')}\n"
+        return business_line + "\n"
+
+    def build_request_prompt(self) -> str:
+        """the sections of the prompt that depend only on the request - assembled once for all the attempts"""
+
+        if self._request_prompt is not None:
+            return self._request_prompt
         # get the country name from the country code
         c_name = self.get_country_code()
         # build the basic prompt
-        base_prompt = (
+        prompt_parts = [
             f"You are a great trip planner. I need you to generate a trip itinerary according to the following"
             f" properties.\n"
             f"the vacation duration should be: {self.required_keys.get('duration')}\n"
@@ -90,42 +186,31 @@ class PromptBuilder:
             f"the vacation season should be: {self.required_keys.get('season')}\n"
             f"the vacation budget should be: {self.required_keys.get('budget')}\n"
             f"the vacation participants are be: {self.required_keys.get('participants')}\n"
-            f"the main interest points are: {self.required_keys.get('interest-points')}\n")
+            f"the main interest points are: {self.required_keys.get('interest-points')}\n"]
         # append the optional headers if they exist
         if self.optional_keys:
             if self.optional_keys.get('accommodation_type'):
-                base_prompt += f"the accommodation type should be: {self.optional_keys.get('accommodation_type')}\n"
+                prompt_parts.append(f"the accommodation type should be: "
+                                    f"{self.optional_keys.get('accommodation_type')}\n")
             if self.optional_keys.get('transportation_type'):
-                base_prompt += f"the transportation type should be: {self.optional_keys.get('transportation_type')}\n"
+                prompt_parts.append(f"the transportation type should be: "
+                                    f"{self.optional_keys.get('transportation_type')}\n")
             if self.optional_keys.get('area'):
-                base_prompt += f"the area should be: {self.optional_keys.get('area')}\n"
+                prompt_parts.append(f"the area should be: {self.optional_keys.get('area')}\n")
             if self.optional_keys.get('city'):
-                base_prompt += f"the city should be: {self.optional_keys.get('city')}\n"
+                prompt_parts.append(f"the city should be: {self.optional_keys.get('city')}\n")
         # append match business activities if they exist and match the interest points and the location
         if len(self.optional_business_recommendations) > 0:
-            base_prompt += "the trip itinerary should include the following activities:\n"
-            business_num = 1
-            for business in self.optional_business_recommendations:
-                base_prompt += (f"{business_num})    Business name: {business.get('business_name')}, "
-                                f"Business type: {business.get('business_type')}, "
-                                f"business country: {business.get('business_country')}")
-                if business.get('business_description'):
-                    base_prompt += f", Business description: {business.get('business_description')}\n"
-                else:
-                    base_prompt += "\n"
-                business_num += 1
-        # append the error identification if it exists
+            prompt_parts.append("the trip itinerary should include the following activities:\n")
+            for business_num, business in enumerate(self.optional_business_recommendations, start=1):
+                prompt_parts.append(self.get_business_line(business_num, business))
+        self._request_prompt = "".join(prompt_parts)
+        return self._request_prompt
+
+    def build(self) -> str:
+        # the request sections, the errors of the previous attempt (if any) and the static json model section
         if self.error_identification:
-            base_prompt += f"the following errors were found: {self.error_identification}\n"
-        # append the json model of the GeneratedTrip class
-        response_jason_template = self.get_json_model()
-        optimized_prompt = base_prompt + (f'Please provide a response in a structured JSON format that matches the '
-                                          f'following model: {response_jason_template}\n')
-        optimized_prompt += (f'Please pay attention to include only the specific site name in the '
-                             f'"content_name", field. (e.g. "content_name": "Cinque Terre" instead of '
-                             f'"a day trip to Cinque Terre" that should be a part of the '
-                             f'"content_description" field).\n'
-                             f'very important - each content must have longitudes and latitudes to '
-                             f'validate the correctness of the data and all the requested fields must '
-                             f'be completed.\n')
-        return optimized_prompt
+            return "".join([self.build_request_prompt(),
+                            f"the following errors were found: {self.error_identification}\n",
+                            TRIP_PROMPT_INSTRUCTIONS])
+        return self.build_request_prompt() + TRIP_PROMPT_INSTRUCTIONS
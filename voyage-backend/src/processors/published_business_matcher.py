@@ -0,0 +1,83 @@
+import difflib
+from typing import Any
+
+from .data_validator import DataValidator
+from ..helpers.constants import PUBLISHED_BUSINESS_FUZZY_MATCHING, PUBLISHED_BUSINESS_FUZZY_CUTOFF
+from ..helpers.name_normalisation import normalise_name
+from ..models.generated_trip import GeneratedTrip
+
+# the name field of the entries of each part of the day itinerary
+PART_NAME_FIELDS = {'morning_activity': 'content_name', 'afternoon_activity': 'content_name',
+                    'evening_activity': 'content_name', 'restaurants_recommendations': 'restaurant_name',
+                    'accommodation_recommendations': 'accommodation_name'}
+# the words that a near-miss name may add or drop (the articles and the prepositions of the business names)
+FILLER_WORDS = frozenset({"a", "an", "the", "of", "and", "da", "di", "del", "della", "dei", "il", "la", "lo", "le",
+                          "de", "des", "du", "el", "los", "las"})
+
+
+class PublishedBusinessMatcher:
+    """find the recommended businesses that were published in a generated itinerary.
+    the names of the itinerary entries are normalised once into an index, so every recommendation is an O(1) lookup.
+    a recommendation that is not found as is can be matched to a near-miss name (e.g. "Trattoria Mario" and
+    "Trattoria da Mario") - the names differ only by filler words and are similar enough. a match charges the
+    business, so a name that adds any other word ("Grand Hotel Roma Centrale" for "Hotel Roma") is not matched."""
+
+    def __init__(self, trip_itinerary: GeneratedTrip, fuzzy: bool = PUBLISHED_BUSINESS_FUZZY_MATCHING,
+                 fuzzy_cutoff: float = PUBLISHED_BUSINESS_FUZZY_CUTOFF):
+        """
+        :param trip_itinerary: the itinerary that has been built
+        :param fuzzy: match the near-miss names too
+        :param fuzzy_cutoff: the min similarity ratio (0-1) of a near-miss name
+        """
+        self.fuzzy = fuzzy
+        self.fuzzy_cutoff = fuzzy_cutoff
+        # normalised name -> the positions of the entries with that name, in the itinerary order
+        self.index: dict[str, list[dict[str, Any]]] = {}
+        # the normalised name without the filler words -> the normalised names of the index
+        self.names_by_core_name: dict[str, list[str]] = {}
+        for day_itinerary in trip_itinerary.trip_itinerary:
+            for part in DataValidator.ITINERARY_PART_KEYS:
+                for entry in getattr(day_itinerary, part) or []:
+                    name = normalise_name(getattr(entry, PART_NAME_FIELDS[part], ""))
+                    if name:
+                        if name not in self.index:
+                            self.names_by_core_name.setdefault(self.get_core_name(name), []).append(name)
+                        self.index.setdefault(name, []).append({"day": day_itinerary.day, "slot": part})
+
+    @staticmethod
+    def get_core_name(name: str) -> str:
+        """the normalised name without its filler words"""
+        return " ".join(word for word in name.split() if word not in FILLER_WORDS)
+
+    def is_near_miss(self, name: str, candidate: str) -> bool:
+        """the names have the same words except for the filler words, and they are similar enough"""
+        core_name = self.get_core_name(name)
+        return (bool(core_name) and core_name == self.get_core_name(candidate) and
+                difflib.SequenceMatcher(None, name, candidate).ratio() >= self.fuzzy_cutoff)
+
+    def match(self, business_name: str) -> tuple[Any, list[dict[str, Any]]]:
+        """:return: the matched (normalised) itinerary name and its positions - {"day": int, "slot": str},
+            or (None, []) if the business was not published"""
+
+        name = normalise_name(business_name)
+        if not name:
+            return None, []
+        if name in self.index:
+            return name, self.index[name]
+        if self.fuzzy:
+            for candidate in self.names_by_core_name.get(self.get_core_name(name), []):
+                if self.is_near_miss(name, candidate):
+                    return candidate, self.index[candidate]
+        return None, []
+
+    def match_recommendations(self, recommendations: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """:return: the published recommendations, in the recommendations order -
+            {"business_id": ..., "business_name": str, "matched_name": str, "positions": [{"day": int, "slot": str}]}"""
+
+        matches = []
+        for line in recommendations or []:
+            matched_name, positions = self.match(line.get("business_name"))
+            if matched_name is not None:
+                matches.append({"business_id": line.get("_id"), "business_name": line.get("business_name"),
+                                "matched_name": matched_name, "positions": positions})
+        return matches
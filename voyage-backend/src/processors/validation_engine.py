@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+from ..helpers.constants import VALIDATION_MAX_WORKERS, VALIDATION_MAX_IN_FLIGHT
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+
+class EntryValidationResult:
+    def __init__(self, entry: Any, is_valid: bool, errors: dict[str, str], latency_ms: float):
+        self.entry = entry
+        self.is_valid = is_valid
+        self.errors = errors
+        self.latency_ms = latency_ms
+
+
+class ValidationEngine:
+    """fans out the validation of itinerary entries to a shared thread pool.
+    the pool size bounds the concurrent validations of the whole process, and the semaphore bounds the
+    entries that wait in the pool queue, so a burst of long trips can't queue an unbounded amount of work."""
+
+    def __init__(self, max_workers: int = VALIDATION_MAX_WORKERS, max_in_flight: int = VALIDATION_MAX_IN_FLIGHT):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="entry-validation")
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    @staticmethod
+    def _run_entry(validate_entry: Callable[[Any, dict[str, str]], bool], entry: Any) -> EntryValidationResult:
+        errors = {}
+        start = time.perf_counter()
+        is_valid = validate_entry(entry, errors)
+        return EntryValidationResult(entry, is_valid, errors, (time.perf_counter() - start) * 1000)
+
+    def validate_entries(self, entries: list[Any],
+                         validate_entry: Callable[[Any, dict[str, str]], bool]) -> list[EntryValidationResult]:
+        """validate all the entries concurrently.
+        :param entries: the entries to validate
+        :param validate_entry: the validation function, gets an entry and a dict to add the entry errors to,
+            returns True if the entry is valid
+        :return: the results in the order of the entries.
+        if one of the validations raised an error, the entries that didn't start are cancelled,
+        and the error is raised after the started ones are done."""
+
+        futures = []
+        for entry in entries:
+            self._in_flight.acquire()
+            future = self._executor.submit(self._run_entry, validate_entry, entry)
+            future.add_done_callback(lambda _: self._in_flight.release())
+            futures.append(future)
+
+        wait(futures, return_when="FIRST_EXCEPTION")
+        if any(future.done() and future.exception() is not None for future in futures):
+            for future in futures:
+                future.cancel()
+        wait(futures)
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+        return [future.result() for future in futures]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+# the process-wide validation engine, shared by all the DataValidator instances
+shared_validation_engine = ValidationEngine()
@@ -0,0 +1,83 @@
+import queue
+import threading
+from typing import Any
+
+from .mongo_client_pool import MongoClientPool
+from .mongo_db_resource import MongoDBResource
+from ..helpers.constants import ACCOUNTING_FLUSH_INTERVAL_SECONDS, ACCOUNTING_MAX_BATCH_SIZE
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+
+class AccountingWriteBehindQueue:
+    """background write-behind queue for the itinerary billing writes.
+    the request thread only enqueues the published businesses, and a single worker thread drains the queue and
+    applies the accumulated appearances and credits with MongoDBResource.apply_itinerary_accounting."""
+
+    def __init__(self, client_pool: MongoClientPool,
+                 flush_interval: float = ACCOUNTING_FLUSH_INTERVAL_SECONDS,
+                 max_batch_size: int = ACCOUNTING_MAX_BATCH_SIZE):
+        self.client_pool = client_pool
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._db_resource = None
+        self._worker = threading.Thread(target=self._run, name="accounting-write-behind", daemon=True)
+        self._worker.start()
+
+    def submit(self, published_businesses: list[dict[str, Any]]) -> None:
+        """enqueue the businesses that have been published in a trip, returns immediately"""
+        for business in published_businesses:
+            self._queue.put(business)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _get_db_resource(self) -> MongoDBResource:
+        if self._db_resource is None:
+            self._db_resource = MongoDBResource(self.client_pool)
+        return self._db_resource
+
+    def _take_batch(self) -> list[dict[str, Any]]:
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._take_batch()
+            if batch:
+                self.flush_batch(batch)
+
+    def flush_batch(self, batch: list[dict[str, Any]]) -> None:
+        try:
+            self._get_db_resource().apply_itinerary_accounting(batch)
+        except Exception as e:
+            # the billing writes are not retried to avoid double charging on a partial failure
+            logger.error(f"AccountingWriteBehindQueue: could not apply the accounting of {len(batch)} "
+                         f"appearances: {e}")
+
+    def close(self, timeout: float = None) -> None:
+        """stop the worker loop once all the pending writes have been flushed"""
+        self._stop.set()
+        self._worker.join(timeout=timeout)
+
+    def restart_after_fork(self) -> None:
+        """start a fresh queue and worker thread in a forked process - the threads of the parent process are not
+        copied by the fork"""
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._db_resource = None
+        self._worker = threading.Thread(target=self._run, name="accounting-write-behind", daemon=True)
+        self._worker.start()
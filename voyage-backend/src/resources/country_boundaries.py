@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Optional
+
+import numpy as np
+
+from ..helpers.constants import (COUNTRY_BOUNDARIES_PATH, COUNTRY_BOUNDARIES_GRID_DEGREES,
+                                 COUNTRY_BOUNDARIES_BORDER_MARGIN_DEGREES)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# the feature properties that may hold the alpha-2 country code (natural earth, geo-countries and others)
+COUNTRY_CODE_PROPERTIES = ['ISO_A2_EH', 'ISO_A2', 'iso_a2', 'ISO3166-1-Alpha-2', 'alpha2']
+UNKNOWN_COUNTRY_CODE = '-99'
+
+
+class CountryPolygon:
+    """a single polygon of a country - the exterior ring and the holes, each one as an (n, 2) array of lon-lat"""
+
+    def __init__(self, country_code: str, rings: list[np.ndarray]):
+        self.country_code = country_code
+        self.rings = rings
+        exterior = rings[0]
+        self.min_lon, self.min_lat = exterior.min(axis=0)
+        self.max_lon, self.max_lat = exterior.max(axis=0)
+        # the edges of all the rings as (x1, y1, x2, y2) columns, for the vectorised queries
+        self.edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+
+    def contains(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """even-odd ray casting of all the points against all the edges at once.
+        :return: boolean array - True for the points inside the polygon (and outside its holes)"""
+
+        x1, y1, x2, y2 = (self.edges[:, i][np.newaxis, :] for i in range(4))
+        px = lons[:, np.newaxis]
+        py = lats[:, np.newaxis]
+        crosses_ray = (y1 > py) != (y2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_at_py = (x2 - x1) * (py - y1) / (y2 - y1) + x1
+        return np.count_nonzero(crosses_ray & (px < x_at_py), axis=1) % 2 == 1
+
+    def distance_to_border(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """the distance (in degrees) of each point from the nearest edge of the polygon"""
+
+        x1, y1, x2, y2 = (self.edges[:, i][np.newaxis, :] for i in range(4))
+        px = lons[:, np.newaxis]
+        py = lats[:, np.newaxis]
+        dx = x2 - x1
+        dy = y2 - y1
+        length_squared = dx * dx + dy * dy
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(length_squared > 0, ((px - x1) * dx + (py - y1) * dy) / length_squared, 0), 0, 1)
+        return np.sqrt((x1 + t * dx - px) ** 2 + (y1 + t * dy - py) ** 2).min(axis=1)
+
+
+class CountryBoundaryIndex:
+    """offline point-in-country engine.
+    the country polygons are loaded once into a grid index of their bounding boxes, and the points are answered
+    with a vectorised point-in-polygon test against the candidate polygons of their grid cell.
+    a point that is closer than the border margin to a border is reported as near the border, so the caller can
+    fall back to a remote reverse geocoder."""
+
+    def __init__(self, path: str = COUNTRY_BOUNDARIES_PATH,
+                 grid_degrees: float = COUNTRY_BOUNDARIES_GRID_DEGREES,
+                 border_margin_degrees: float = COUNTRY_BOUNDARIES_BORDER_MARGIN_DEGREES):
+        self.path = path
+        self.grid_degrees = grid_degrees
+        self.border_margin_degrees = border_margin_degrees
+        self.polygons = []
+        self.grid = defaultdict(list)
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        """load the boundaries on the first call, return False if there are no boundaries to use"""
+        if not self._loaded:
+            self.load()
+        return len(self.polygons) > 0
+
+    def load(self) -> 'CountryBoundaryIndex':
+        with self._lock:
+            if self._loaded:
+                return self
+            if not self.path or not os.path.exists(self.path):
+                logger.info(f"CountryBoundaryIndex: no country boundaries file at {self.path}, "
+                            f"the remote reverse geocoder will be used")
+            else:
+                with open(self.path, encoding="utf-8") as boundaries_file:
+                    self.load_geojson(json.load(boundaries_file))
+                logger.info(f"CountryBoundaryIndex: loaded {len(self.polygons)} polygons from {self.path}")
+            self._loaded = True
+        return self
+
+    def load_geojson(self, geojson: dict[str, Any]) -> None:
+        for feature in geojson.get("features", []):
+            country_code = self.get_feature_country_code(feature.get("properties") or {})
+            geometry = feature.get("geometry") or {}
+            if country_code is None or geometry.get("type") not in ("Polygon", "MultiPolygon"):
+                continue
+            polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype=float)[:, :2] for ring in polygon if len(ring) >= 4]
+                if rings:
+                    self.add_polygon(CountryPolygon(country_code, rings))
+
+    @staticmethod
+    def get_feature_country_code(properties: dict[str, Any]) -> Optional[str]:
+        for key in COUNTRY_CODE_PROPERTIES:
+            code = properties.get(key)
+            if code and code != UNKNOWN_COUNTRY_CODE:
+                return code.upper()
+        return None
+
+    def get_cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.grid_degrees), math.floor(lon / self.grid_degrees)
+
+    def add_polygon(self, polygon: CountryPolygon) -> None:
+        polygon_index = len(self.polygons)
+        self.polygons.append(polygon)
+        min_lat_cell, min_lon_cell = self.get_cell(polygon.min_lat, polygon.min_lon)
+        max_lat_cell, max_lon_cell = self.get_cell(polygon.max_lat, polygon.max_lon)
+        for lat_cell in range(min_lat_cell, max_lat_cell + 1):
+            for lon_cell in range(min_lon_cell, max_lon_cell + 1):
+                self.grid[(lat_cell, lon_cell)].append(polygon_index)
+
+    def lookup(self, points: list[tuple[float, float]]) -> list[tuple[Optional[str], bool]]:
+        """find the country of each point.
+        :param points: list of (latitude, longitude)
+        :return: list of (alpha-2 country code or None, is near a border), in the points order"""
+
+        results = [(None, False)] * len(points)
+        if not points or not self.is_available():
+            return results
+        lats = np.asarray([float(point[0]) for point in points])
+        lons = np.asarray([float(point[1]) for point in points])
+
+        # group the points by the candidate polygons of their grid cell
+        points_by_polygon = defaultdict(list)
+        for point_index, (lat, lon) in enumerate(zip(lats, lons)):
+            for polygon_index in self.grid.get(self.get_cell(lat, lon), []):
+                polygon = self.polygons[polygon_index]
+                if polygon.min_lat <= lat <= polygon.max_lat and polygon.min_lon <= lon <= polygon.max_lon:
+                    points_by_polygon[polygon_index].append(point_index)
+
+        near_border = np.zeros(len(points), dtype=bool)
+        for polygon_index, point_indexes in points_by_polygon.items():
+            polygon = self.polygons[polygon_index]
+            point_indexes = np.asarray(point_indexes)
+            inside = polygon.contains(lons[point_indexes], lats[point_indexes])
+            near = polygon.distance_to_border(lons[point_indexes], lats[point_indexes]) < self.border_margin_degrees
+            near_border[point_indexes[near]] = True
+            for point_index in point_indexes[inside]:
+                results[point_index] = (polygon.country_code, False)
+        return [(country_code, bool(near_border[index])) for index, (country_code, _) in enumerate(results)]
+
+    def is_point_in_country(self, lat: Any, lon: Any, country_code: str) -> Optional[bool]:
+        """:return: True/False if the point is (not) in the country, None if it can't be decided offline
+        (there are no boundaries, or the point is near a border)"""
+        return self.are_points_in_country([(lat, lon)], country_code)[0]
+
+    def are_points_in_country(self, points: list[tuple[Any, Any]], country_code: str) -> list[Optional[bool]]:
+        """the batch version of is_point_in_country, for all the points of an itinerary at once"""
+
+        if not self.is_available():
+            return [None] * len(points)
+        results = []
+        for found_code, is_near_border in self.lookup(points):
+            if is_near_border:
+                results.append(None)
+            else:
+                results.append(found_code is not None and found_code == country_code.upper())
+        return results
+
+
+# the process-wide boundaries index, loaded once on startup (or on the first lookup)
+shared_country_boundaries = CountryBoundaryIndex()
@@ -0,0 +1,94 @@
+import threading
+from typing import Any, NamedTuple
+
+from ..helpers.error_handling import CountryNameError
+from ..helpers.name_normalisation import normalise_name
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# the common country names that are not in the ISO and wikipedia names of pycountry_convert (by their normalised name)
+COUNTRY_NAME_ALIASES = {"uk": "GB", "england": "GB", "scotland": "GB", "wales": "GB", "northern ireland": "GB",
+                        "holland": "NL", "burma": "MM", "vatican": "VA", "dr congo": "CD", "drc": "CD", "uae": "AE",
+                        "the uae": "AE"}
+
+
+class Country(NamedTuple):
+    """the country of a request - its ISO 3166-1 alpha-2 code and its name"""
+    code: str
+    name: str
+
+
+class CountryTable:
+    """precomputed bidirectional country table - the country name of each alpha-2 code, and the alpha-2 code of each
+    normalised country name (the ISO, the official, the common and the wikipedia names, the aliases and the alpha-2
+    and alpha-3 codes). it is built once, and a lookup is a dict access (without the per call formatting and
+    validation of pycountry_convert)."""
+
+    def __init__(self, aliases: dict[str, str] = None):
+        self.aliases = aliases if aliases is not None else COUNTRY_NAME_ALIASES
+        self.names_by_code = {}
+        # the exact names and codes (the names of the table itself are looked up without normalising them)
+        self.codes_by_exact_name = {}
+        self.codes_by_name = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> 'CountryTable':
+        with self._lock:
+            if self._loaded:
+                return self
+            from pycountry_convert.country_mappings import (map_country_alpha2_to_country_name,
+                                                            map_country_name_to_country_alpha2,
+                                                            map_country_alpha3_to_country_alpha2)
+            self.names_by_code = dict(map_country_alpha2_to_country_name())
+            codes_by_name = {normalise_name(code): code for code in self.names_by_code}
+            codes_by_name.update({normalise_name(alpha3): alpha2
+                                  for alpha3, alpha2 in map_country_alpha3_to_country_alpha2().items()})
+            codes_by_name.update({normalise_name(name): code
+                                  for name, code in map_country_name_to_country_alpha2().items()})
+            codes_by_name.update({normalise_name(name): code for name, code in self.aliases.items()})
+            self.codes_by_name = codes_by_name
+            self.codes_by_exact_name = {**map_country_name_to_country_alpha2(),
+                                        **{name: code for code, name in self.names_by_code.items()},
+                                        **{code: code for code in self.names_by_code}}
+            self._loaded = True
+            logger.info(f"CountryTable: loaded {len(self.names_by_code)} countries and {len(self.codes_by_name)} "
+                        f"names")
+        return self
+
+    def get_country_name(self, country_code: Any) -> str:
+        """:return: the country name of an alpha-2 country code (in any case)
+        raises CountryNameError (400) for an unknown code"""
+        if not self._loaded:
+            self.load()
+        country_name = self.names_by_code.get(str(country_code or "").strip().upper())
+        if country_name is None:
+            raise CountryNameError(f"Could not get country name from country code: {country_code}", 400)
+        return country_name
+
+    def get_country_code(self, country_name: Any) -> str:
+        """:return: the alpha-2 country code of a country name, an alias or a country code - normalised, so the case,
+        the accents and the punctuation don't matter ("cote d'ivoire", "Côte d’Ivoire")
+        raises CountryNameError (400) for an unknown country"""
+        if not self._loaded:
+            self.load()
+        country_code = self.codes_by_exact_name.get(country_name)
+        if country_code is not None:
+            return country_code
+        normalised_name = normalise_name(country_name)
+        country_code = self.codes_by_name.get(normalised_name)
+        if country_code is None and normalised_name.startswith("the "):
+            country_code = self.codes_by_name.get(normalised_name[len("the "):])
+        if country_code is None:
+            raise CountryNameError(f"Could not get country code from country name: {country_name}", 400)
+        return country_code
+
+    def resolve_country_code(self, country_code: Any) -> Country:
+        """resolve the country code of a request once - the code and the name that are used by the whole request"""
+        country_name = self.get_country_name(country_code)
+        return Country(str(country_code).strip().upper(), country_name)
+
+
+# the process-wide country table, built once on startup (or on the first lookup)
+shared_country_table = CountryTable()
@@ -1,22 +1,422 @@
-import google.generativeai as genai
+import asyncio
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Iterator
 from dotenv import load_dotenv
 
+from ..helpers.token_bucket import TokenBucket
+from ..helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from ..helpers.metrics import GEMINI_REQUEST_DURATION, GEMINI_TOKENS, SPECULATIVE_GENERATIONS, SPECULATIVE_TOKENS
+from ..helpers.constants import (GEMINI_TIMEOUT_SECONDS, GEMINI_MAX_CONCURRENCY, GEMINI_REQUESTS_PER_MINUTE,
+                                 GEMINI_HEDGING_ENABLED, GEMINI_HEDGE_DELAY_SECONDS, GEMINI_HEDGE_MIN_SAMPLES,
+                                 GEMINI_MODEL_NAME, GEMINI_JSON_MODE, GEMINI_SPECULATIVE_GENERATIONS,
+                                 GEMINI_SPECULATIVE_TEMPERATURES, GEMINI_SPECULATIVE_MAX_TOKENS)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
 # define google model properties: API key through the environment variable and the required model
 load_dotenv()
 google_api_key = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=google_api_key)
-model = genai.GenerativeModel('gemini-pro')
+# the generative AI model, created on the first use - importing the google SDK takes most of the startup time of a
+# serving process, so it is imported by the warm-up of the server (or by the first generation), not by this module
+model = None
+_model_lock = threading.Lock()
+
+
+def get_model() -> Any:
+    """return the process-wide generative AI model, import the SDK and configure the model on the first call"""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=google_api_key)
+                model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return model
+
+
+class GenerativeAIQuota:
+    """process-wide quota of the generative AI calls - a cap on the concurrent calls and a token bucket of the
+    calls per minute. a call that can't get a slot before its deadline fails fast instead of piling up."""
+
+    def __init__(self, max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+                 requests_per_minute: float = GEMINI_REQUESTS_PER_MINUTE):
+        self._concurrency = threading.BoundedSemaphore(max_concurrency)
+        self._requests_bucket = TokenBucket(requests_per_minute / 60.0, max(1.0, requests_per_minute / 60.0))
+
+    def acquire(self, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        if not self._concurrency.acquire(timeout=timeout):
+            raise CouldNotGetValidResponseFromThirdParty("The generative AI is busy, please try again later", 503)
+        if not self._requests_bucket.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._concurrency.release()
+            raise CouldNotGetValidResponseFromThirdParty("The generative AI quota is exceeded, please try again "
+                                                         "later", 503)
+
+    def try_acquire(self) -> bool:
+        """take a slot only if it is available right now (used for the optional hedged calls)"""
+        if not self._concurrency.acquire(blocking=False):
+            return False
+        if not self._requests_bucket.try_acquire():
+            self._concurrency.release()
+            return False
+        return True
+
+    def release(self) -> None:
+        self._concurrency.release()
+
+
+class LatencyTracker:
+    """rolling window of the generative AI call latencies, used for the hedging threshold"""
+
+    def __init__(self, window_size: int = 200):
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, latency_seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(latency_seconds)
+
+    def percentile(self, percentile: float, min_samples: int = GEMINI_HEDGE_MIN_SAMPLES) -> Any:
+        """:return: the latency percentile in seconds, or None if there are not enough samples"""
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percentile))]
+
+
+class TokenAccounting:
+    """process-wide accounting of the generative AI calls and tokens"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged_calls = 0
+        self.timeouts = 0
+        self.total_tokens = 0
+
+    def record(self, total_tokens: Any = None, hedged: bool = False, timeout: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.hedged_calls += 1 if hedged else 0
+            self.timeouts += 1 if timeout else 0
+            self.total_tokens += total_tokens or 0
+
+    def get_stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "hedged_calls": self.hedged_calls, "timeouts": self.timeouts,
+                "total_tokens": self.total_tokens}
+
+    def get_average_tokens(self) -> Any:
+        """:return: the average tokens of a call, or None before the first call"""
+        with self._lock:
+            return self.total_tokens / self.calls if self.calls else None
+
+
+generative_ai_quota = GenerativeAIQuota()
+latency_tracker = LatencyTracker()
+token_accounting = TokenAccounting()
+# the threads of the synchronous (and hedged) calls - bounded by the quota concurrency
+hedging_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY * 2, thread_name_prefix="generative-ai")
+
+
+def init_client() -> None:
+    """create the generative AI client of this process ahead of the first request.
+    the client (a grpc channel) can't be shared across a fork, so a pre-fork server calls it in each worker."""
+
+    generative_model = get_model()
+    if getattr(generative_model, "_client", False) is None:
+        from google.generativeai import client as genai_client
+        generative_model._client = genai_client.get_default_generative_client()
 
 
 class GenerativeAIResource:
 
-    def __init__(self, message):
+    def __init__(self, message, timeout: float = GEMINI_TIMEOUT_SECONDS, hedging: bool = GEMINI_HEDGING_ENABLED,
+                 response_validator: Callable[[Any], bool] = None, response_schema: Any = None,
+                 json_mode: bool = GEMINI_JSON_MODE, temperature: float = None):
+        """
+        :param message: the prompt
+        :param timeout: the deadline of a single generation (in seconds)
+        :param hedging: fire a second generation if the first one is slower than the p95 latency,
+            and take the first valid response
+        :param response_validator: decides if a response is valid for the hedging (default - has a text)
+        :param response_schema: the schema of a JSON mode response (e.g. the GeneratedTrip model)
+        :param json_mode: request a JSON typed response (without the markdown code fences)
+        :param temperature: the sampling temperature of the generation (default - the temperature of the model)
+        """
         self.message = message
+        self.timeout = timeout
+        self.hedging = hedging
+        self.response_validator = response_validator
+        self.generation_config = None
+        if json_mode:
+            self.generation_config = {"response_mime_type": "application/json"}
+            if response_schema is not None:
+                self.generation_config["response_schema"] = response_schema
+        if temperature is not None:
+            self.generation_config = {**(self.generation_config or {}), "temperature": temperature}
         self._finish_reason = None
         self._total_tokens = None
+        self._latency_ms = None
 
     def get_generative_ai_response(self):
-        res = model.generate_content(self.message)
+        if self.hedging:
+            return self._get_hedged_response()
+        return self._generate(hedged=False)
+
+    def _generate(self, hedged: bool, quota_acquired: bool = False):
+        if not quota_acquired:
+            generative_ai_quota.acquire(self.timeout)
+        start_time = time.perf_counter()
+        try:
+            res = get_model().generate_content(self.message, generation_config=self.generation_config,
+                                               request_options={"timeout": self.timeout})
+        except Exception as e:
+            self._raise_generation_error(e, hedged, start_time)
+        finally:
+            generative_ai_quota.release()
+        self._record_response(res, hedged, start_time)
+        return res
+
+    def _raise_generation_error(self, error: Exception, hedged: bool, start_time: float) -> None:
+        latency = time.perf_counter() - start_time
+        is_timeout = latency >= self.timeout or "deadline" in str(error).lower() or \
+            isinstance(error, (TimeoutError, asyncio.TimeoutError))
+        token_accounting.record(hedged=hedged, timeout=is_timeout)
+        GEMINI_REQUEST_DURATION.observe(latency, outcome="timeout" if is_timeout else "error")
+        if is_timeout:
+            logger.error(f"GenerativeAIResource: generation timed out after {latency:.1f} seconds")
+            raise CouldNotGetValidResponseFromThirdParty("The generative AI did not respond in time", 504)
+        logger.error(f"GenerativeAIResource: generation failed: {error}")
+        raise CouldNotGetValidResponseFromThirdParty("Could not get a response from the generative AI", 502)
+
+    def _record_response(self, res: Any, hedged: bool, start_time: float) -> None:
+        latency = time.perf_counter() - start_time
+        latency_tracker.record(latency)
+        self.set_response_metadata(res, latency)
+        token_accounting.record(total_tokens=self._total_tokens, hedged=hedged)
+        GEMINI_REQUEST_DURATION.observe(latency, outcome="ok")
+        GEMINI_TOKENS.inc(self._total_tokens or 0)
+
+    def set_response_metadata(self, res: Any, latency_seconds: float = None) -> None:
+        """populate the finish reason, the total tokens and the latency of the response"""
+        try:
+            self._finish_reason = res.candidates[0].finish_reason.name
+        except (AttributeError, IndexError):
+            self._finish_reason = None
+        try:
+            self._total_tokens = res.usage_metadata.total_token_count
+        except AttributeError:
+            self._total_tokens = None
+        if latency_seconds is not None:
+            self._latency_ms = latency_seconds * 1000
+        logger.info(f"GenerativeAIResource: finish reason: {self._finish_reason}, total tokens: "
+                    f"{self._total_tokens}, latency: {self._latency_ms} ms")
+
+    def is_valid_response(self, res: Any) -> bool:
+        if self.response_validator is not None:
+            return self.response_validator(res)
+        try:
+            return bool(res.text)
+        except Exception:
+            return False
+
+    def get_hedge_delay(self) -> float:
+        p95_latency = latency_tracker.percentile(0.95)
+        return p95_latency if p95_latency is not None else GEMINI_HEDGE_DELAY_SECONDS
+
+    def _get_hedged_response(self):
+        """fire the generation, and if it didn't finish after the p95 latency, fire a second one (only if the quota
+        allows it right now) - the first valid response wins."""
+
+        futures = [hedging_executor.submit(self._generate, False)]
+        done, _ = wait(futures, timeout=self.get_hedge_delay())
+        if not done and generative_ai_quota.try_acquire():
+            logger.info("GenerativeAIResource: the generation is slower than p95, firing a hedged request")
+            futures.append(hedging_executor.submit(self._generate, True, True))
+        pending = set(futures)
+        last_error = None
+        invalid_response = None
+        while pending:
+            done, pending = wait(pending, timeout=self.timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is not None:
+                    last_error = future.exception()
+                elif self.is_valid_response(future.result()):
+                    # a sync call can't be interrupted - the slower one is accounted when it finishes
+                    return future.result()
+                else:
+                    invalid_response = future.result()
+        if invalid_response is not None:
+            return invalid_response
+        if last_error is not None:
+            raise last_error
+        raise CouldNotGetValidResponseFromThirdParty("The generative AI did not respond in time", 504)
+
+    async def get_generative_ai_response_async(self):
+        """the async variant - the deadline is enforced with asyncio.wait_for, and with hedging the slower
+        generation is cancelled as soon as the first valid response arrives"""
+
+        if not self.hedging:
+            return await self._generate_async(hedged=False)
+        tasks = [asyncio.ensure_future(self._generate_async(hedged=False))]
+        done, _ = await asyncio.wait(tasks, timeout=self.get_hedge_delay())
+        if not done:
+            logger.info("GenerativeAIResource: the generation is slower than p95, firing a hedged request")
+            tasks.append(asyncio.ensure_future(self._generate_async(hedged=True)))
+        pending = set(tasks)
+        last_error = None
+        invalid_response = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                    elif self.is_valid_response(task.result()):
+                        return task.result()
+                    else:
+                        invalid_response = task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        if invalid_response is not None:
+            return invalid_response
+        raise last_error
+
+    async def _generate_async(self, hedged: bool):
+        await asyncio.to_thread(generative_ai_quota.acquire, self.timeout)
+        start_time = time.perf_counter()
+        try:
+            res = await asyncio.wait_for(get_model().generate_content_async(self.message,
+                                                                            generation_config=self.generation_config,
+                                                                            request_options={"timeout": self.timeout}),
+                                         timeout=self.timeout)
+        except Exception as e:
+            self._raise_generation_error(e, hedged, start_time)
+        finally:
+            generative_ai_quota.release()
+        self._record_response(res, hedged, start_time)
         return res
 
+    def get_generative_ai_stream(self):
+        """stream the generated response - yields the text of each chunk as soon as it arrives"""
+        generative_ai_quota.acquire(self.timeout)
+        start_time = time.perf_counter()
+        last_chunk = None
+        try:
+            for chunk in get_model().generate_content(self.message, stream=True,
+                                                      generation_config=self.generation_config,
+                                                      request_options={"timeout": self.timeout}):
+                last_chunk = chunk
+                yield chunk.text
+        finally:
+            generative_ai_quota.release()
+        if last_chunk is not None:
+            # the usage metadata of a stream arrives with its last chunk
+            self._record_response(last_chunk, False, start_time)
+
+
+class SpeculativeGeneration:
+    """concurrent generations of the same prompt with different temperatures - the responses are yielded as they
+    arrive, and the caller takes the first valid one and cancels the rest.
+    the first generation waits for a quota slot like any call, the extra ones are launched only if the quota has
+    another free slot right now (a speculative request never holds back the other requests), and only as many as the
+    token cap allows. a sync generation can't be interrupted - the generations that haven't started are cancelled,
+    and the running ones are discarded (their tokens are accounted as wasted when they finish)."""
+
+    def __init__(self, message, generations: int = GEMINI_SPECULATIVE_GENERATIONS,
+                 temperatures: list[float] = None, max_tokens: int = GEMINI_SPECULATIVE_MAX_TOKENS,
+                 timeout: float = GEMINI_TIMEOUT_SECONDS, response_schema: Any = None,
+                 json_mode: bool = GEMINI_JSON_MODE):
+        """
+        :param message: the prompt
+        :param generations: the max concurrent generations
+        :param temperatures: the temperature of each generation (cycled)
+        :param max_tokens: the cost cap - the max estimated tokens of the concurrent generations
+        """
+        self.message = message
+        self.generations = max(1, generations)
+        self.temperatures = temperatures or GEMINI_SPECULATIVE_TEMPERATURES
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.response_schema = response_schema
+        self.json_mode = json_mode
+        # the future of each generation -> its resource (the quota slot of each generation is taken ahead)
+        self._generations = {}
+        self._yielded = set()
+
+    def get_generation_count(self) -> int:
+        """the generations that fit the token cap, by the average tokens of a call"""
+        average_tokens = token_accounting.get_average_tokens()
+        if not average_tokens:
+            return self.generations
+        return max(1, min(self.generations, int(self.max_tokens // average_tokens)))
+
+    def start(self) -> int:
+        """launch the generations
+        :return: the number of the launched generations"""
+        generative_ai_quota.acquire(self.timeout)
+        for index in range(self.get_generation_count()):
+            if index > 0 and not generative_ai_quota.try_acquire():
+                break
+            resource = GenerativeAIResource(self.message, timeout=self.timeout, hedging=False,
+                                            response_schema=self.response_schema, json_mode=self.json_mode,
+                                            temperature=self.temperatures[index % len(self.temperatures)])
+            future = hedging_executor.submit(resource._generate, False, True)
+            self._generations[future] = resource
+        logger.info(f"SpeculativeGeneration: launched {len(self._generations)} concurrent generations")
+        return len(self._generations)
+
+    def responses(self) -> Iterator[Any]:
+        """yield the responses in the order they arrive. raises the error of the last failed generation if none of
+        them responded"""
+        last_error = None
+        responded = False
+        try:
+            # a generation may wait for its quota slot before its own deadline starts
+            for future in as_completed(list(self._generations), timeout=self.timeout * 2):
+                self._yielded.add(future)
+                if future.cancelled():
+                    continue
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    continue
+                responded = True
+                yield future.result()
+        except FuturesTimeoutError:
+            raise CouldNotGetValidResponseFromThirdParty("The generative AI did not respond in time", 504)
+        if not responded and last_error is not None:
+            raise last_error
+
+    def has_arrived_response(self) -> bool:
+        """whether a response has arrived that was not yielded yet"""
+        return any(future.done() and not future.cancelled() and future.exception() is None
+                   for future in self._generations if future not in self._yielded)
+
+    def finish(self, winner: Any = None) -> None:
+        """cancel the generations that are not needed anymore, and account the outcome of each generation
+        :param winner: the accepted response (None - none of the responses was accepted)"""
+        for future in self._generations:
+            if future.cancel():
+                generative_ai_quota.release()
+                SPECULATIVE_GENERATIONS.inc(outcome="cancelled")
+            elif future.done():
+                self._account(future, winner, discarded=False)
+            else:
+                future.add_done_callback(lambda finished: self._account(finished, winner, discarded=True))
+
+    def _account(self, future, winner: Any, discarded: bool) -> None:
+        resource = self._generations[future]
+        failed = future.exception() is not None
+        won = not failed and winner is not None and future.result() is winner
+        SPECULATIVE_GENERATIONS.inc(outcome="won" if won else "discarded" if discarded else "lost")
+        SPECULATIVE_TOKENS.inc(0 if failed else resource._total_tokens or 0, outcome="used" if won else "wasted")
@@ -0,0 +1,137 @@
+import datetime
+import re
+import threading
+from typing import Any, Optional
+
+from .mongo_client_pool import MongoClientPool
+from .mongo_db_resource import MongoDBResource
+from ..helpers.ttl_lru_cache import TTLLRUCache
+from ..helpers.constants import (GEO_CACHE_MAX_SIZE, GEO_CACHE_TTL_SECONDS, GEO_CACHE_NEGATIVE_TTL_SECONDS,
+                                 GEO_CACHE_GRID_DEGREES)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+NAME_KEY_PREFIX = "name"
+COORDINATES_KEY_PREFIX = "coordinates"
+
+
+class GeoValidationCache:
+    """two-tier cache of the place-name and coordinates validation results.
+    the first tier is an in-process LRU, the second (optional) tier is the geo-validation-cache collection.
+    invalid results are cached as well (negative caching), with a shorter ttl."""
+
+    def __init__(self, max_size: int = GEO_CACHE_MAX_SIZE,
+                 ttl: float = GEO_CACHE_TTL_SECONDS,
+                 negative_ttl: float = GEO_CACHE_NEGATIVE_TTL_SECONDS,
+                 grid_degrees: float = GEO_CACHE_GRID_DEGREES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.grid_degrees = grid_degrees
+        self._memory_cache = TTLLRUCache(max_size, ttl)
+        self._client_pool = None
+        self._db_resource = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def use_persistent_store(self, client_pool: MongoClientPool) -> 'GeoValidationCache':
+        """enable the persistent tier - the collection is connected lazily on the first lookup"""
+        self._client_pool = client_pool
+        return self
+
+    def _get_store(self) -> Optional[MongoDBResource]:
+        if self._client_pool is None:
+            return None
+        if self._db_resource is None:
+            self._db_resource = MongoDBResource(self._client_pool)
+        return self._db_resource
+
+    @staticmethod
+    def normalise_name(name: str) -> str:
+        # casefold, drop the punctuation and collapse the whitespaces - "The  Colosseum!" -> "the colosseum"
+        return " ".join(re.sub(r"[^\w\s]", " ", str(name).casefold()).split())
+
+    def get_name_key(self, place_name: str, country_name: str, city_name: str = None) -> str:
+        return "|".join([NAME_KEY_PREFIX, self.normalise_name(country_name), self.normalise_name(city_name or ""),
+                         self.normalise_name(place_name)])
+
+    def snap_to_grid(self, value: Any) -> str:
+        snapped = round(float(value) / self.grid_degrees) * self.grid_degrees
+        return f"{snapped:.6f}"
+
+    def get_coordinates_key(self, latitude: Any, longitude: Any, country_name: str) -> str:
+        return "|".join([COORDINATES_KEY_PREFIX, self.normalise_name(country_name),
+                         self.snap_to_grid(latitude), self.snap_to_grid(longitude)])
+
+    def get(self, cache_key: str) -> Optional[bool]:
+        """return the cached validation result, or None on a miss"""
+
+        is_valid = self._memory_cache.get(cache_key)
+        if is_valid is not None:
+            self._count("memory_hits")
+            return is_valid
+        store = self._get_store()
+        if store is not None:
+            try:
+                is_valid = store.get_geo_validation_entry(cache_key)
+            except Exception as e:
+                logger.error(f"GeoValidationCache: could not read from the persistent store: {e}")
+                is_valid = None
+            if is_valid is not None:
+                self._count("store_hits")
+                self._memory_cache.set(cache_key, is_valid, self.get_ttl(is_valid))
+                return is_valid
+        self._count("misses")
+        return None
+
+    def set(self, cache_key: str, is_valid: bool, persist: bool = True) -> None:
+        ttl = self.get_ttl(is_valid)
+        self._memory_cache.set(cache_key, is_valid, ttl)
+        store = self._get_store()
+        if persist and store is not None:
+            expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl)
+            try:
+                store.set_geo_validation_entry(cache_key, is_valid, expires_at)
+            except Exception as e:
+                logger.error(f"GeoValidationCache: could not write to the persistent store: {e}")
+
+    def get_ttl(self, is_valid: bool) -> float:
+        return self.ttl if is_valid else self.negative_ttl
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_stats(self) -> dict[str, Any]:
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {"memory_hits": self.memory_hits, "store_hits": self.store_hits, "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+                "memory_size": len(self._memory_cache)}
+
+    def warm_up_from_store(self) -> int:
+        """preload the in-process tier from the persistent tier - the results of the checks that were actually made
+        (a saved trip doesn't tell if an entry passed by its name or by its coordinates), with their remaining ttl,
+        the latest first and up to the max size of the in-process tier.
+        :return: the number of loaded keys"""
+
+        store = self._get_store()
+        if store is None:
+            return 0
+        now = datetime.datetime.now(datetime.timezone.utc)
+        loaded_keys = 0
+        for entry in store.get_geo_validation_entries(self._memory_cache.max_size):
+            expires_at = entry["expires_at"]
+            if expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+            ttl = (expires_at - now).total_seconds()
+            if ttl > 0:
+                self._memory_cache.set(entry["_id"], entry["is_valid"], ttl)
+                loaded_keys += 1
+        logger.info(f"GeoValidationCache: warm up loaded {loaded_keys} keys from the persistent store")
+        return loaded_keys
+
+
+# the process-wide geo validation cache, shared by all the DataValidator instances
+shared_geo_validation_cache = GeoValidationCache()
@@ -0,0 +1,92 @@
+import copy
+import datetime
+import hashlib
+import json
+import threading
+from typing import Any
+
+from .mongo_db_resource import MongoDBResource
+from ..helpers.ttl_lru_cache import TTLLRUCache
+from ..helpers.constants import (ITINERARY_CACHE_MAX_SIZE, ITINERARY_CACHE_TTL_SECONDS,
+                                 ITINERARY_CACHE_USE_GENERATED_TRIPS)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+
+class ItineraryCache:
+    """cache of validated itineraries, keyed by a canonical hash of the normalised trip parameters and the
+    sponsored businesses that were offered to the generative AI.
+    the first tier is an in-process LRU with TTL, the second tier is the generated-trips collection
+    (every saved trip holds its cache key)."""
+
+    def __init__(self, max_size: int = ITINERARY_CACHE_MAX_SIZE,
+                 ttl: float = ITINERARY_CACHE_TTL_SECONDS,
+                 use_generated_trips: bool = ITINERARY_CACHE_USE_GENERATED_TRIPS):
+        self.ttl = ttl
+        self.use_generated_trips = use_generated_trips
+        self._memory_cache = TTLLRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    @staticmethod
+    def normalise_value(value: Any) -> Any:
+        if isinstance(value, str):
+            return " ".join(value.split()).casefold()
+        if isinstance(value, list):
+            return sorted(ItineraryCache.normalise_value(item) for item in value)
+        return value
+
+    @staticmethod
+    def get_cache_key(required_keys: dict[str, Any], optional_keys: dict[str, Any],
+                      recommendations: list[dict[str, Any]]) -> str:
+        """build the canonical cache key of a trip request.
+        :param required_keys: the required trip properties (get_required_properties_dict)
+        :param optional_keys: the optional trip properties (get_optional_keys_dict)
+        :param recommendations: the sponsored businesses that are offered in the prompt - a business that ran out
+            of credits is not part of the recommendations, so it changes the key.
+        :return: sha256 hex digest of the normalised parameters"""
+
+        canonical = {
+            "required": {key: ItineraryCache.normalise_value(value) for key, value in required_keys.items()},
+            "optional": {key: ItineraryCache.normalise_value(value) for key, value in optional_keys.items()
+                         if value},
+            "sponsored": sorted(str(line.get("_id")) for line in recommendations),
+        }
+        return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, cache_key: str, db_resource: MongoDBResource = None) -> Any:
+        """return a copy of the cached itinerary json, or None on a miss"""
+
+        json_itinerary = self._memory_cache.get(cache_key)
+        if json_itinerary is not None:
+            self._count("memory_hits")
+            logger.info(f"ItineraryCache: in-process cache hit for {cache_key}")
+            return copy.deepcopy(json_itinerary)
+        if self.use_generated_trips and db_resource is not None:
+            oldest_valid = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.ttl)
+            json_itinerary = db_resource.get_cached_generated_trip(cache_key, oldest_valid)
+            if json_itinerary is not None:
+                self._count("db_hits")
+                logger.info(f"ItineraryCache: generated-trips cache hit for {cache_key}")
+                self._memory_cache.set(cache_key, json_itinerary)
+                return copy.deepcopy(json_itinerary)
+        self._count("misses")
+        return None
+
+    def set(self, cache_key: str, json_itinerary: dict[str, Any]) -> None:
+        self._memory_cache.set(cache_key, copy.deepcopy(json_itinerary))
+
+    def record_bypass(self) -> None:
+        self._count("bypasses")
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get_stats(self) -> dict[str, int]:
+        return {"memory_hits": self.memory_hits, "db_hits": self.db_hits, "misses": self.misses,
+                "bypasses": self.bypasses, "memory_size": len(self._memory_cache)}
@@ -0,0 +1,117 @@
+import threading
+import time
+from typing import Any, Callable
+
+from pymongo.mongo_client import MongoClient
+from ..helpers.error_handling import MongoConnectionError
+from ..helpers.constants import (MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+                                 MONGO_HEALTH_CHECK_INTERVAL_SECONDS)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+
+class MongoClientPool:
+    """process-wide owner of a single MongoClient (and by that - of its connection pool).
+    the client is created lazily on the first use and shared by all the requests (MongoClient is thread safe),
+    the connection health is re-checked by a background timer instead of a ping per request."""
+
+    def __init__(self, uri: str,
+                 max_pool_size: int = MONGO_MAX_POOL_SIZE,
+                 min_pool_size: int = MONGO_MIN_POOL_SIZE,
+                 health_check_interval: float = MONGO_HEALTH_CHECK_INTERVAL_SECONDS,
+                 client_factory: Callable[..., Any] = MongoClient):
+        self.uri = uri
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.health_check_interval = health_check_interval
+        self.client_factory = client_factory
+        self._client = None
+        self._lock = threading.Lock()
+        self._healthy = False
+        self._last_health_check = None
+        self._stop_health_check = threading.Event()
+        self._health_check_thread = None
+
+    def get_client(self) -> MongoClient:
+        """return the shared client, connect (and ping once) on the first call.
+        :return: the shared MongoClient"""
+
+        if self._client is None:
+            with self._lock:
+                # double-checked - another thread may have connected while we were waiting for the lock
+                if self._client is None:
+                    self._client = self._connect()
+                    self._start_health_check()
+        return self._client
+
+    def _connect(self) -> MongoClient:
+        try:
+            client = self.client_factory(self.uri, maxPoolSize=self.max_pool_size, minPoolSize=self.min_pool_size)
+            client.admin.command('ping')
+            logger.info("Pinged your deployment. You successfully connected to MongoDB!")
+        except Exception as e:
+            logger.error(f"Could not connect to MongoDB: {e}")
+            raise MongoConnectionError(f"Could not connect to MongoDB", 500)
+        self._healthy = True
+        self._last_health_check = time.monotonic()
+        return client
+
+    def _start_health_check(self) -> None:
+        if self.health_check_interval <= 0:
+            return
+        self._stop_health_check.clear()
+        self._health_check_thread = threading.Thread(target=self._health_check_loop,
+                                                     name="mongo-health-check", daemon=True)
+        self._health_check_thread.start()
+
+    def _health_check_loop(self) -> None:
+        while not self._stop_health_check.wait(self.health_check_interval):
+            self.check_health()
+
+    def check_health(self) -> bool:
+        """ping the deployment with the shared client and update the health state.
+        :return: True if the ping succeeded, False otherwise"""
+
+        client = self._client
+        if client is None:
+            return False
+        try:
+            client.admin.command('ping')
+            if not self._healthy:
+                logger.info("MongoClientPool: connection to MongoDB is healthy again")
+            self._healthy = True
+        except Exception as e:
+            logger.error(f"MongoClientPool: health check failed: {e}")
+            self._healthy = False
+        self._last_health_check = time.monotonic()
+        return self._healthy
+
+    def is_healthy(self) -> bool:
+        return self._client is not None and self._healthy
+
+    def close(self) -> None:
+        """stop the health check timer and close the shared client (and all of its pooled connections)"""
+
+        self._stop_health_check.set()
+        if self._health_check_thread is not None:
+            self._health_check_thread.join(timeout=self.health_check_interval)
+            self._health_check_thread = None
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                logger.info("MongoClientPool: MongoDB client closed")
+            self._client = None
+            self._healthy = False
+
+    def reset_after_fork(self) -> None:
+        """forget the client inherited from the parent process (a MongoClient is not fork-safe) - the forked worker
+        connects its own client on the first use. the inherited client is not closed, it still belongs to the
+        parent process."""
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._healthy = False
+        self._last_health_check = None
+        self._stop_health_check = threading.Event()
+        self._health_check_thread = None
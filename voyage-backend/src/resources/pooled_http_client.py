@@ -0,0 +1,154 @@
+import threading
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..helpers.circuit_breaker import CircuitBreaker
+from ..helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from ..helpers.constants import (AUTOCOMPLETE_POOL_SIZE, AUTOCOMPLETE_CONNECT_TIMEOUT_SECONDS,
+                                 AUTOCOMPLETE_READ_TIMEOUT_SECONDS, AUTOCOMPLETE_MAX_RETRIES,
+                                 AUTOCOMPLETE_RETRY_BACKOFF_SECONDS, AUTOCOMPLETE_RETRY_JITTER_SECONDS,
+                                 AUTOCOMPLETE_CIRCUIT_FAILURE_THRESHOLD, AUTOCOMPLETE_CIRCUIT_RESET_SECONDS)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# the responses that are retried (and count as a failure of the provider once the retries are exhausted)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class ConnectionStats:
+    """thread-safe counters of the requests that opened a new connection vs the requests that reused a kept-alive
+    connection of the pool"""
+
+    def __init__(self):
+        self.new_connections = 0
+        self.reused_connections = 0
+        self._lock = threading.Lock()
+
+    def record(self, reused: bool) -> None:
+        with self._lock:
+            if reused:
+                self.reused_connections += 1
+            else:
+                self.new_connections += 1
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"new_connections": self.new_connections, "reused_connections": self.reused_connections}
+
+
+class CountingConnectionPoolMixin:
+    connection_stats: ConnectionStats = None
+
+    def _make_request(self, conn, *args, **kwargs):
+        # a connection without a socket is connected by this request (a new one, or a dropped one that is reopened)
+        self.connection_stats.record(reused=conn.sock is not None)
+        return super()._make_request(conn, *args, **kwargs)
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools count the new and the reused connections"""
+
+    def __init__(self, connection_stats: ConnectionStats, **kwargs):
+        self.connection_stats = connection_stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: type(f"Counting{pool_class.__name__}", (CountingConnectionPoolMixin, pool_class),
+                         {"connection_stats": self.connection_stats})
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()}
+
+
+class PooledHttpClient:
+    """the HTTP client of a third party service, shared by all the threads of the serving process -
+    a keep-alive session with a bounded connection pool, connect/read timeouts, bounded retries with a jittered
+    exponential backoff, and a circuit breaker that fails fast while the provider is down."""
+
+    def __init__(self, service: str, pool_size: int = AUTOCOMPLETE_POOL_SIZE,
+                 connect_timeout: float = AUTOCOMPLETE_CONNECT_TIMEOUT_SECONDS,
+                 read_timeout: float = AUTOCOMPLETE_READ_TIMEOUT_SECONDS,
+                 max_retries: int = AUTOCOMPLETE_MAX_RETRIES,
+                 backoff_factor: float = AUTOCOMPLETE_RETRY_BACKOFF_SECONDS,
+                 backoff_jitter: float = AUTOCOMPLETE_RETRY_JITTER_SECONDS,
+                 circuit_breaker: CircuitBreaker = None, verify: bool = True):
+        """
+        :param service: the service name (for the logs and the errors)
+        :param pool_size: the max kept-alive connections to a host (the concurrent calls above it open and close
+            their own connections)
+        :param max_retries: the retries of a connection error or a retryable status (RETRY_STATUS_CODES)
+        :param backoff_factor: the exponential backoff of the retries, backoff_factor * 2 ^ (retry - 1) seconds
+        :param backoff_jitter: a random extra backoff of up to this many seconds, so the retries are spread
+        :param verify: verify the TLS certificate of the host
+        """
+        self.service = service
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.retry = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                           backoff_factor=backoff_factor, backoff_jitter=backoff_jitter,
+                           status_forcelist=RETRY_STATUS_CODES, allowed_methods=frozenset({"GET"}),
+                           raise_on_status=False)
+        self.circuit_breaker = circuit_breaker if circuit_breaker is not None else CircuitBreaker(
+            AUTOCOMPLETE_CIRCUIT_FAILURE_THRESHOLD, AUTOCOMPLETE_CIRCUIT_RESET_SECONDS)
+        self.verify = verify
+        self.connection_stats = ConnectionStats()
+        self._session = None
+        self._lock = threading.Lock()
+
+    def get_session(self) -> requests.Session:
+        """return the shared session, create it on the first call"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        session.verify = self.verify
+        adapter = CountingHTTPAdapter(self.connection_stats, pool_connections=1, pool_maxsize=self.pool_size,
+                                      max_retries=self.retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def get(self, url: str, params: dict[str, Any] = None) -> requests.Response:
+        """GET the url with the retry policy - a response with a retryable status is returned after the retries.
+        raises CouldNotGetValidResponseFromThirdParty (503) while the circuit is open, and the requests exceptions
+        of the failed calls"""
+
+        if not self.circuit_breaker.allow_request():
+            raise CouldNotGetValidResponseFromThirdParty(f"The {self.service} service is unavailable, please try "
+                                                         f"again later", 503)
+        try:
+            response = self.get_session().get(url, params=params, timeout=self.timeout)
+        except requests.RequestException:
+            self.circuit_breaker.record_failure()
+            raise
+        if response.status_code in RETRY_STATUS_CODES:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+
+    def get_stats(self) -> dict[str, int]:
+        circuit_stats = self.circuit_breaker.get_stats()
+        return {**self.connection_stats.get_stats(), "pool_size": self.pool_size,
+                "circuit_open": circuit_stats["open"], "circuit_opened": circuit_stats["opened"],
+                "circuit_rejected": circuit_stats["rejected"]}
+
+    def reset_after_fork(self) -> None:
+        """forget the session inherited from the parent process (its kept-alive connections belong to the parent),
+        the forked worker creates its own on the first use"""
+        with self._lock:
+            self._session = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
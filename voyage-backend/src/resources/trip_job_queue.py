@@ -0,0 +1,201 @@
+import datetime
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from bson import ObjectId
+
+from .mongo_client_pool import MongoClientPool
+from .mongo_db_resource import MongoDBResource
+from ..helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from ..helpers.constants import (TRIP_JOBS_MAX_WORKERS, TRIP_JOBS_MAX_PENDING, TRIP_JOBS_STALE_SECONDS,
+                                 TRIP_JOBS_SWEEP_SECONDS)
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+
+class TripJobQueue:
+    """background jobs of the trip generation, backed by the trip-jobs collection.
+    the request thread only saves a pending job and returns its ID, a bounded pool of worker threads claims the job
+    and runs the generation. identical requests that are still in flight share a job (across the serving processes -
+    the in-flight key of a job is unique in mongo), and since the jobs are saved in mongo, the pending jobs are resumed
+    when a serving process starts, and the stale jobs (of a dead worker) are swept periodically."""
+
+    def __init__(self, client_pool: MongoClientPool, service_factory: Callable[[dict[str, Any]], Any],
+                 max_workers: int = TRIP_JOBS_MAX_WORKERS, max_pending: int = TRIP_JOBS_MAX_PENDING,
+                 stale_seconds: float = TRIP_JOBS_STALE_SECONDS, sweep_seconds: float = TRIP_JOBS_SWEEP_SECONDS):
+        """
+        :param client_pool: the mongo client pool of the process
+        :param service_factory: creates the service of a request body - its generate_trip() returns the itinerary
+            and the ID of the saved trip
+        :param max_workers: the max number of trips that are generated concurrently by this process
+        :param max_pending: the max number of jobs of this process that wait for a worker or run
+        :param stale_seconds: a running job that was not updated for this long is resumed by another worker
+        :param sweep_seconds: the interval of the stale jobs sweep (0 - no periodic sweep)
+        """
+        self.client_pool = client_pool
+        self.service_factory = service_factory
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self.sweep_seconds = sweep_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._executor = None
+        self._sweeper = None
+        self._closed = threading.Event()
+        # the jobs that are scheduled in this process, so a sweep doesn't schedule them again
+        self._scheduled = set()
+        self._in_process = 0
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "deduplicated": 0, "rejected": 0, "resumed": 0, "swept": 0, "done": 0,
+                       "failed": 0}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # created on the first job, so a pre-fork server doesn't copy the threads of the parent process
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="trip-jobs")
+        return self._executor
+
+    def _start_sweeper(self) -> None:
+        with self._lock:
+            if self._sweeper is not None or not self.sweep_seconds:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_periodically, name="trip-jobs-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_periodically(self) -> None:
+        while not self._closed.wait(self.sweep_seconds):
+            try:
+                self.sweep_stale_jobs()
+            except Exception as e:
+                logger.error(f"TripJobQueue: could not sweep the stale jobs: {e}")
+
+    def _get_db_resource(self) -> MongoDBResource:
+        return MongoDBResource(self.client_pool)
+
+    def submit(self, request_body: dict[str, Any], request_key: str) -> tuple[Any, bool]:
+        """save a pending job of the request, or join the in-flight job of an identical request.
+        :return: the job ID, and whether a new job was created"""
+
+        db_resource = self._get_db_resource()
+        in_flight_job = db_resource.get_in_flight_trip_job(request_key)
+        if in_flight_job is None:
+            with self._lock:
+                if self._in_process >= self.max_pending:
+                    self._stats["rejected"] += 1
+                    raise CouldNotGetValidResponseFromThirdParty("Too many trips are being generated, please try "
+                                                                 "again later", 503)
+            now = datetime.datetime.now(datetime.timezone.utc)
+            job_id, created = db_resource.add_in_flight_trip_job(request_key, {
+                "status": "pending", "request_body": request_body, "request_key": request_key, "attempts": 0,
+                "created_at": now, "updated_at": now})
+        else:
+            job_id, created = in_flight_job["_id"], False
+        if not created:
+            self._count("deduplicated")
+            logger.info(f"TripJobQueue: joined the in-flight job {job_id} of an identical request")
+            return job_id, False
+        self._count("submitted")
+        self._schedule(job_id)
+        return job_id, True
+
+    def _schedule(self, job_id: Any) -> bool:
+        """:return: whether the job was scheduled (False if it is already scheduled in this process)"""
+        with self._lock:
+            if job_id in self._scheduled:
+                return False
+            self._scheduled.add(job_id)
+            self._in_process += 1
+        self._get_executor().submit(self._run, job_id)
+        self._start_sweeper()
+        return True
+
+    def _run(self, job_id: Any) -> None:
+        try:
+            db_resource = self._get_db_resource()
+            job = db_resource.claim_trip_job(job_id, self.worker_id)
+            if job is None:  # claimed by another worker
+                return
+            try:
+                _, trip_id = self.service_factory(job["request_body"]).generate_trip()
+            except Exception as e:
+                logger.error(f"TripJobQueue: job {job_id} failed: {e}")
+                db_resource.update_trip_job(job_id, {"status": "failed",
+                                                     "error": getattr(e, "error_string", "unknown error"),
+                                                     "status_code": getattr(e, "error_status_code", 500)},
+                                            finished=True)
+                self._count("failed")
+                return
+            db_resource.update_trip_job(job_id, {"status": "done", "trip_id": trip_id}, finished=True)
+            self._count("done")
+        except Exception as e:
+            # the job stays running, and is resumed once it is stale
+            logger.error(f"TripJobQueue: could not update the job {job_id}: {e}")
+        finally:
+            with self._lock:
+                self._in_process -= 1
+                self._scheduled.discard(job_id)
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def get_job(self, job_id: str) -> Any:
+        """:return: the job, or None if the ID is unknown (or not a valid job ID)"""
+        if not ObjectId.is_valid(job_id):
+            return None
+        return self._get_db_resource().get_trip_job(ObjectId(job_id))
+
+    def resume_pending_jobs(self) -> int:
+        """schedule the pending jobs, and the running jobs of the workers that are gone - each job is run by the
+        first worker that claims it.
+        :return: the number of the scheduled jobs"""
+
+        scheduled = self._schedule_resumable_jobs(only_stale=False)
+        with self._lock:
+            self._stats["resumed"] += scheduled
+        if scheduled:
+            logger.info(f"TripJobQueue: resumed {scheduled} trip jobs")
+        self._start_sweeper()
+        return scheduled
+
+    def sweep_stale_jobs(self) -> int:
+        """schedule the running jobs of the workers that are gone, and the pending jobs that no serving process has
+        claimed for the stale period - so their clients don't wait for the next start of a serving process.
+        :return: the number of the scheduled jobs"""
+
+        scheduled = self._schedule_resumable_jobs(only_stale=True)
+        with self._lock:
+            self._stats["swept"] += scheduled
+        if scheduled:
+            logger.info(f"TripJobQueue: swept {scheduled} stale trip jobs")
+        return scheduled
+
+    def _schedule_resumable_jobs(self, only_stale: bool) -> int:
+        stale_before = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.stale_seconds)
+        job_ids = self._get_db_resource().get_resumable_trip_jobs(stale_before, only_stale=only_stale)
+        return sum(self._schedule(job_id) for job_id in job_ids)
+
+    def get_stats(self) -> dict[str, int]:
+        with self._lock:
+            return {**self._stats, "in_process": self._in_process}
+
+    def restart_after_fork(self) -> None:
+        """a forked process has its own worker threads and worker ID"""
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self._executor = None
+        self._sweeper = None
+        self._closed = threading.Event()
+        self._scheduled = set()
+        self._in_process = 0
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """wait for the running jobs - the jobs that didn't start stay pending and are resumed on the next start"""
+        self._closed.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
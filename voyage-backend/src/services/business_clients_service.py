@@ -2,6 +2,7 @@ from typing import Any
 from ..processors.data_validator import DataValidator
 from ..resources.mongo_db_resource import MongoDBResource
 from ..processors.response_builder import ResponseBuilder
+from ..helpers.metrics import RequestTimer
 from ..helpers.constants import NEW_BUSINESS_EXPECTED_REQUEST_PROPERTIES, NEW_BUSINESS_OPTIONAL_REQUEST_PROPERTIES
 from ..helpers.error_handling import MissingExpectedKeyInRequestBodyError, CountryNameError
 from ..models.client_data import ClientData
@@ -16,11 +17,13 @@ logger.basicConfig(level=logger.INFO)
 
 
 class BusinessService:
-    def __init__(self, request_body: dict[str, str]):
+    def __init__(self, request_body: dict[str, str], db_resource: MongoDBResource = None,
+                 response_builder: ResponseBuilder = None):
         self.request_body = request_body
-        self.response_builder = ResponseBuilder()
-        self.db_resource = MongoDBResource()
+        self.response_builder = response_builder if response_builder is not None else ResponseBuilder()
+        self.db_resource = db_resource if db_resource is not None else MongoDBResource()
         self.data_validator = DataValidator()
+        self.request_timer = RequestTimer("add_business")
 
     def verify_request_headers(self) -> None:
         """the function go over the expected headers,
@@ -34,21 +37,37 @@ class BusinessService:
                 logger.error(f"BusinessService: missing header in request: {header}")
                 raise MissingExpectedKeyInRequestBodyError(f"Missing Header in Request: {header}", 400)
 
+    @staticmethod
+    def build_business_data(request_body: dict[str, Any], client_id: Any) -> BusinessData:
+        interest_points = request_body["business_match_interest_points"]
+        if isinstance(interest_points, str):
+            interest_points = interest_points.split(",")
+        return BusinessData(business_client_id=client_id,
+                            business_name=request_body["business_name"],
+                            business_type=request_body["business_type"],
+                            business_phone=request_body["business_phone"],
+                            business_email=request_body["business_email"],
+                            business_match_interest_points=interest_points,
+                            business_country=request_body["business_country"],
+                            business_description=request_body.get("business_description", None),
+                            business_city=request_body.get("business_city", None),
+                            business_area=request_body.get("business_area", None),
+                            business_accommodation_type=request_body.get("business_accommodation_type", None),
+                            business_longitude=request_body["business_longitude"],
+                            business_latitude=request_body["business_latitude"])
+
+    @staticmethod
+    def build_client_data(request_body: dict[str, Any]) -> ClientData:
+        return ClientData(business_contact_person=request_body["business_contact_person"],
+                          business_contact_person_phone=request_body["business_contact_person_phone"],
+                          credits_bought=int(request_body["credits_bought"]))
+
     def add_new_business_to_db(self, new_client_id: Any) -> Any:
         """the function adds the new business to the DB
         and returns the new business ID"""
 
         # build the new business dictionary
-        business_data = BusinessData(business_client_id=new_client_id,
-                                     business_name=self.request_body["business_name"],
-                                     business_type=self.request_body["business_type"],
-                                     business_phone=self.request_body["business_phone"],
-                                     business_email=self.request_body["business_email"],
-                                     business_match_interest_points=self.request_body["business_match_interest_points"].split(","),
-                                     business_country=self.request_body["business_country"],
-                                     business_description=self.request_body.get("business_description", None),
-                                     business_longitude=self.request_body["business_longitude"],
-                                     business_latitude=self.request_body["business_latitude"])
+        business_data = self.build_business_data(self.request_body, new_client_id)
         # add the new business to the DB
         return self.db_resource.add_new_business(business_data.dict())
 
@@ -56,9 +75,7 @@ class BusinessService:
         """the function adds a new client to the business clients DB
         and returns the new client ID"""
 
-        client_data = ClientData(business_contact_person=self.request_body["business_contact_person"],
-                                 business_contact_person_phone=self.request_body["business_contact_person_phone"],
-                                 credits_bought=int(self.request_body["credits_bought"]))
+        client_data = self.build_client_data(self.request_body)
         return self.db_resource.add_new_business_client(client_data.dict())
 
     def add_new_business(self) -> dict[str, Any]:
@@ -70,17 +87,24 @@ class BusinessService:
             raise e
 
         # verify that the long-lat is matches to the country in the request
-        if not self.data_validator.verify_long_lat_in_country(self.request_body["business_longitude"],
-                                                              self.request_body["business_latitude"],
-                                                              self.request_body["business_country"]):
+        with self.request_timer.stage("validate_location"):
+            is_valid_location = self.data_validator.verify_long_lat_in_country(
+                self.request_body["business_longitude"], self.request_body["business_latitude"],
+                self.request_body["business_country"])
+        if not is_valid_location:
             logger.error("BusinessService: long-lat does not match the country in the request")
             raise CountryNameError("Long-Lat does not match the country in the request", 400)
         # add a new client to the business clients DB
-        new_client_id = self.add_new_client_to_db()
+        with self.request_timer.stage("add_client"):
+            new_client_id = self.add_new_client_to_db()
 
         # add the new business to the DB
-        new_business_id = self.add_new_business_to_db(new_client_id)
+        with self.request_timer.stage("add_business"):
+            new_business_id = self.add_new_business_to_db(new_client_id)
         logger.info(f"BusinessService: new business added to the DB with ID: {new_business_id}\n")
 
-        return self.response_builder.build_business_response(self.db_resource.get_business_from_db(
-            new_business_id), 200, 'new-business')
+        with self.request_timer.stage("build_response"):
+            response = self.response_builder.build_business_response(self.db_resource.get_business_from_db(
+                new_business_id), 200, 'new-business')
+        self.request_timer.log_summary()
+        return response
@@ -0,0 +1,198 @@
+import csv
+import json
+import time
+from itertools import islice
+from typing import Any, Iterable, Iterator, TextIO
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .business_clients_service import BusinessService
+from ..processors.data_validator import DataValidator
+from ..resources.mongo_db_resource import MongoDBResource
+from ..helpers.metrics import RequestTimer
+from ..helpers.constants import NEW_BUSINESS_EXPECTED_REQUEST_PROPERTIES, BUSINESS_IMPORT_CHUNK_SIZE
+from ..helpers.error_handling import (CountryNameError, InvalidImportFormatError,
+                                      CouldNotGetValidResponseFromThirdParty)
+
+import logging as logger
+
+logger.basicConfig(level=logger.INFO)
+
+# the supported import formats, by their content types and file extensions
+IMPORT_FORMATS = {"csv": "csv", "text/csv": "csv", ".csv": "csv",
+                  "ndjson": "ndjson", "application/x-ndjson": "ndjson", "application/ndjson": "ndjson",
+                  ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+class BusinessImportService:
+    """bulk onboarding of the businesses of a partner, from a CSV or an NDJSON stream (a row per business, with the
+    same fields as the add_business request).
+    the rows are streamed in chunks - the coordinates of a chunk are validated with a single batch query of the
+    offline country boundaries, and its clients and businesses are inserted with a single insert_many each (the
+    clients of the businesses that could not be inserted are removed, so a failed row can be imported again).
+    every row gets a result in the report, an invalid row doesn't fail the rest of the import."""
+
+    def __init__(self, db_resource: MongoDBResource = None, data_validator: DataValidator = None,
+                 chunk_size: int = BUSINESS_IMPORT_CHUNK_SIZE):
+        self.db_resource = db_resource if db_resource is not None else MongoDBResource()
+        self.data_validator = data_validator if data_validator is not None else DataValidator()
+        self.chunk_size = chunk_size
+        self.request_timer = RequestTimer("import_businesses")
+
+    @staticmethod
+    def get_import_format(format_name: str) -> str:
+        """:param format_name: a format name, a content type or a file extension
+        :return: "csv" or "ndjson" """
+        import_format = IMPORT_FORMATS.get((format_name or "").split(";")[0].strip().lower())
+        if import_format is None:
+            raise InvalidImportFormatError(f"Unsupported import format: {format_name} (expected csv or ndjson)", 400)
+        return import_format
+
+    @staticmethod
+    def read_rows(text_stream: TextIO, import_format: str) -> Iterator[Any]:
+        """stream the rows of the import - a dict per row, or the error string of a row that can't be read"""
+        if import_format == "csv":
+            for row in csv.DictReader(text_stream):
+                yield {key.strip(): value.strip() if isinstance(value, str) else value
+                       for key, value in row.items() if key and value not in (None, "")}
+            return
+        for line in text_stream:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"invalid json: {e}"
+                continue
+            yield row if isinstance(row, dict) else "invalid json: a row should be an object"
+
+    def import_rows(self, rows: Iterable[Any]) -> dict[str, Any]:
+        """import the rows chunk by chunk.
+        :return: the import report - the counters and a result per row, in the rows order:
+            {"row": int, "status": "inserted", "business_id": str, "business_client_id": str} or
+            {"row": int, "status": "failed", "error": str}
+        raises CouldNotGetValidResponseFromThirdParty (503) if the offline country boundaries are not available -
+        without them every row is verified with the rate limited remote reverse geocoder"""
+
+        if not self.data_validator.country_boundaries.is_available():
+            raise CouldNotGetValidResponseFromThirdParty("The offline country boundaries are not available, run: "
+                                                         "flask --app main download-country-boundaries", 503)
+        start_time = time.perf_counter()
+        results = []
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            results.extend(self.import_chunk(chunk, first_row_number=len(results) + 1))
+        elapsed_seconds = time.perf_counter() - start_time
+        inserted = sum(1 for result in results if result["status"] == "inserted")
+        self.request_timer.log_summary()
+        logger.info(f"BusinessImportService: imported {inserted} of {len(results)} rows in {elapsed_seconds:.2f} "
+                    f"seconds")
+        return {"rows": len(results), "inserted": inserted, "failed": len(results) - inserted,
+                "elapsed_seconds": round(elapsed_seconds, 3),
+                "rows_per_second": round(len(results) / elapsed_seconds, 1) if elapsed_seconds > 0 else 0.0,
+                "results": results}
+
+    def import_chunk(self, chunk: list[Any], first_row_number: int) -> list[dict[str, Any]]:
+        results = [{"row": first_row_number + index} for index in range(len(chunk))]
+        # first - build the documents of the rows with all the expected fields
+        valid_rows = []
+        with self.request_timer.stage("build_documents"):
+            for result, row in zip(results, chunk):
+                try:
+                    valid_rows.append((result, self.build_row_documents(row)))
+                except (ValueError, CountryNameError) as e:
+                    self.fail(result, getattr(e, "error_string", None) or str(e))
+
+        # verify the long-lat of all the rows in the country of the row
+        with self.request_timer.stage("validate_location"):
+            is_valid_locations = self.data_validator.verify_long_lats_in_countries(
+                [(business_data.business_latitude, business_data.business_longitude, business_data.business_country)
+                 for _, (_, business_data) in valid_rows])
+        located_rows = []
+        for (result, documents), is_valid_location in zip(valid_rows, is_valid_locations):
+            if is_valid_location:
+                located_rows.append((result, documents))
+            else:
+                self.fail(result, "Long-Lat does not match the country in the request")
+        if not located_rows:
+            return results
+
+        # add the clients and then their businesses - a round trip for each collection. the IDs are set ahead, so
+        # the clients of the businesses that were not inserted can be removed
+        clients = [{**client_data.dict(), "_id": ObjectId()} for _, (client_data, _) in located_rows]
+        with self.request_timer.stage("add_clients"):
+            inserted_clients = self.insert_documents(self.db_resource.add_new_business_clients, clients)
+        if inserted_clients is None:
+            self.remove_documents(self.db_resource.delete_business_clients, clients)
+            inserted_clients = 0
+        businesses = []
+        for (_, (_, business_data)), client in zip(located_rows[:inserted_clients], clients):
+            business_data.business_client_id = client["_id"]
+            businesses.append({**business_data.dict(), "_id": ObjectId()})
+        with self.request_timer.stage("add_businesses"):
+            inserted_businesses = self.insert_documents(self.db_resource.add_new_businesses, businesses)
+        if inserted_businesses is None:
+            self.remove_documents(self.db_resource.delete_businesses, businesses)
+            inserted_businesses = 0
+        self.remove_documents(self.db_resource.delete_business_clients, clients[inserted_businesses:inserted_clients])
+
+        for index, ((result, _), client) in enumerate(zip(located_rows, clients)):
+            if index < inserted_businesses:
+                result.update({"status": "inserted", "business_id": str(businesses[index]["_id"]),
+                               "business_client_id": str(client["_id"])})
+            else:
+                self.fail(result, "Could not insert the business to the DB")
+        return results
+
+    @staticmethod
+    def insert_documents(insert_many, documents: list[dict]) -> Any:
+        """insert the documents in order.
+        :return: the number of the inserted documents - all of them, the ones before the failed document, or None
+            if it is not known which of them were inserted"""
+        if not documents:
+            return 0
+        try:
+            insert_many(documents)
+        except BulkWriteError as e:
+            logger.error(f"BusinessImportService: could not insert all the documents: {e.details.get('writeErrors')}")
+            return e.details.get("nInserted", 0)
+        except PyMongoError as e:
+            logger.error(f"BusinessImportService: could not insert the documents: {e}")
+            return None
+        return len(documents)
+
+    @staticmethod
+    def remove_documents(delete_many, documents: list[dict]) -> None:
+        if not documents:
+            return
+        try:
+            delete_many([document["_id"] for document in documents])
+        except PyMongoError as e:
+            logger.error(f"BusinessImportService: could not remove the documents of the failed rows "
+                         f"{[str(document['_id']) for document in documents]}: {e}")
+
+    def build_row_documents(self, row: Any) -> tuple[Any, Any]:
+        """:return: the client data and the business data of the row (without the client ID)"""
+        if isinstance(row, str):
+            raise ValueError(row)
+        for header in NEW_BUSINESS_EXPECTED_REQUEST_PROPERTIES:
+            if row.get(header) in (None, ""):
+                raise ValueError(f"Missing Header in Request: {header}")
+        try:
+            float(row["business_latitude"]), float(row["business_longitude"])
+        except (TypeError, ValueError):
+            raise ValueError("Long-Lat should be numbers")
+        # an unknown country fails the row (a lookup in the precomputed country table)
+        self.data_validator.get_country_code(row["business_country"])
+        try:
+            return BusinessService.build_client_data(row), BusinessService.build_business_data(row, None)
+        except ValueError as e:  # the pydantic validation errors are value errors too
+            raise ValueError(f"Invalid business data: {e}")
+
+    @staticmethod
+    def fail(result: dict[str, Any], error_string: str) -> None:
+        result.update({"status": "failed", "error": error_string})
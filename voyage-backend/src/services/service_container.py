@@ -0,0 +1,62 @@
+import threading
+from typing import Any
+
+from .user_service import UserService
+from .business_clients_service import BusinessService
+from .business_import_service import BusinessImportService
+from ..processors.business_ranker import BusinessRanker
+from ..processors.data_validator import reset_shared_geo_locator, autocomplete_http_client
+from ..processors.response_builder import ResponseBuilder
+from ..resources.mongo_client_pool import MongoClientPool
+from ..resources.mongo_db_resource import MongoDBResource
+from ..resources.accounting_write_behind_queue import AccountingWriteBehindQueue
+from ..resources.itinerary_cache import ItineraryCache
+from ..helpers.single_flight import SingleFlight
+
+
+class ServiceContainer:
+    """the components of a serving process - created once and shared by all of its requests (they are stateless or
+    thread safe), and the factories of the request services. a request service only creates its own light state:
+    the request keys, the validation errors and the prompt sections."""
+
+    def __init__(self, client_pool: MongoClientPool, accounting_queue: AccountingWriteBehindQueue = None,
+                 itinerary_cache: ItineraryCache = None, single_flight: SingleFlight = None):
+        self.client_pool = client_pool
+        self.accounting_queue = accounting_queue
+        self.itinerary_cache = itinerary_cache
+        self.single_flight = single_flight
+        self.response_builder = ResponseBuilder()
+        self.business_ranker = BusinessRanker()
+        self._db_resource = None
+        self._lock = threading.Lock()
+
+    def get_db_resource(self) -> MongoDBResource:
+        """the collections of a client are thread safe, so the resource is shared until the pool replaces its client
+        (after a fork or a close)"""
+
+        client = self.client_pool.get_client()
+        db_resource = self._db_resource
+        if db_resource is None or db_resource.client is not client:
+            with self._lock:
+                if self._db_resource is None or self._db_resource.client is not client:
+                    self._db_resource = MongoDBResource(self.client_pool)
+                db_resource = self._db_resource
+        return db_resource
+
+    def create_user_service(self, request_body: dict[str, Any]) -> UserService:
+        return UserService(request_body, self.get_db_resource(), self.accounting_queue, self.itinerary_cache,
+                           self.single_flight, response_builder=self.response_builder,
+                           business_ranker=self.business_ranker)
+
+    def create_business_service(self, request_body: dict[str, Any]) -> BusinessService:
+        return BusinessService(request_body, self.get_db_resource(), response_builder=self.response_builder)
+
+    def create_business_import_service(self) -> BusinessImportService:
+        return BusinessImportService(self.get_db_resource())
+
+    def restart_after_fork(self) -> None:
+        """forget the components that hold the connections of the parent process"""
+        with self._lock:
+            self._db_resource = None
+        reset_shared_geo_locator()
+        autocomplete_http_client.reset_after_fork()
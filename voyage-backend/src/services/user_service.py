@@ -1,18 +1,36 @@
+import copy
+import datetime
 import json
+import time
 from enum import Enum
 from typing import Any
+from pydantic import ValidationError
 
-from ..processors.data_validator import DataValidator
+from ..processors.data_validator import DataValidator, errorsType
 from ..processors.prompt_builder import PromptBuilder
+from ..processors.business_ranker import BusinessRanker
+from ..processors.published_business_matcher import PublishedBusinessMatcher
 from ..processors.response_builder import ResponseBuilder
+from ..processors.incremental_itinerary_parser import IncrementalItineraryParser
 from ..helpers.error_handling import (MissingExpectedKeyInRequestBodyError, CouldNotGetValidResponseFromThirdParty,
-                                    CountryNameError, ConvertAIResponseToJsonError)
-from ..helpers.constants import NEW_TRIP_EXPECTED_REQUEST_PROPERTIES, NEW_TRIP_OPTIONAL_REQUEST_PROPERTIES
-from ..resources.generative_ai_resource import GenerativeAIResource
+                                    ConvertAIResponseToJsonError)
+from ..helpers.metrics import (RequestTimer, GEMINI_ATTEMPTS, JSON_PARSE_FAILURES, JSON_RECOVERED_RESPONSES,
+                               VALIDATION_FAILURES, COALESCED_REQUESTS, GEMINI_CALLS_SAVED)
+from ..helpers.single_flight import SingleFlight
+from ..helpers.constants import (NEW_TRIP_EXPECTED_REQUEST_PROPERTIES, NEW_TRIP_OPTIONAL_REQUEST_PROPERTIES,
+                                 NEW_TRIP_BYPASS_CACHE_PROPERTY, NEW_TRIP_ASYNC_PROPERTY,
+                                 ITINERARY_COALESCING_WAIT_SECONDS, GEMINI_SPECULATIVE_ENABLED)
+from ..resources.generative_ai_resource import GenerativeAIResource, SpeculativeGeneration
 from ..resources.mongo_db_resource import MongoDBResource
+from ..resources.accounting_write_behind_queue import AccountingWriteBehindQueue
+from ..resources.itinerary_cache import ItineraryCache
+from ..resources.country_table import Country, shared_country_table
 from ..models.day_itinerary import DayItinerary
 from ..models.generated_trip import GeneratedTrip
-from pycountry_convert import country_alpha2_to_country_name
+from ..models.content import Content
+from ..models.restaurant_recommendation import RestaurantRecommendation
+from ..models.accommodation_recommendation import AccommodationRecommendation
+from ..models.itinerary_repair import ItineraryRepair
 
 
 import logging as logger
@@ -21,6 +39,13 @@ logger.basicConfig(level=logger.INFO)
 
 # service consts:
 INVALID_JSON_STR = "The content of the previous response is not a Valid JSON. Trying again."
+INCORRECT_DAYS_NUMBER_STR = "invalid json format: got incorrect number of itinerary days."
+MAX_ITINERARY_ATTEMPTS = 7
+# the field of the replacement entry in a repair response, and the model of the entry, by the itinerary part
+REPLACEMENT_FIELD_BY_PART = {'morning_activity': ('content', Content), 'afternoon_activity': ('content', Content),
+                             'evening_activity': ('content', Content),
+                             'restaurants_recommendations': ('restaurant', RestaurantRecommendation),
+                             'accommodation_recommendations': ('accommodation', AccommodationRecommendation)}
 
 
 class ErrorType(Enum):
@@ -29,14 +54,30 @@ class ErrorType(Enum):
 
 
 class UserService:
-    def __init__(self, request_body: dict[str, str]):
+    def __init__(self, request_body: dict[str, str], db_resource: MongoDBResource = None,
+                 accounting_queue: AccountingWriteBehindQueue = None, itinerary_cache: ItineraryCache = None,
+                 single_flight: SingleFlight = None, response_builder: ResponseBuilder = None,
+                 business_ranker: BusinessRanker = None, speculative_generation: bool = GEMINI_SPECULATIVE_ENABLED):
         self.request_body = request_body
+        self.accounting_queue = accounting_queue
+        self.itinerary_cache = itinerary_cache
+        self.single_flight = single_flight
+        # the state of this request - the validation errors and the prompt sections
         self.data_validator = DataValidator()
-        self.response_builder = ResponseBuilder()
         self.prompt_builder = PromptBuilder()
-        self.db_resource = MongoDBResource()
+        # the stateless components, shared by the requests of the process if given (see ServiceContainer)
+        self.response_builder = response_builder if response_builder is not None else ResponseBuilder()
+        self.business_ranker = business_ranker if business_ranker is not None else BusinessRanker()
+        self.db_resource = db_resource if db_resource is not None else MongoDBResource()
         self.required_request_keys = {}
         self.optional_request_keys = {}
+        # the country of this request, resolved once from its country code
+        self.country = None
+        self.request_timer = RequestTimer("build_trip")
+        # the generative AI calls of this request
+        self.generation_calls = 0
+        # the first attempt launches concurrent generations and takes the first valid itinerary
+        self.speculative_generation = speculative_generation
 
     def verify_request_keys(self) -> None:
         """the function go over the expected headers,
@@ -79,19 +120,23 @@ class UserService:
 
         return optional_headers
 
+    def get_country(self) -> Country:
+        """
+        the country of the request - resolved once from the country code, and used by the whole request.
+        raises CountryNameError for an unknown country code.
+        :return: the country code and name
+        """
+        if self.country is None:
+            self.country = shared_country_table.resolve_country_code(self.required_request_keys.get('country-code'))
+        return self.country
+
     def get_recommendations_from_db(self):
         """
         get the recommendations from the business DB according to the user search.
-        return: the match lines recommendations from the business DB
+        return: the top ranked match lines recommendations from the business DB
         """
 
-        try:  # try to get the country name from the country code
-            c_name = country_alpha2_to_country_name(self.required_request_keys.get('country-code'),
-                                                    cn_name_format="default")
-        except Exception as e:
-            raise CountryNameError(f"Could not get country name from country code: "
-                                   f"{self.required_request_keys.get('country-code')}", 400)
-        user_properties = {'country': c_name,
+        user_properties = {'country': self.get_country().name,
                            'interest-points': self.required_request_keys.get("interest-points")}
         if self.optional_request_keys.get('city'):
             user_properties['city'] = self.optional_request_keys.get('city')
@@ -100,21 +145,24 @@ class UserService:
         if self.optional_request_keys.get('accommodation_type'):
             user_properties['accommodation_type'] = self.optional_request_keys.get('accommodation_type')
         lines = self.db_resource.get_match_business_to_user_search(user_properties)
-
-        return lines
+        # offer only the top ranked businesses that fit the token budget of the prompt
+        return self.business_ranker.select(lines, user_properties)
 
     @staticmethod
     def convert_ai_response_to_json(response) -> dict[str, any]:
         """ the function gets the raw response from the generative AI,
-        and converts it to a JSON format.
+        and converts it to a JSON format - tolerantly: the markdown code fences are stripped and the complete days of
+        a truncated itinerary are recovered.
         if the conversion fails, the function will raise an error.
         """
 
         response_text = response.text
-        try:
-            response_in_json = json.loads(response_text)
-        except json.JSONDecodeError:
+        response_in_json, recovery = IncrementalItineraryParser.parse_text(response_text)
+        if response_in_json is None:
+            JSON_PARSE_FAILURES.inc()
             raise ConvertAIResponseToJsonError(f"Could not convert AI response to JSON: {response_text}", 500)
+        if recovery is not None:
+            JSON_RECOVERED_RESPONSES.inc(reason=recovery)
         return response_in_json
 
     def perform_second_request_with_errors_identification(self, errors_identification: list[str],
@@ -177,43 +225,14 @@ class UserService:
         """ the function gets the itinerary that has been built and the recommendations that has been proposed to
         build it, and returns the IDs of the business that has been published in the itinerary
         """
-        published_business_ids = []
-        flag_line_found = False
-        for line in recommendations:
-            for day_itinerary in trip_itinerary.trip_itinerary:
-                if self.check_if_business_exists_in_day_recommendations(line.get("business_name"), day_itinerary):
-                    published_business_ids.append(line.get("_id"))
-                    flag_line_found = True
-                    break
-                if flag_line_found:
-                    break
-        return published_business_ids
+        matches = PublishedBusinessMatcher(trip_itinerary).match_recommendations(recommendations)
+        for match in matches:
+            logger.info(f"UsersService: business {match['business_name']} ({match['business_id']}) was published as "
+                        f"{match['matched_name']} in {match['positions']}")
+        return [match["business_id"] for match in matches]
 
-    def check_if_business_exists_in_day_recommendations(self, business_name, day_recommendations) -> bool:
-        """
-        the function checks if the business name exists in the day recommendations
-        :param business_name: the name of the business
-        :param day_recommendations: the recommendations of the day
-        :return: True if the business name exists in the day recommendations, False otherwise
-        """
-        for content in day_recommendations.morning_activity:
-            if content.content_name.lower() == business_name.lower():
-                return True
-        for content in day_recommendations.afternoon_activity:
-            if content.content_name.lower() == business_name.lower():
-                return True
-        for content in day_recommendations.evening_activity:
-            if content.content_name.lower() == business_name.lower():
-                return True
-        for restaurant in day_recommendations.restaurants_recommendations:
-            if restaurant.restaurant_name.lower() == business_name.lower():
-                return True
-        for accommodation in day_recommendations.accommodation_recommendations:
-            if accommodation.accommodation_name.lower() == business_name.lower():
-                return True
-        return False
-
-    def update_db_regarding_itinerary(self, trip_itinerary: GeneratedTrip, json_itinerary: json, recommendations: Any) -> Any:
+    def update_db_regarding_itinerary(self, trip_itinerary: GeneratedTrip, json_itinerary: json, recommendations: Any,
+                                      cache_key: str = None) -> Any:
         """the function manages the update process i the different collection after a trip has been built.
             - the itinerary with hos properties will be saved to the generated-trips collection
             - the sites that have been published in the itinerary will be updated in the business DB
@@ -221,31 +240,33 @@ class UserService:
         :arg json_itinerary: the itinerary that has been built as the original json
         :arg trip_itinerary: the itinerary that has been built
         :arg recommendations: the recommendations that has been proposed to build the prompt
+        :arg cache_key: the itinerary cache key of the trip request, saved with the trip
         {
             "destination": string, (concat the country, area and city if exist)
             "duration": String,
             "body": Json, (the AI response json model)
             "business_id": list[String] (the IDs of the business that has been published in the trip)
+            "cache_key": String,
+            "created_at": datetime
         }
         """
         # first - find the business that has been published in the itinerary
         published_business_ids = self.get_published_business_ids_from_itinerary(trip_itinerary, recommendations)
-        try:  # try to get the country name from the country code
-            c_name = country_alpha2_to_country_name(self.required_request_keys.get('country-code'),
-                                                    cn_name_format="default")
-        except Exception as e:
-            raise CountryNameError(f"Could not get country name from country code: "
-                                   f"{self.required_request_keys.get('country-code')}", 400)
         # save the itinerary to the generated-trips collection
-        itinerary_data_dict = {"destination": c_name,
+        itinerary_data_dict = {"destination": self.get_country().name,
                                "duration": self.required_request_keys.get('duration'),
-                               "body": trip_itinerary,
-                               "business_id": published_business_ids
+                               "body": json_itinerary,
+                               "business_id": published_business_ids,
+                               "cache_key": cache_key,
+                               "created_at": datetime.datetime.now(datetime.timezone.utc)
                                }
-        trip_id = self.db_resource.add_new_generated_trip(json_itinerary)
-        # update the business and clients DBs:
-        for business_id in published_business_ids:
-            self.db_resource.updates_credits_and_appearance_counter(business_id)
+        trip_id = self.db_resource.add_new_generated_trip(itinerary_data_dict)
+        # update the business and clients DBs - in the background if a write-behind queue is used:
+        published_businesses = [line for line in recommendations if line.get("_id") in published_business_ids]
+        if self.accounting_queue is not None:
+            self.accounting_queue.submit(published_businesses)
+        else:
+            self.db_resource.apply_itinerary_accounting(published_businesses)
         return trip_id
 
     @staticmethod
@@ -268,21 +289,41 @@ class UserService:
         - verify Json format
         - verify that all expected fields exist in the response and contain data
         - verify that all the data is valid
+        - repair only the invalid entries (when the rest of the itinerary is valid) instead of regenerating it
         """
         attempt_counter = 0
-        while attempt_counter < 7:
-            # build the prompt
-            ready_prompt = (self.prompt_builder
-                            .with_required_keys(self.required_request_keys)
-                            .with_optional_keys(self.optional_request_keys)
-                            .with_optional_business_recommendations(recommendations))
-            if len(self.data_validator.errors) > 0:
-                ready_prompt = (self.prompt_builder
-                                .with_error_identification(self.data_validator.errors))
-            ready_prompt = ready_prompt.build()
+        json_itinerary = None
+        # the request sections of the prompt are assembled once, a retry only adds the errors it found
+        self.prompt_builder = (self.prompt_builder
+                               .with_required_keys(self.required_request_keys)
+                               .with_optional_keys(self.optional_request_keys)
+                               .with_country_name(self.get_country().name)
+                               .with_optional_business_recommendations(recommendations))
+        while attempt_counter < MAX_ITINERARY_ATTEMPTS:
+            attempt_counter += 1
+            if json_itinerary is not None and self.data_validator.invalid_entries:
+                # repair mode - keep the valid entries and regenerate and re-validate only the invalid ones
+                if self.repair_invalid_entries(json_itinerary, c_name):
+                    return json_itinerary
+                logger.info(f"UsersService: repaired itinerary is not valid yet, found errors:\n"
+                            f"{self.data_validator.errors}\n")
+                continue
+            # build the prompt - with the errors that were found in the previous attempt
+            errors = self.data_validator.errors
+            self.data_validator.errors = {}
+            self.data_validator.invalid_entries = []
+            ready_prompt = self.prompt_builder.with_error_identification(errors).build()
+            if attempt_counter == 1 and self.speculative_generation:
+                json_itinerary, is_valid = self.get_speculative_itinerary(ready_prompt, c_name)
+                if is_valid:
+                    return json_itinerary
+                continue
             # generate response from the generative AI
-            generative_ai_resource = GenerativeAIResource(ready_prompt)
-            raw_itinerary = generative_ai_resource.get_generative_ai_response()
+            GEMINI_ATTEMPTS.inc(mode="full")
+            self.generation_calls += 1
+            generative_ai_resource = GenerativeAIResource(ready_prompt, response_schema=GeneratedTrip)
+            with self.request_timer.stage("gemini"):
+                raw_itinerary = generative_ai_resource.get_generative_ai_response()
             logger.info(f"UsersService: got raw itinerary from generative AI: {raw_itinerary.text}\n")
             try:  # try to convert to valid Json
                 json_itinerary = self.convert_ai_response_to_json(raw_itinerary)
@@ -291,22 +332,237 @@ class UserService:
                             f" couldn't convert to valid JSON,\n trying to perform another request\n")
                 self.data_validator.errors[INVALID_JSON_STR] = ("The content of the previous response is not a Valid "
                                                                 "JSON.")
+                json_itinerary = None
                 continue
             logger.info(f"UsersService: got raw itinerary from generative AI: {json_itinerary}\n")
             # exact the number of requested days from the request body
-            num_days = int(list(filter(lambda x: x.isdigit(), self.required_request_keys.get('duration').split()))[0])
-            if not self.data_validator.verify_all_fields_contain_data(json_itinerary, num_days) or \
-                    not self.data_validator.verify_valid_raw_itinerary(json_itinerary, c_name):
+            num_days = self.get_requested_days()
+            if isinstance(json_itinerary, dict) and 0 < len(json_itinerary.get('trip_itinerary') or []) < num_days:
+                # a truncated (or a too short) itinerary - keep the complete days and generate only the missing ones
+                json_itinerary = self.complete_missing_days(json_itinerary, num_days)
+            with self.request_timer.stage("validation"):
+                is_valid = self.data_validator.verify_all_fields_contain_data(json_itinerary, num_days) and \
+                    self.data_validator.verify_valid_raw_itinerary(json_itinerary, c_name)
+            if not is_valid:
                 logger.info(f"UsersService: first raw itinerary is not valid: {raw_itinerary},"
                             f" found errors:\n{self.data_validator.errors}\n, trying to perform another request\n")
+                self.record_validation_failures()
+                if not self.data_validator.invalid_entries:
+                    # the itinerary structure itself is not valid - it can't be repaired
+                    json_itinerary = None
             else:
                 return json_itinerary
-            self.data_validator.errors = {}
-            attempt_counter += 1
         raise CouldNotGetValidResponseFromThirdParty("Could not get a valid response from the generative AI", 500)
 
-    def build_trip(self) -> 'ResponseBuilder':
-        logger.info(f"UsersService: build_trip method called with headers: {self.request_body}\n")
+    def get_speculative_itinerary(self, prompt: str, c_name: str) -> tuple[Any, bool]:
+        """the speculative first attempt - launch concurrent generations of the prompt, validate the responses as they
+        arrive and take the first valid itinerary (the rest of the generations are cancelled).
+        once there is a repairable itinerary, only the responses that have already arrived are validated (a repair is
+        faster than waiting for the slowest generation). when none of them is valid, the validator is left with the
+        errors of the best response for the next attempt - the repairable itinerary with the fewest invalid entries,
+        or else the last errors.
+        :return: the itinerary (None if there is no repairable itinerary) and whether it is valid"""
+
+        num_days = self.get_requested_days()
+        speculative_generation = SpeculativeGeneration(prompt, response_schema=GeneratedTrip)
+        launched = speculative_generation.start()
+        GEMINI_ATTEMPTS.inc(launched, mode="speculative")
+        self.generation_calls += launched
+        best_itinerary, best_errors, best_invalid_entries = None, {}, []
+        winner = None
+        responses = speculative_generation.responses()
+        try:
+            while winner is None:
+                if best_itinerary is not None and not speculative_generation.has_arrived_response():
+                    break
+                with self.request_timer.stage("gemini"):
+                    raw_itinerary = next(responses, None)
+                if raw_itinerary is None:
+                    break
+                self.data_validator.errors = {}
+                self.data_validator.invalid_entries = []
+                try:
+                    json_itinerary = self.convert_ai_response_to_json(raw_itinerary)
+                except ConvertAIResponseToJsonError:
+                    logger.info(f"UsersService: a speculative itinerary is not a valid JSON: {raw_itinerary}\n")
+                    if best_itinerary is None:
+                        best_errors = {INVALID_JSON_STR: "The content of the previous response is not a Valid JSON."}
+                    continue
+                with self.request_timer.stage("validation"):
+                    is_valid = self.data_validator.verify_all_fields_contain_data(json_itinerary, num_days) and \
+                        self.data_validator.verify_valid_raw_itinerary(json_itinerary, c_name)
+                if is_valid:
+                    winner = raw_itinerary
+                    return json_itinerary, True
+                logger.info(f"UsersService: a speculative itinerary is not valid, found errors:\n"
+                            f"{self.data_validator.errors}\n")
+                self.record_validation_failures()
+                invalid_entries = self.data_validator.invalid_entries
+                if invalid_entries and (best_itinerary is None or len(invalid_entries) < len(best_invalid_entries)):
+                    best_itinerary, best_errors, best_invalid_entries = (json_itinerary, self.data_validator.errors,
+                                                                         invalid_entries)
+                elif best_itinerary is None:
+                    best_errors = self.data_validator.errors
+        finally:
+            speculative_generation.finish(winner)
+        self.data_validator.errors = best_errors
+        self.data_validator.invalid_entries = best_invalid_entries
+        return best_itinerary, False
+
+    def build_continuation_prompt(self, days: list[dict[str, Any]], missing_days: int,
+                                  errors: dict[str, str] = None) -> str:
+        """the prompt of only the days that are missing after the planned days, with the sites of the planned days
+        excluded (the generated days are numbered after the planned ones by the caller).
+        :param errors: the errors that were found in the previous attempt"""
+
+        planned_sites = [DataValidator.get_content_name(content)
+                         for content in DataValidator.get_itinerary_entries(days)]
+        return (PromptBuilder()
+                .with_required_keys({**self.required_request_keys, 'duration': f"{missing_days} days"})
+                .with_optional_keys(self.optional_request_keys)
+                .with_country_name(self.get_country().name)
+                .with_optional_business_recommendations(self.prompt_builder.optional_business_recommendations)
+                .with_error_identification({**(errors or {}),
+                                            (f"days 1-{len(days)} are already planned with the sites "
+                                             f"{planned_sites}, do not repeat them"): "already planned days"})
+                .build())
+
+    def complete_missing_days(self, json_itinerary: dict[str, Any], num_days: int) -> dict[str, Any]:
+        """ask the generative AI only for the days that are missing at the end of the itinerary, with the sites of
+        the complete days excluded.
+        :return: the itinerary with the generated missing days appended"""
+
+        days = json_itinerary['trip_itinerary']
+        missing_days = num_days - len(days)
+        logger.info(f"UsersService: generating the {missing_days} missing days of the itinerary\n")
+        continuation_prompt = self.build_continuation_prompt(days, missing_days)
+        GEMINI_ATTEMPTS.inc(mode="continue")
+        self.generation_calls += 1
+        with self.request_timer.stage("gemini"):
+            raw_continuation = GenerativeAIResource(continuation_prompt,
+                                                    response_schema=GeneratedTrip).get_generative_ai_response()
+        try:
+            continuation = self.convert_ai_response_to_json(raw_continuation)
+        except ConvertAIResponseToJsonError:
+            return json_itinerary
+        if not isinstance(continuation, dict):
+            return json_itinerary
+        for day_itinerary in (continuation.get('trip_itinerary') or [])[:missing_days]:
+            day_itinerary['day'] = len(days) + 1
+            days.append(day_itinerary)
+        return json_itinerary
+
+    @staticmethod
+    def get_entries_positions(json_itinerary: dict[str, Any], entries: list[dict[Any, Any]]) -> list[dict[str, Any]]:
+        """find the position (day number, part and index) of each of the entries in the itinerary.
+        :return: list of {"day": int, "part": str, "index": int, "entry": dict} in the itinerary order"""
+
+        positions = []
+        for day_number, day_itinerary in enumerate(json_itinerary['trip_itinerary'], start=1):
+            for part in DataValidator.ITINERARY_PART_KEYS:
+                for index, content in enumerate(day_itinerary.get(part) or []):
+                    if any(content is entry for entry in entries):
+                        positions.append({"day": day_number, "part": part, "index": index, "entry": content})
+        return positions
+
+    @staticmethod
+    def splice_replacements(json_itinerary: dict[str, Any], replacements: Any,
+                            positions: list[dict[str, Any]]) -> list[dict[Any, Any]]:
+        """put the replacement entries in the positions of the invalid entries.
+        replacements for positions that were not requested are ignored, and so are entries that don't fit the model
+        of their part (the position stays invalid for the next attempt).
+        :return: the new entries that have been spliced into the itinerary"""
+
+        requested_positions = {(position["day"], position["part"], position["index"]) for position in positions}
+        new_entries = []
+        if not isinstance(replacements, dict) or not isinstance(replacements.get("replacements"), list):
+            return new_entries
+        for replacement in replacements["replacements"]:
+            if not isinstance(replacement, dict):
+                continue
+            try:
+                position = (int(replacement.get("day")), replacement.get("part"), int(replacement.get("index")))
+            except (TypeError, ValueError):
+                continue
+            if position not in requested_positions:
+                continue
+            day_number, part, index = position
+            entry_field, entry_model = REPLACEMENT_FIELD_BY_PART[part]
+            entry = replacement.get(entry_field)
+            if not isinstance(entry, dict):
+                continue
+            try:
+                entry_model.model_validate(entry)
+            except ValidationError as e:
+                logger.info(f"UsersService: the replacement of day {day_number} {part} {index} doesn't fit the "
+                            f"{entry_model.__name__} model: {e}\n")
+                continue
+            json_itinerary['trip_itinerary'][day_number - 1][part][index] = entry
+            requested_positions.remove(position)
+            new_entries.append(entry)
+        return new_entries
+
+    def repair_invalid_entries(self, json_itinerary: dict[str, Any], c_name: str) -> bool:
+        """ask the generative AI to replace only the invalid entries of the itinerary (with a compact prompt that
+        holds the invalid entries and the found errors), splice the answers back and re-validate only them.
+        :return: True if the itinerary is valid after the repair, False otherwise"""
+
+        positions = self.get_entries_positions(json_itinerary, self.data_validator.invalid_entries)
+        logger.info(f"UsersService: repairing {len(positions)} invalid entries of the itinerary\n")
+        repair_prompt = (self.prompt_builder
+                         .with_error_identification(self.data_validator.errors)
+                         .build_repair_prompt(positions))
+        GEMINI_ATTEMPTS.inc(mode="repair")
+        self.generation_calls += 1
+        with self.request_timer.stage("gemini"):
+            raw_replacements = GenerativeAIResource(repair_prompt,
+                                                    response_schema=ItineraryRepair).get_generative_ai_response()
+        try:
+            replacements = self.convert_ai_response_to_json(raw_replacements)
+        except ConvertAIResponseToJsonError:
+            logger.info(f"UsersService: repair response is not a valid JSON: {raw_replacements.text}\n")
+            self.data_validator.errors = {INVALID_JSON_STR: "The content of the previous response is not a Valid JSON."}
+            return False
+        new_entries = self.splice_replacements(json_itinerary, replacements, positions)
+        # the entries that were not replaced are still invalid, and only the new entries are validated
+        self.data_validator.errors = {}
+        self.data_validator.invalid_entries = [
+            position["entry"] for position in positions
+            if json_itinerary['trip_itinerary'][position["day"] - 1][position["part"]][position["index"]]
+            is position["entry"]]
+        with self.request_timer.stage("validation"):
+            self.data_validator.validate_entries_concurrently(new_entries, c_name)
+        if self.data_validator.invalid_entries:
+            self.record_validation_failures()
+            return False
+        return True
+
+    def record_validation_failures(self) -> None:
+        """count the errors of the last validation by their type"""
+        for error_type in self.data_validator.errors.values():
+            VALIDATION_FAILURES.inc(error_type=error_type)
+
+    def is_cache_bypassed(self) -> bool:
+        return str(self.request_body.get(NEW_TRIP_BYPASS_CACHE_PROPERTY, "false")).lower() == "true"
+
+    def get_cached_itinerary(self, cache_key: str) -> Any:
+        """return the cached itinerary of the trip request, or None if there is no cache,
+        the request asked to bypass it or there is no cached itinerary"""
+
+        if self.itinerary_cache is None:
+            return None
+        if self.is_cache_bypassed():
+            self.itinerary_cache.record_bypass()
+            return None
+        return self.itinerary_cache.get(cache_key, self.db_resource)
+
+    def get_requested_days(self) -> int:
+        return int(list(filter(lambda x: x.isdigit(), self.required_request_keys.get('duration').split()))[0])
+
+    def prepare_trip_request(self) -> tuple[str, Any, str]:
+        """validate the request and resolve everything that is needed to generate the trip.
+        :return: the country name, the recommendations from the business DB and the itinerary cache key"""
+
         # first - validate that all the expected headers exist in the request
         try:
             self.verify_request_keys()
@@ -315,19 +571,193 @@ class UserService:
         # build a dict of the relevant headers for the prompt
         self.required_request_keys = self.get_required_properties_dict()
         self.optional_request_keys = self.get_optional_keys_dict()
-        try:  # try to get the country name from the country code
-            c_name = country_alpha2_to_country_name(self.required_request_keys.get('country-code'),
-                                                    cn_name_format="default")
-        except CouldNotGetValidResponseFromThirdParty as e:
-            raise e
+        # resolve the country of the request (an unknown country code fails the request with 400)
+        c_name = self.get_country().name
         # get optional lines recommendations from the business DB
-        recommendations = self.get_recommendations_from_db()
+        with self.request_timer.stage("get_recommendations"):
+            recommendations = self.get_recommendations_from_db()
+        cache_key = ItineraryCache.get_cache_key(self.required_request_keys, self.optional_request_keys,
+                                                 recommendations)
+        return c_name, recommendations, cache_key
+
+    def build_trip(self) -> 'ResponseBuilder':
+        logger.info(f"UsersService: build_trip method called with headers: {self.request_body}\n")
+        json_itinerary, _ = self.generate_trip()
+        # build the response and return it
+        with self.request_timer.stage("build_response"):
+            response = self.response_builder.build_business_response(json_itinerary['trip_itinerary'], 200,
+                                                                     "trip_itinerary")
+        self.request_timer.log_summary()
+        return response
+
+    def generate_trip(self) -> tuple[dict[str, Any], Any]:
+        """generate (or take from the cache) a valid itinerary of the trip request, and save it.
+        :return: the json itinerary and the ID of the saved trip"""
+
+        c_name, recommendations, cache_key = self.prepare_trip_request()
+        # serve a validated itinerary of an identical request from the cache if exists
+        with self.request_timer.stage("cache_lookup"):
+            json_itinerary = self.get_cached_itinerary(cache_key)
+        if json_itinerary is None:
+            json_itinerary = self.get_coalesced_itinerary(cache_key, recommendations, c_name)
+        # if the data is valid - trigger the required updates in the DBs (a cached itinerary is charged too)
+        with self.request_timer.stage("update_db"):
+            trip_itinerary = self.build_trip_itinerary_response(json_itinerary)
+            trip_id = self.update_db_regarding_itinerary(trip_itinerary, json_itinerary, recommendations, cache_key)
+        return json_itinerary, trip_id
+
+    def get_coalesced_itinerary(self, cache_key: str, recommendations: Any, c_name: str) -> dict[str, Any]:
+        """generate a valid itinerary - concurrent identical requests (the same cache key) wait on a single
+        generation and share its validated itinerary, each of them is still saved and charged as its own trip.
+        :return: the json itinerary"""
+
+        if self.single_flight is None or self.is_cache_bypassed():
+            json_itinerary, _ = self.generate_and_cache_itinerary(cache_key, recommendations, c_name)
+            return json_itinerary
+        is_leader = False
+
+        def generate():
+            nonlocal is_leader
+            is_leader = True
+            return self.generate_and_cache_itinerary(cache_key, recommendations, c_name)
+
+        try:
+            (json_itinerary, generation_calls), shared = self.single_flight.do(
+                cache_key, generate, timeout=ITINERARY_COALESCING_WAIT_SECONDS)
+        except TimeoutError:
+            COALESCED_REQUESTS.inc(outcome="timeout")
+            raise CouldNotGetValidResponseFromThirdParty("An identical trip is being generated and did not finish in "
+                                                         "time, please try again later", 504)
+        except Exception as e:
+            if not is_leader:  # the identical request failed
+                COALESCED_REQUESTS.inc(outcome="error")
+            raise e
+        if not shared:
+            return json_itinerary
+        COALESCED_REQUESTS.inc(outcome="shared")
+        GEMINI_CALLS_SAVED.inc(generation_calls)
+        logger.info(f"UsersService: shared the itinerary of an identical in-flight request, saved {generation_calls} "
+                    f"generative AI calls")
+        return copy.deepcopy(json_itinerary)
+
+    def generate_and_cache_itinerary(self, cache_key: str, recommendations: Any,
+                                     c_name: str) -> tuple[dict[str, Any], int]:
+        """:return: a valid itinerary and the number of the generative AI calls it took"""
         try:
             json_itinerary = self.get_a_valid_itinerary(recommendations, c_name)
         except CouldNotGetValidResponseFromThirdParty as e:
             raise e
-        # if the data is valid - first, trigger the required updates in the DBs,
-        trip_itinerary = self.build_trip_itinerary_response(json_itinerary)
-        self.update_db_regarding_itinerary(trip_itinerary, json_itinerary, recommendations)
-        # and secondly - build the response and return it
-        return self.response_builder.build_business_response(json_itinerary['trip_itinerary'], 200, "trip_itinerary")
+        if self.itinerary_cache is not None:
+            self.itinerary_cache.set(cache_key, json_itinerary)
+        return json_itinerary, self.generation_calls
+
+    def is_async_request(self) -> bool:
+        return str(self.request_body.get(NEW_TRIP_ASYNC_PROPERTY, "false")).lower() == "true"
+
+    def get_trip_request_key(self) -> str:
+        """validate the request (without generating it) and return the key of identical trip requests - used to
+        deduplicate the background jobs
+        :return: the request key"""
+
+        try:
+            self.verify_request_keys()
+        except MissingExpectedKeyInRequestBodyError as e:
+            raise e
+        self.required_request_keys = self.get_required_properties_dict()
+        self.optional_request_keys = self.get_optional_keys_dict()
+        # fail fast on an unknown country code, before the job is queued
+        self.get_country()
+        return ItineraryCache.get_cache_key(self.required_request_keys, self.optional_request_keys, [])
+
+    def validate_streamed_day(self, day_itinerary: dict[str, Any], c_name: str) -> bool:
+        """validate a single day of a streamed itinerary - the keys, that all the fields contain data and the
+        locations of the day contents"""
+
+        return (self.data_validator.validate_require_keys_in_day_itinerary(day_itinerary)
+                and self.data_validator.verify_all_fields_contain_data_in_day_itinerary(day_itinerary)
+                and self.data_validator.validate_data_in_day_itinerary(day_itinerary, c_name))
+
+    def generate_valid_days_stream(self, recommendations, c_name):
+        """stream the itinerary from the generative AI and yield each day as soon as it is complete and valid.
+        when a day is not valid, the stream is dropped and a new one is requested with the found errors,
+        the days that have already been yielded are kept - the new stream is only of the missing days (and the sites
+        of the kept days are excluded from it)."""
+
+        num_days = self.get_requested_days()
+        valid_days = []
+        attempt_counter = 0
+        self.prompt_builder = (self.prompt_builder
+                               .with_required_keys(self.required_request_keys)
+                               .with_optional_keys(self.optional_request_keys)
+                               .with_country_name(self.get_country().name)
+                               .with_optional_business_recommendations(recommendations))
+        while attempt_counter < MAX_ITINERARY_ATTEMPTS:
+            # build the prompt - with the errors of the previous attempt if exist, and only of the missing days
+            errors = self.data_validator.errors
+            self.data_validator.errors = {}
+            if valid_days:
+                prompt = self.build_continuation_prompt(valid_days, num_days - len(valid_days), errors)
+            else:
+                prompt = self.prompt_builder.with_error_identification(errors).build()
+            parser = IncrementalItineraryParser()
+            flag_invalid_day = False
+            GEMINI_ATTEMPTS.inc(mode="stream")
+            self.generation_calls += 1
+            for chunk in GenerativeAIResource(prompt, response_schema=GeneratedTrip).get_generative_ai_stream():
+                for day_itinerary in parser.feed(chunk):
+                    if not self.validate_streamed_day(day_itinerary, c_name):
+                        logger.info(f"UsersService: streamed day {len(valid_days) + 1} is not valid, found errors:"
+                                    f"\n{self.data_validator.errors}\n, trying to perform another request\n")
+                        self.record_validation_failures()
+                        flag_invalid_day = True
+                        break
+                    day_itinerary['day'] = len(valid_days) + 1
+                    valid_days.append(day_itinerary)
+                    yield day_itinerary
+                    if len(valid_days) == num_days:
+                        return
+                if flag_invalid_day:
+                    break
+            if not flag_invalid_day:
+                self.data_validator.errors[INCORRECT_DAYS_NUMBER_STR] = errorsType.INVALID_FORMAT.value
+            attempt_counter += 1
+        raise CouldNotGetValidResponseFromThirdParty("Could not get a valid response from the generative AI", 500)
+
+    def build_trip_stream(self):
+        """the streaming variant of build_trip - the request is validated eagerly (so the errors are raised before
+        the response starts), and the returned generator yields the events of the trip:
+        {"event": "day", "day": <day itinerary>} for each valid day as soon as it is generated,
+        and a final {"event": "done", "trip_id": <id>} (or {"event": "error", ...})"""
+
+        logger.info(f"UsersService: build_trip_stream method called with headers: {self.request_body}\n")
+        self.request_timer = RequestTimer("build_trip_stream")
+        c_name, recommendations, cache_key = self.prepare_trip_request()
+        return self.stream_trip_events(c_name, recommendations, cache_key)
+
+    def stream_trip_events(self, c_name: str, recommendations: Any, cache_key: str):
+        start_time = time.perf_counter()
+        time_to_first_day_ms = None
+        json_itinerary = self.get_cached_itinerary(cache_key)
+        days_source = json_itinerary['trip_itinerary'] if json_itinerary is not None \
+            else self.generate_valid_days_stream(recommendations, c_name)
+        days = []
+        try:
+            for day_itinerary in days_source:
+                if time_to_first_day_ms is None:
+                    time_to_first_day_ms = (time.perf_counter() - start_time) * 1000
+                    logger.info(f"UsersService: time to first day: {time_to_first_day_ms:.0f} ms")
+                days.append(day_itinerary)
+                yield {"event": "day", "day": day_itinerary}
+        except CouldNotGetValidResponseFromThirdParty as e:
+            yield {"event": "error", "error": e.error_string, "status_code": e.error_status_code}
+            return
+        if json_itinerary is None:
+            json_itinerary = {"trip_itinerary": days}
+            if self.itinerary_cache is not None:
+                self.itinerary_cache.set(cache_key, json_itinerary)
+        with self.request_timer.stage("update_db"):
+            trip_itinerary = self.build_trip_itinerary_response(json_itinerary)
+            trip_id = self.update_db_regarding_itinerary(trip_itinerary, json_itinerary, recommendations, cache_key)
+        self.request_timer.log_summary()
+        yield {"event": "done", "trip_id": str(trip_id), "time_to_first_day_ms": time_to_first_day_ms,
+               "total_time_ms": (time.perf_counter() - start_time) * 1000}
@@ -0,0 +1,29 @@
+import sys
+sys.path.append("../")
+
+import pytest
+
+from src.resources.mongo_client_pool import MongoClientPool
+from src.resources.mongo_db_resource import MongoDBResource
+from tests.helpers import make_day
+
+
+@pytest.fixture
+def db_resource():
+    """a MongoDBResource backed by an in-memory mongomock client"""
+    mongomock = pytest.importorskip("mongomock")
+    client_pool = MongoClientPool("mongodb://localhost", health_check_interval=0,
+                                  client_factory=mongomock.MongoClient)
+    yield MongoDBResource(client_pool)
+    client_pool.close()
+
+
+@pytest.fixture
+def trip_request():
+    return {"budget": "Moderate", "season": "summer", "participants": "couple", "duration": "2 days",
+            "country-code": "IT", "interest-points": "food,history"}
+
+
+@pytest.fixture
+def json_itinerary():
+    return {"trip_itinerary": [make_day(1), make_day(2)]}
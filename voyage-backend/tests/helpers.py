@@ -0,0 +1,32 @@
+"""the builders of the test data that are shared by the test modules"""
+
+
+def add_business(db_resource, name, credits_bought, credits_spent, interest_points, country="Italy", **fields):
+    client_id = db_resource.add_new_business_client({"business_contact_person": "owner",
+                                                     "business_contact_person_phone": "050",
+                                                     "credits_bought": credits_bought,
+                                                     "credits_spent": credits_spent})
+    business = {"business_client_id": client_id, "business_name": name, "business_type": "restaurant",
+                "business_phone": "050", "business_email": "a@b.c", "business_country": country,
+                "business_match_interest_points": interest_points, "business_description": "nice",
+                "appearance_counter": 0, "business_latitude": "41.9", "business_longitude": "12.5"}
+    business.update(fields)
+    return db_resource.add_new_business(business)
+
+
+def make_day(day: int, name_prefix: str = "Site") -> dict:
+    return {"day": day,
+            "morning_activity": [{"content_name": f"{name_prefix} {day} morning", "content_type": "museum",
+                                  "content_description": "a museum", "content_latitude": "41.89",
+                                  "content_longitude": "12.49"}],
+            "afternoon_activity": [{"content_name": f"{name_prefix} {day} afternoon", "content_type": "park",
+                                    "content_description": "a park", "content_latitude": "41.91",
+                                    "content_longitude": "12.48"}],
+            "evening_activity": [{"content_name": f"{name_prefix} {day} evening", "content_type": "show",
+                                  "content_description": "a show", "content_latitude": "41.90",
+                                  "content_longitude": "12.47"}],
+            "restaurants_recommendations": [{"restaurant_name": f"Restaurant {day}", "restaurant_type": "pizza",
+                                             "restaurant_latitude": "41.90", "restaurant_longitude": "12.46"}],
+            "accommodation_recommendations": [{"accommodation_name": f"Hotel {day}", "accommodation_type": "hotel",
+                                               "accommodation_latitude": "41.90",
+                                               "accommodation_longitude": "12.50"}]}
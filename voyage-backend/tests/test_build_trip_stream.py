@@ -0,0 +1,102 @@
+import sys
+sys.path.append("../")
+
+import json
+import pytest
+
+from src.processors.data_validator import DataValidator
+from src.processors.incremental_itinerary_parser import IncrementalItineraryParser
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.services import user_service
+from src.services.user_service import UserService
+from tests.helpers import make_day
+
+
+def split_to_chunks(text, chunk_size=40):
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def test_incremental_parser_returns_days_as_they_complete():
+    text = json.dumps({"trip_itinerary": [make_day(1), make_day(2)]}, indent=2)
+    parser = IncrementalItineraryParser()
+    completed = [(index, day["day"]) for index, chunk in enumerate(split_to_chunks(text))
+                 for day in parser.feed(chunk)]
+    assert [day for _, day in completed] == [1, 2]
+    # the first day is returned before the whole json arrived
+    assert completed[0][0] < len(split_to_chunks(text)) // 2 + 1
+    assert parser.finished
+
+
+def test_incremental_parser_handles_braces_in_strings():
+    day = make_day(1)
+    day["morning_activity"][0]["content_description"] = 'a "quoted" {brace} ] text'
+    parser = IncrementalItineraryParser()
+    assert parser.feed('```json\n{"trip_itinerary": [' + json.dumps(day)) == [day]
+
+
+@pytest.fixture
+def streamed_responses(monkeypatch):
+    responses = []
+
+    class FakeGenerativeAIResource:
+        prompts = []
+
+        def __init__(self, message, **kwargs):
+            self.message = message
+            self.prompts.append(message)
+
+        def get_generative_ai_stream(self):
+            yield from split_to_chunks(json.dumps(responses.pop(0)))
+
+    monkeypatch.setattr(user_service, "GenerativeAIResource", FakeGenerativeAIResource)
+    return responses
+
+
+def get_service(trip_request, db_resource, monkeypatch):
+    service = UserService(trip_request, db_resource)
+    service.data_validator = DataValidator(geo_cache=GeoValidationCache())
+    monkeypatch.setattr(service.data_validator, "validate_content_location",
+                        lambda content_name, requested_country_name: not content_name.startswith("Nowhere"))
+    monkeypatch.setattr(service.data_validator, "verify_long_lat_in_country",
+                        lambda longitude, latitude, c_name: False)
+    return service
+
+
+def test_build_trip_stream(trip_request, db_resource, streamed_responses, monkeypatch):
+    streamed_responses.append({"trip_itinerary": [make_day(1), make_day(2)]})
+    events = list(get_service(trip_request, db_resource, monkeypatch).build_trip_stream())
+    assert [event["event"] for event in events] == ["day", "day", "done"]
+    assert events[0]["day"]["day"] == 1
+    assert events[-1]["time_to_first_day_ms"] is not None
+    assert db_resource.generated_trip_collection.count_documents({}) == 1
+
+
+def test_build_trip_stream_keeps_valid_days_on_retry(trip_request, db_resource, streamed_responses, monkeypatch):
+    streamed_responses.append({"trip_itinerary": [make_day(1), make_day(2, "Nowhere")]})
+    # the retry is only of the missing day
+    streamed_responses.append({"trip_itinerary": [make_day(1, "Second")]})
+    service = get_service(trip_request, db_resource, monkeypatch)
+    events = list(service.build_trip_stream())
+    days = [event["day"] for event in events if event["event"] == "day"]
+    assert [day["morning_activity"][0]["content_name"] for day in days] == ["Site 1 morning", "Second 1 morning"]
+    assert [day["day"] for day in days] == [1, 2]
+    assert events[-1]["event"] == "done"
+    retry_prompt = user_service.GenerativeAIResource.prompts[1]
+    assert "the vacation duration should be: 1 days" in retry_prompt and "Site 1 morning" in retry_prompt
+    assert service.generation_calls == 2
+
+
+def test_build_trip_stream_error_event(trip_request, db_resource, streamed_responses, monkeypatch):
+    streamed_responses.extend({"trip_itinerary": [make_day(1, "Nowhere")]} for _ in range(7))
+    events = list(get_service(trip_request, db_resource, monkeypatch).build_trip_stream())
+    assert events[-1]["event"] == "error"
+    assert events[-1]["status_code"] == 500
+
+
+def test_build_trip_stream_rejects_an_unknown_country(trip_request, db_resource, monkeypatch):
+    import main
+    monkeypatch.setattr(main.services, "get_db_resource", lambda: db_resource)
+    response = main.app.test_client().post("/api/v1/users_app/build_trip_stream",
+                                           data=dict(trip_request, **{"country-code": "ZZ"}))
+    assert response.status_code == 400
+    assert response.get_data(as_text=True) == "Could not get country name from country code: ZZ"
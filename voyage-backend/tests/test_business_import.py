@@ -0,0 +1,104 @@
+import sys
+sys.path.append("../")
+
+import io
+import json
+import pytest
+from pymongo.errors import BulkWriteError
+
+from src.helpers.error_handling import InvalidImportFormatError, CouldNotGetValidResponseFromThirdParty
+from src.processors.data_validator import DataValidator
+from src.resources.country_boundaries import CountryBoundaryIndex
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.services.business_import_service import BusinessImportService
+
+CSV_HEADER = ("business_name,business_type,business_phone,business_email,business_country,business_contact_person,"
+              "business_contact_person_phone,credits_bought,business_match_interest_points,business_latitude,"
+              "business_longitude,business_city\n")
+
+
+def make_csv_line(name, latitude="41.9", longitude="12.5", country="Italy", credits_bought="10"):
+    return (f'{name},restaurant,050-1234567,{name.lower()}@mail.com,{country},Mario,050-7654321,{credits_bought},'
+            f'"food,wineries",{latitude},{longitude},Rome\n')
+
+
+@pytest.fixture
+def import_service(db_resource, monkeypatch):
+    boundaries = CountryBoundaryIndex(path=None, grid_degrees=5, border_margin_degrees=0.05).load()
+    boundaries.load_geojson({"features": [
+        {"properties": {"ISO_A2": "IT"},
+         "geometry": {"type": "Polygon", "coordinates": [[[6, 36], [19, 36], [19, 47], [6, 47], [6, 36]]]}}]})
+    data_validator = DataValidator(geo_cache=GeoValidationCache(), country_boundaries=boundaries)
+    # the points near a border are checked with the remote reverse geocoder
+    monkeypatch.setattr(data_validator, "verify_long_lat_in_country_by_geocoder",
+                        lambda longitude, latitude, c_name: True)
+    return BusinessImportService(db_resource, data_validator, chunk_size=2)
+
+
+def test_csv_rows_are_imported_with_a_result_per_row(import_service, db_resource):
+    csv_text = (CSV_HEADER + make_csv_line("Trattoria") + make_csv_line("Paris Bistro", "48.85", "2.35")
+                + make_csv_line("Pizzeria", credits_bought="many") + make_csv_line("Unknown", country="Atlantis")
+                + make_csv_line("Border Cafe", "36.01", "12.5"))
+
+    report = import_service.import_rows(import_service.read_rows(io.StringIO(csv_text), "csv"))
+
+    assert (report["rows"], report["inserted"], report["failed"]) == (5, 2, 3)
+    assert [result["status"] for result in report["results"]] == ["inserted", "failed", "failed", "failed",
+                                                                  "inserted"]
+    assert report["results"][1]["error"] == "Long-Lat does not match the country in the request"
+    business = db_resource.business_collection.find_one({"business_name": "Trattoria"})
+    assert business["business_match_interest_points"] == ["food", "wineries"]
+    assert str(business["_id"]) == report["results"][0]["business_id"]
+    client = db_resource.business_clients_collection.find_one({"_id": business["business_client_id"]})
+    assert client["credits_bought"] == 10 and client["credits_spent"] == 0
+
+
+def test_ndjson_rows_are_imported(import_service, db_resource):
+    row = {"business_name": "Enoteca", "business_type": "bar", "business_phone": "050-1234567",
+           "business_email": "enoteca@mail.com", "business_country": "Italy", "business_contact_person": "Anna",
+           "business_contact_person_phone": "050-7654321", "credits_bought": 5,
+           "business_match_interest_points": ["wineries"], "business_latitude": 43.77, "business_longitude": 11.25}
+    ndjson_text = "\n".join([json.dumps(row), "{not a json", json.dumps({"business_name": "Missing fields"}), ""])
+
+    report = import_service.import_rows(import_service.read_rows(io.StringIO(ndjson_text), "ndjson"))
+
+    assert [result["status"] for result in report["results"]] == ["inserted", "failed", "failed"]
+    assert report["results"][1]["error"].startswith("invalid json")
+    assert report["results"][2]["error"] == "Missing Header in Request: business_type"
+    assert db_resource.business_collection.find_one({"business_name": "Enoteca"})["business_latitude"] == "43.77"
+
+
+def test_the_clients_of_the_failed_businesses_are_removed(import_service, db_resource, monkeypatch):
+    add_new_businesses = db_resource.add_new_businesses
+
+    def add_the_first_business_only(businesses):
+        add_new_businesses(businesses[:1])
+        raise BulkWriteError({"nInserted": 1, "writeErrors": [{"index": 1, "errmsg": "duplicate key"}]})
+
+    monkeypatch.setattr(db_resource, "add_new_businesses", add_the_first_business_only)
+    csv_text = CSV_HEADER + make_csv_line("Trattoria") + make_csv_line("Pizzeria")
+
+    report = import_service.import_rows(import_service.read_rows(io.StringIO(csv_text), "csv"))
+
+    assert [result["status"] for result in report["results"]] == ["inserted", "failed"]
+    assert db_resource.business_clients_collection.count_documents({}) == 1
+    assert str(db_resource.business_clients_collection.find_one()["_id"]) == \
+        report["results"][0]["business_client_id"]
+
+
+def test_import_fails_fast_without_the_country_boundaries(db_resource):
+    boundaries = CountryBoundaryIndex(path=None).load()
+    import_service = BusinessImportService(db_resource, DataValidator(geo_cache=GeoValidationCache(),
+                                                                      country_boundaries=boundaries))
+
+    with pytest.raises(CouldNotGetValidResponseFromThirdParty) as error:
+        import_service.import_rows(import_service.read_rows(io.StringIO(CSV_HEADER + make_csv_line("Cafe")), "csv"))
+    assert error.value.error_status_code == 503
+    assert db_resource.business_clients_collection.count_documents({}) == 0
+
+
+def test_import_format_by_content_type_or_extension():
+    assert BusinessImportService.get_import_format("text/csv; charset=utf-8") == "csv"
+    assert BusinessImportService.get_import_format(".jsonl") == "ndjson"
+    with pytest.raises(InvalidImportFormatError):
+        BusinessImportService.get_import_format("application/xml")
@@ -0,0 +1,38 @@
+import sys
+sys.path.append("../")
+
+from src.resources.mongo_db_resource import MongoDBResource
+from tests.helpers import add_business
+
+
+def test_match_business_to_user_search(db_resource):
+    matched_id = add_business(db_resource, "Trattoria", 5, 1, ["food", "wine"])
+    add_business(db_resource, "No Credits", 2, 2, ["food"])
+    add_business(db_resource, "Other Interest", 5, 0, ["museums"])
+    add_business(db_resource, "Other Country", 5, 0, ["food"], country="France")
+    add_business(db_resource, "Other City", 5, 0, ["food"], business_city="Milan")
+    city_id = add_business(db_resource, "Same City", 5, 0, ["history"], business_city="Rome")
+
+    lines = db_resource.get_match_business_to_user_search({"country": "Italy",
+                                                           "interest-points": ["history", " food"],
+                                                           "city": "Rome"})
+
+    assert sorted(line["_id"] for line in lines) == sorted([matched_id, city_id])
+    # only the fields that are used by the prompt and the billing are returned
+    assert "business_phone" not in lines[0]
+    assert "client" not in lines[0]
+    assert lines[0]["business_name"] in ("Trattoria", "Same City")
+
+
+def test_match_business_pipeline_optional_fields():
+    pipeline = MongoDBResource.build_match_business_pipeline({"country": "Italy", "interest-points": ["food"],
+                                                              "accommodation_type": "hotel"})
+    match_query = pipeline[0]["$match"]
+    assert match_query["business_match_interest_points"] == {"$in": ["food"]}
+    assert match_query["business_accommodation_type"] == {"$in": ["hotel", None]}
+    assert "business_city" not in match_query
+
+
+def test_ensure_indexes(db_resource):
+    db_resource.ensure_indexes()
+    assert "country_interest_points" in db_resource.business_collection.index_information()
@@ -0,0 +1,50 @@
+import sys
+sys.path.append("../")
+
+from src.processors.business_ranker import BusinessRanker
+from tests.helpers import add_business
+
+USER_SEARCH = {"country": "Italy", "interest-points": ["food", "wine"], "city": "Rome"}
+
+
+def make_business(business_id, interest_points, credits_left=5, appearance_counter=0, **fields):
+    return {"_id": business_id, "business_client_id": f"client {business_id}",
+            "business_name": f"Business {business_id}", "business_type": "restaurant", "business_country": "Italy",
+            "business_match_interest_points": interest_points, "credits_left": credits_left,
+            "appearance_counter": appearance_counter, **fields}
+
+
+def test_candidates_are_ranked_by_the_weighted_score():
+    candidates = [make_business(1, ["food"]),
+                  make_business(2, ["food", "wine"]),
+                  make_business(3, ["food", "wine"], business_city="Rome"),
+                  make_business(4, ["food", "wine"], business_city="Milan"),
+                  make_business(5, ["food", "wine"], appearance_counter=10)]
+    selected = BusinessRanker(top_k=3, token_budget=1000).select(candidates, USER_SEARCH)
+    assert [business["_id"] for business in selected] == [3, 2, 4]
+
+    # with only the credits weight, the business with the most credits left comes first
+    candidates.append(make_business(6, ["food"], credits_left=50))
+    ranker = BusinessRanker(top_k=1, weights={"interest_points": 0, "location": 0, "credits": 1, "fairness": 0})
+    assert ranker.select(candidates, USER_SEARCH)[0]["_id"] == 6
+
+
+def test_selection_fits_the_token_budget():
+    long_description = "a very long description " * 20
+    candidates = [make_business(1, ["food", "wine"], business_description=long_description),
+                  make_business(2, ["food"]),
+                  make_business(3, ["food"])]
+    short_tokens = BusinessRanker.estimate_tokens(candidates[1])
+    selected = BusinessRanker(top_k=5, token_budget=short_tokens * 2).select(candidates, USER_SEARCH)
+    # the best candidate doesn't fit the budget, so the two shorter ones are selected
+    assert [business["_id"] for business in selected] == [2, 3]
+    assert BusinessRanker().select([], USER_SEARCH) == []
+
+
+def test_match_projection_has_the_ranking_fields(db_resource):
+    add_business(db_resource, "Trattoria", 5, 2, ["food"], business_city="Rome", appearance_counter=3)
+    line = db_resource.get_match_business_to_user_search({"country": "Italy", "interest-points": ["food"]})[0]
+    assert line["credits_left"] == 3
+    assert line["appearance_counter"] == 3
+    assert line["business_city"] == "Rome"
+    assert line["business_match_interest_points"] == ["food"]
@@ -0,0 +1,63 @@
+import sys
+sys.path.append("../")
+
+import time
+import pytest
+
+from src.processors.data_validator import DataValidator, errorsType
+from src.processors.validation_engine import ValidationEngine
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.helpers.host_rate_limiter import HostRateLimiter
+from src.helpers.error_handling import ThirdPartyDataValidatorError
+from tests.helpers import make_day
+
+
+@pytest.fixture
+def data_validator(monkeypatch):
+    data_validator = DataValidator(ValidationEngine(max_workers=16, max_in_flight=16), GeoValidationCache())
+
+    def validate_content_location(content_name, requested_country_name, requested_city_name=None):
+        time.sleep(0.05)
+        if content_name == "broken":
+            raise ThirdPartyDataValidatorError("Could not get response from third party location validator", 500)
+        return not content_name.startswith("Nowhere")
+
+    monkeypatch.setattr(data_validator, "validate_content_location", validate_content_location)
+    monkeypatch.setattr(data_validator, "verify_long_lat_in_country", lambda longitude, latitude, c_name: False)
+    return data_validator
+
+
+def test_entries_are_validated_concurrently(data_validator):
+    json_itinerary = {"trip_itinerary": [make_day(day) for day in range(1, 4)]}
+    start = time.perf_counter()
+    assert data_validator.verify_valid_raw_itinerary(json_itinerary, "Italy")
+    # 15 entries of 50 ms each
+    assert time.perf_counter() - start < 0.5
+    assert data_validator.errors == {}
+    assert len(data_validator.entry_latencies) == 15
+
+
+def test_invalid_entries_errors_are_kept_in_order(data_validator):
+    json_itinerary = {"trip_itinerary": [make_day(1, "Nowhere"), make_day(2)]}
+    assert not data_validator.verify_valid_raw_itinerary(json_itinerary, "Italy")
+    invalid_errors = [error for error, error_type in data_validator.errors.items()
+                      if error_type == errorsType.INVALID_LOCATION.value]
+    assert len(invalid_errors) == 3
+    assert "Nowhere 1 morning" in invalid_errors[0]
+    assert "Nowhere 1 evening" in invalid_errors[2]
+
+
+def test_third_party_error_is_raised(data_validator):
+    day = make_day(1)
+    day["morning_activity"][0]["content_name"] = "broken"
+    with pytest.raises(ThirdPartyDataValidatorError):
+        data_validator.verify_valid_raw_itinerary({"trip_itinerary": [day]}, "Italy")
+
+
+def test_host_rate_limiter_spaces_calls():
+    rate_limiter = HostRateLimiter({"nominatim.openstreetmap.org": 20})
+    start = time.perf_counter()
+    for _ in range(4):
+        rate_limiter.acquire("https://nominatim.openstreetmap.org/reverse")
+    assert time.perf_counter() - start >= 0.15
+    assert rate_limiter.acquire("other.host") == 0.0
@@ -0,0 +1,64 @@
+import sys
+sys.path.append("../")
+
+import json
+import pytest
+
+from src.resources.country_boundaries import CountryBoundaryIndex
+from src.processors.data_validator import DataValidator
+from src.resources.geo_validation_cache import GeoValidationCache
+
+
+def square(min_lon, min_lat, max_lon, max_lat):
+    return [[min_lon, min_lat], [max_lon, min_lat], [max_lon, max_lat], [min_lon, max_lat], [min_lon, min_lat]]
+
+
+@pytest.fixture
+def boundaries_path(tmp_path):
+    geojson = {"type": "FeatureCollection", "features": [
+        # italy with a hole (san marino)
+        {"type": "Feature", "properties": {"ISO_A2": "IT"},
+         "geometry": {"type": "Polygon", "coordinates": [square(6, 36, 19, 47), square(12.3, 43.8, 12.6, 44.0)]}},
+        {"type": "Feature", "properties": {"ISO_A2": "-99", "ISO_A2_EH": "SM"},
+         "geometry": {"type": "MultiPolygon", "coordinates": [[square(12.3, 43.8, 12.6, 44.0)]]}},
+        {"type": "Feature", "properties": {"ISO_A2": "-99"},
+         "geometry": {"type": "Polygon", "coordinates": [square(30, 30, 31, 31)]}},
+    ]}
+    path = tmp_path / "boundaries.geojson"
+    path.write_text(json.dumps(geojson))
+    return str(path)
+
+
+def test_lookup_batch(boundaries_path):
+    boundaries = CountryBoundaryIndex(boundaries_path, grid_degrees=5, border_margin_degrees=0.05)
+    results = boundaries.lookup([(41.89, 12.49), (43.9, 12.45), (40.0, 25.0), (46.99, 10.0)])
+    assert results == [("IT", False), ("SM", False), (None, False), ("IT", True)]
+    assert len(boundaries.polygons) == 2
+
+
+def test_point_in_country(boundaries_path):
+    boundaries = CountryBoundaryIndex(boundaries_path, grid_degrees=5, border_margin_degrees=0.05)
+    assert boundaries.is_point_in_country("41.89", "12.49", "it") is True
+    assert boundaries.is_point_in_country(43.9, 12.45, "IT") is False
+    # near a border - can't be decided offline
+    assert boundaries.is_point_in_country(43.81, 12.45, "IT") is None
+    assert boundaries.are_points_in_country([(41.89, 12.49), (40.0, 25.0)], "IT") == [True, False]
+
+
+def test_missing_boundaries_file(tmp_path):
+    boundaries = CountryBoundaryIndex(str(tmp_path / "missing.geojson"))
+    assert not boundaries.is_available()
+    assert boundaries.is_point_in_country(41.89, 12.49, "IT") is None
+
+
+def test_data_validator_uses_the_offline_boundaries(boundaries_path, monkeypatch):
+    data_validator = DataValidator(geo_cache=GeoValidationCache(),
+                                   country_boundaries=CountryBoundaryIndex(boundaries_path))
+    geocoder_calls = []
+    monkeypatch.setattr(data_validator, "verify_long_lat_in_country_by_geocoder",
+                        lambda longitude, latitude, c_name: geocoder_calls.append((latitude, longitude)) or True)
+    assert data_validator.verify_long_lat_in_country("12.49", "41.89", "Italy")
+    assert not data_validator.verify_long_lat_in_country("25.0", "40.0", "Italy")
+    assert geocoder_calls == []
+    assert data_validator.verify_long_lat_in_country("12.45", "43.81", "Italy")
+    assert geocoder_calls == [("43.81", "12.45")]
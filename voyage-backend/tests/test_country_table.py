@@ -0,0 +1,44 @@
+import sys
+sys.path.append("../")
+
+import pytest
+
+from src.helpers.error_handling import CountryNameError
+from src.resources import country_table
+from src.resources.country_table import Country, CountryTable
+from src.services.user_service import UserService
+
+
+def test_names_and_codes_are_normalised():
+    table = CountryTable()
+
+    assert table.get_country_name("it") == "Italy"
+    assert table.get_country_code("Italy") == "IT"
+    assert table.get_country_code("  côte d’ivoire ") == "CI"
+    assert table.get_country_code("The Netherlands") == table.get_country_code("holland") == "NL"
+    assert table.get_country_code("UK") == table.get_country_code("gb") == table.get_country_code("GBR") == "GB"
+
+
+def test_unknown_countries_are_rejected():
+    table = CountryTable()
+
+    with pytest.raises(CountryNameError) as error:
+        table.get_country_name("XX")
+    assert error.value.error_status_code == 400
+    with pytest.raises(CountryNameError):
+        table.get_country_code("Atlantis")
+
+
+def test_the_request_country_is_resolved_once(db_resource, trip_request, monkeypatch):
+    resolved_codes = []
+    resolve_country_code = country_table.shared_country_table.resolve_country_code
+    monkeypatch.setattr(country_table.shared_country_table, "resolve_country_code",
+                        lambda code: resolved_codes.append(code) or resolve_country_code(code))
+    service = UserService(dict(trip_request), db_resource)
+
+    c_name, _, _ = service.prepare_trip_request()
+    service.get_recommendations_from_db()
+    service.get_trip_request_key()
+
+    assert c_name == "Italy" and service.country == Country("IT", "Italy")
+    assert resolved_codes == ["IT"]
@@ -0,0 +1,133 @@
+import sys
+sys.path.append("../")
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from src.helpers.token_bucket import TokenBucket
+from src.resources import generative_ai_resource
+from src.resources.generative_ai_resource import GenerativeAIResource, GenerativeAIQuota, LatencyTracker
+
+
+def make_response(text, total_tokens=100):
+    return SimpleNamespace(text=text,
+                           candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name="STOP"))],
+                           usage_metadata=SimpleNamespace(total_token_count=total_tokens))
+
+
+class FakeModel:
+    """returns the responses in order, each one after its delay"""
+
+    def __init__(self, delays_and_texts):
+        self.delays_and_texts = list(delays_and_texts)
+        self.calls = 0
+        self.cancelled = 0
+
+    def _next(self):
+        delay, text = self.delays_and_texts[min(self.calls, len(self.delays_and_texts) - 1)]
+        self.calls += 1
+        return delay, text
+
+    def generate_content(self, message, generation_config=None, request_options=None, stream=False):
+        delay, text = self._next()
+        if delay > request_options["timeout"]:
+            time.sleep(request_options["timeout"])
+            raise TimeoutError("Deadline Exceeded")
+        time.sleep(delay)
+        return make_response(text)
+
+    async def generate_content_async(self, message, generation_config=None, request_options=None):
+        delay, text = self._next()
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return make_response(text)
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "generative_ai_quota", GenerativeAIQuota(2, 6000))
+    monkeypatch.setattr(generative_ai_resource, "latency_tracker", LatencyTracker())
+    monkeypatch.setattr(generative_ai_resource, "GEMINI_HEDGE_DELAY_SECONDS", 0.05)
+
+
+def test_response_metadata_is_recorded(fresh_state, monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "model", FakeModel([(0, "itinerary")]))
+    resource = GenerativeAIResource("prompt", timeout=1, hedging=False)
+
+    assert resource.get_generative_ai_response().text == "itinerary"
+    assert resource._finish_reason == "STOP"
+    assert resource._total_tokens == 100
+    assert resource._latency_ms is not None
+
+
+def test_timeout_is_mapped_to_gateway_timeout(fresh_state, monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "model", FakeModel([(5, "late")]))
+
+    with pytest.raises(CouldNotGetValidResponseFromThirdParty) as error:
+        GenerativeAIResource("prompt", timeout=0.05, hedging=False).get_generative_ai_response()
+    assert error.value.error_status_code == 504
+
+
+def test_busy_quota_fails_fast(monkeypatch):
+    quota = GenerativeAIQuota(1, 6000)
+    quota.acquire(0.1)
+    with pytest.raises(CouldNotGetValidResponseFromThirdParty) as error:
+        quota.acquire(0.05)
+    assert error.value.error_status_code == 503
+    quota.release()
+    assert quota.try_acquire()
+
+
+def test_hedged_request_takes_the_faster_response(fresh_state, monkeypatch):
+    fake_model = FakeModel([(0.5, "slow"), (0, "fast")])
+    monkeypatch.setattr(generative_ai_resource, "model", fake_model)
+
+    start_time = time.perf_counter()
+    res = GenerativeAIResource("prompt", timeout=2, hedging=True).get_generative_ai_response()
+    assert res.text == "fast"
+    assert fake_model.calls == 2
+    assert time.perf_counter() - start_time < 0.5
+
+
+def test_hedging_skips_invalid_responses(fresh_state, monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "model", FakeModel([(0.2, "valid"), (0, "invalid")]))
+
+    resource = GenerativeAIResource("prompt", timeout=2, hedging=True,
+                                    response_validator=lambda res: res.text == "valid")
+    assert resource.get_generative_ai_response().text == "valid"
+
+
+def test_async_hedging_cancels_the_slower_request(fresh_state, monkeypatch):
+    fake_model = FakeModel([(1, "slow"), (0, "fast")])
+    monkeypatch.setattr(generative_ai_resource, "model", fake_model)
+
+    async def generate():
+        res = await GenerativeAIResource("prompt", timeout=2, hedging=True).get_generative_ai_response_async()
+        await asyncio.sleep(0)
+        return res
+
+    assert asyncio.run(generate()).text == "fast"
+    assert fake_model.cancelled == 1
+
+
+def test_latency_tracker_percentile():
+    tracker = LatencyTracker()
+    assert tracker.percentile(0.95, min_samples=1) is None
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+    assert tracker.percentile(0.95) == pytest.approx(0.96)
+
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=10, capacity=1)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert not bucket.acquire(timeout=0.01)
+    assert bucket.acquire(timeout=0.5)
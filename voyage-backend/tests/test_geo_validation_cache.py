@@ -0,0 +1,57 @@
+import sys
+sys.path.append("../")
+
+import time
+
+from src.processors.data_validator import DataValidator
+from src.resources.geo_validation_cache import GeoValidationCache
+from tests.helpers import make_day
+
+
+def test_keys_are_normalised():
+    geo_cache = GeoValidationCache(grid_degrees=0.01)
+    assert geo_cache.get_name_key("The  Colosseum!", "Italy") == geo_cache.get_name_key("the colosseum", "ITALY")
+    assert (geo_cache.get_coordinates_key("41.8902", "12.4922", "Italy") ==
+            geo_cache.get_coordinates_key(41.8911, 12.4931, "italy"))
+    assert (geo_cache.get_coordinates_key("41.8902", "12.4922", "Italy") !=
+            geo_cache.get_coordinates_key("41.95", "12.4922", "Italy"))
+
+
+def test_negative_results_expire_sooner():
+    geo_cache = GeoValidationCache(ttl=10, negative_ttl=0.05)
+    geo_cache.set("valid", True)
+    geo_cache.set("invalid", False)
+    assert geo_cache.get("invalid") is False
+    time.sleep(0.06)
+    assert geo_cache.get("invalid") is None
+    assert geo_cache.get("valid") is True
+    assert geo_cache.get_stats()["hit_rate"] == 2 / 3
+
+
+def test_repeated_names_are_validated_once(monkeypatch):
+    data_validator = DataValidator(geo_cache=GeoValidationCache())
+    calls = []
+    monkeypatch.setattr(data_validator, "validate_content_location",
+                        lambda content_name, requested_country_name: calls.append(content_name) or True)
+    json_itinerary = {"trip_itinerary": [make_day(1)]}
+    assert data_validator.verify_valid_raw_itinerary(json_itinerary, "Italy")
+    assert data_validator.verify_valid_raw_itinerary(json_itinerary, "Italy")
+    assert len(calls) == 5
+
+
+def test_persistent_store_and_warm_up(db_resource):
+    geo_cache = GeoValidationCache().use_persistent_store(db_resource.client_pool)
+    geo_cache.set("name|italy||uffizi", True)
+    # a new process only has the persistent tier
+    assert GeoValidationCache().use_persistent_store(db_resource.client_pool).get("name|italy||uffizi") is True
+
+    geo_cache.set("coordinates|italy|41.900000|12.500000", False)
+    warm_cache = GeoValidationCache().use_persistent_store(db_resource.client_pool)
+    assert warm_cache.warm_up_from_store() == 2
+    assert warm_cache.get("name|italy||uffizi") is True
+    assert warm_cache.get("coordinates|italy|41.900000|12.500000") is False
+    # only the checked keys are loaded - not the keys of the entries of the saved trips
+    db_resource.add_new_generated_trip({"destination": "Italy", "duration": "1 days",
+                                        "body": {"trip_itinerary": [make_day(1)]}})
+    assert GeoValidationCache().use_persistent_store(db_resource.client_pool).warm_up_from_store() == 2
+    assert warm_cache.get_stats()["store_hits"] == 0
@@ -0,0 +1,46 @@
+import sys
+sys.path.append("../")
+
+import threading
+
+from src.resources.accounting_write_behind_queue import AccountingWriteBehindQueue
+from tests.helpers import add_business
+
+
+def get_counters(db_resource, business_id):
+    business = db_resource.business_collection.find_one({"_id": business_id})
+    client = db_resource.business_clients_collection.find_one({"_id": business["business_client_id"]})
+    return business["appearance_counter"], client["credits_spent"]
+
+
+def test_apply_itinerary_accounting(db_resource):
+    first_id = add_business(db_resource, "Trattoria", 5, 0, ["food"])
+    second_id = add_business(db_resource, "Almost Empty", 1, 0, ["food"])
+    lines = {line["_id"]: line for line in db_resource.business_collection.find()}
+
+    # the second business has been published in two trips but has a single credit left
+    db_resource.apply_itinerary_accounting([lines[first_id], lines[second_id], lines[second_id]])
+
+    assert get_counters(db_resource, first_id) == (1, 1)
+    assert get_counters(db_resource, second_id) == (2, 1)
+
+
+def test_updates_credits_and_appearance_counter_concurrently(db_resource):
+    business_id = add_business(db_resource, "Trattoria", 100, 0, ["food"])
+    threads = [threading.Thread(target=db_resource.updates_credits_and_appearance_counter, args=(business_id,))
+               for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert get_counters(db_resource, business_id) == (20, 20)
+
+
+def test_write_behind_queue_flushes_on_close(db_resource):
+    business_id = add_business(db_resource, "Trattoria", 5, 0, ["food"])
+    line = db_resource.business_collection.find_one({"_id": business_id})
+    accounting_queue = AccountingWriteBehindQueue(db_resource.client_pool, flush_interval=0.01)
+    accounting_queue.submit([line, line])
+    accounting_queue.close(timeout=5)
+    assert accounting_queue.pending() == 0
+    assert get_counters(db_resource, business_id) == (2, 2)
@@ -0,0 +1,58 @@
+import sys
+sys.path.append("../")
+
+import time
+
+from src.resources.itinerary_cache import ItineraryCache
+from src.services.user_service import UserService
+
+
+def test_cache_key_is_normalised():
+    first_key = ItineraryCache.get_cache_key({"season": "Summer", "interest-points": ["food", " History"]},
+                                             {"city": "Rome"}, [{"_id": 2}, {"_id": 1}])
+    second_key = ItineraryCache.get_cache_key({"season": "summer ", "interest-points": ["history", "FOOD"]},
+                                              {"city": "rome", "area": ""}, [{"_id": 1}, {"_id": 2}])
+    other_sponsors_key = ItineraryCache.get_cache_key({"season": "summer", "interest-points": ["history", "food"]},
+                                                      {"city": "rome"}, [{"_id": 1}])
+    assert first_key == second_key
+    assert first_key != other_sponsors_key
+
+
+def test_memory_cache_hit_and_ttl(json_itinerary):
+    itinerary_cache = ItineraryCache(max_size=10, ttl=0.05, use_generated_trips=False)
+    assert itinerary_cache.get("key") is None
+    itinerary_cache.set("key", json_itinerary)
+    cached = itinerary_cache.get("key")
+    assert cached == json_itinerary
+    # a copy is returned, so a request can't change the cached itinerary
+    cached["trip_itinerary"].pop()
+    assert itinerary_cache.get("key") == json_itinerary
+    time.sleep(0.06)
+    assert itinerary_cache.get("key") is None
+    assert itinerary_cache.get_stats()["memory_hits"] == 2
+    assert itinerary_cache.get_stats()["misses"] == 2
+
+
+def test_build_trip_is_served_from_the_cache(db_resource, trip_request, json_itinerary):
+    itinerary_cache = ItineraryCache()
+    generations = []
+
+    def build_trip(request_body):
+        service = UserService(request_body, db_resource, itinerary_cache=itinerary_cache)
+        service.get_a_valid_itinerary = lambda recommendations, c_name: generations.append(1) or json_itinerary
+        return service.build_trip()
+
+    first_response = build_trip(trip_request)
+    same_request = dict(trip_request, season="SUMMER", **{"interest-points": "history,food"})
+    second_response = build_trip(same_request)
+    assert len(generations) == 1
+    assert first_response == second_response
+    assert db_resource.generated_trip_collection.count_documents({}) == 2
+
+    # the generated-trips collection is the second tier of the cache
+    assert ItineraryCache().get(db_resource.generated_trip_collection.find_one()["cache_key"],
+                                db_resource) == json_itinerary
+
+    build_trip(dict(trip_request, **{"bypass-cache": "true"}))
+    assert len(generations) == 2
+    assert itinerary_cache.get_stats()["bypasses"] == 1
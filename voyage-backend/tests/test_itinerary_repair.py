@@ -0,0 +1,109 @@
+import sys
+sys.path.append("../")
+
+import json
+import pytest
+
+from src.processors.data_validator import DataValidator
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.services import user_service
+from src.services.user_service import UserService
+from tests.helpers import make_day
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def generated_texts(monkeypatch):
+    responses = []
+    prompts = []
+
+    class FakeGenerativeAIResource:
+        def __init__(self, message, **kwargs):
+            prompts.append(message)
+
+        def get_generative_ai_response(self):
+            return FakeResponse(responses.pop(0))
+
+    monkeypatch.setattr(user_service, "GenerativeAIResource", FakeGenerativeAIResource)
+    return responses, prompts
+
+
+@pytest.fixture
+def service(trip_request, db_resource, monkeypatch):
+    service = UserService(trip_request, db_resource)
+    service.data_validator = DataValidator(geo_cache=GeoValidationCache())
+    service.validated_names = []
+
+    def validate_content_location(content_name, requested_country_name):
+        service.validated_names.append(content_name)
+        return not content_name.startswith("Nowhere")
+
+    monkeypatch.setattr(service.data_validator, "validate_content_location", validate_content_location)
+    monkeypatch.setattr(service.data_validator, "verify_long_lat_in_country",
+                        lambda longitude, latitude, c_name: False)
+    service.required_request_keys = service.get_required_properties_dict()
+    service.optional_request_keys = service.get_optional_keys_dict()
+    return service
+
+
+def test_only_the_invalid_entry_is_repaired(service, generated_texts):
+    responses, prompts = generated_texts
+    second_day = make_day(2)
+    second_day["restaurants_recommendations"][0]["restaurant_name"] = "Nowhere Trattoria"
+    responses.append(json.dumps({"trip_itinerary": [make_day(1), second_day]}))
+    replacement = {"restaurant_name": "Trattoria da Mario", "restaurant_type": "trattoria",
+                   "restaurant_latitude": "41.9", "restaurant_longitude": "12.5"}
+    responses.append(json.dumps({"replacements": [{"day": 2, "part": "restaurants_recommendations", "index": 0,
+                                                   "restaurant": replacement},
+                                                  {"day": 1, "part": "morning_activity", "index": 0,
+                                                   "content": {"content_name": "not requested"}}]}))
+
+    json_itinerary = service.get_a_valid_itinerary([], "Italy")
+
+    assert len(prompts) == 2
+    assert "Nowhere Trattoria" in prompts[1] and "replacements" in prompts[1]
+    assert json_itinerary["trip_itinerary"][1]["restaurants_recommendations"][0] == replacement
+    assert json_itinerary["trip_itinerary"][0]["morning_activity"][0]["content_name"] == "Site 1 morning"
+    # the first attempt validated all the 10 entries, the repair validated only the replacement
+    assert len(service.validated_names) == 11
+    assert service.validated_names[-1] == "Trattoria da Mario"
+
+
+def test_a_replacement_with_the_fields_of_another_part_is_not_spliced(service, generated_texts):
+    responses, prompts = generated_texts
+    second_day = make_day(2)
+    second_day["restaurants_recommendations"][0]["restaurant_name"] = "Nowhere Trattoria"
+    responses.append(json.dumps({"trip_itinerary": [make_day(1), second_day]}))
+    wrong_fields = {"content_name": "Da Enzo", "content_latitude": "41.9", "content_longitude": "12.5"}
+    responses.append(json.dumps({"replacements": [{"day": 2, "part": "restaurants_recommendations", "index": 0,
+                                                   "restaurant": wrong_fields}]}))
+    replacement = {"restaurant_name": "Da Enzo", "restaurant_type": "trattoria", "restaurant_latitude": "41.9",
+                   "restaurant_longitude": "12.5"}
+    responses.append(json.dumps({"replacements": [{"day": 2, "part": "restaurants_recommendations", "index": 0,
+                                                   "restaurant": replacement}]}))
+
+    json_itinerary = service.get_a_valid_itinerary([], "Italy")
+
+    # the position stayed invalid, so it was repaired again by the next attempt
+    assert len(prompts) == 3
+    assert "Nowhere Trattoria" in prompts[2]
+    assert json_itinerary["trip_itinerary"][1]["restaurants_recommendations"][0] == replacement
+    assert service.validated_names.count("Da Enzo") == 1
+    UserService.build_trip_itinerary_response(json_itinerary)
+
+
+def test_structure_errors_regenerate_the_whole_itinerary(service, generated_texts):
+    responses, prompts = generated_texts
+    responses.append(json.dumps({"trip_itinerary": [make_day(1), make_day(2), make_day(3)]}))
+    responses.append("not a json")
+    responses.append(json.dumps({"trip_itinerary": [make_day(1), make_day(2)]}))
+
+    assert len(service.get_a_valid_itinerary([], "Italy")["trip_itinerary"]) == 2
+    assert len(prompts) == 3
+    # the errors of the previous attempt are part of the next prompt
+    assert "incorrect number of itinerary days" in prompts[1]
+    assert "not a Valid JSON" in prompts[2]
@@ -0,0 +1,27 @@
+import sys
+sys.path.append("../")
+
+import os
+import subprocess
+
+from src.resources import generative_ai_resource
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAZY_MODULES = ["google.generativeai", "reverse_geocoder", "geopy", "scipy", "traitlets", "IPython"]
+
+
+def test_the_app_does_not_import_the_heavy_modules():
+    # a fresh interpreter, the modules of the other tests are already imported in this one
+    script = f"import sys, main; print([name for name in {LAZY_MODULES!r} if name in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_the_generative_ai_model_is_created_once(monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "model", None)
+
+    model = generative_ai_resource.get_model()
+
+    assert model.model_name.endswith(generative_ai_resource.GEMINI_MODEL_NAME)
+    assert generative_ai_resource.get_model() is model
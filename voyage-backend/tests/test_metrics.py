@@ -0,0 +1,119 @@
+import sys
+sys.path.append("../")
+
+import pytest
+
+from src.helpers.metrics import (MetricsRegistry, RequestTimer, STAGE_DURATION, JSON_PARSE_FAILURES,
+                                 mark_process_dead)
+from src.helpers.error_handling import ConvertAIResponseToJsonError
+from src.services.user_service import UserService
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_counter_and_histogram_are_rendered_in_the_prometheus_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_calls_total", "test calls", ("service",))
+    histogram = registry.histogram("test_duration_seconds", "test duration", buckets=(0.1, 1.0))
+    counter.inc(service="autocomplete")
+    counter.inc(2, service='quoted "name"')
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    text = registry.render()
+    assert "# TYPE test_calls_total counter" in text
+    assert 'test_calls_total{service="autocomplete"} 1' in text
+    assert 'test_calls_total{service="quoted \\"name\\""} 2' in text
+    assert 'test_duration_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_duration_seconds_bucket{le="1"} 2' in text
+    assert 'test_duration_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_duration_seconds_count 3" in text
+    assert histogram.get_sum() == pytest.approx(5.55)
+
+
+def test_registered_stats_are_rendered_as_gauges():
+    registry = MetricsRegistry()
+    registry.register_stats("test_cache", "cache stats", lambda: {"hits": 3, "hit_rate": 0.75, "name": "lru"})
+    registry.register_stats("test_broken", "broken stats", lambda: 1 / 0)
+
+    text = registry.render()
+    assert "# TYPE test_cache_hits gauge" in text
+    assert "test_cache_hits 3" in text
+    assert "test_cache_hit_rate 0.75" in text
+    assert "test_cache_name" not in text
+
+
+def get_worker_registry(directory, process_id, cache_size):
+    registry = MetricsRegistry()
+    registry.counter("test_calls_total", "test calls", ("service",))
+    registry.histogram("test_duration_seconds", "test duration", buckets=(0.1, 1.0))
+    registry.register_stats("test_cache", "cache stats", lambda: {"size": cache_size})
+    registry.enable_multiprocess(directory, snapshot_seconds=0, process_id=process_id)
+    return registry
+
+
+def test_the_metrics_of_the_worker_processes_are_summed(tmp_path):
+    first = get_worker_registry(str(tmp_path), 1, cache_size=10)
+    second = get_worker_registry(str(tmp_path), 2, cache_size=20)
+    first.counter("test_calls_total", "test calls").inc(2, service="autocomplete")
+    second.counter("test_calls_total", "test calls").inc(3, service="autocomplete")
+    second.counter("test_calls_total", "test calls").inc(service="nominatim")
+    first.histogram("test_duration_seconds", "test duration").observe(0.05)
+    second.histogram("test_duration_seconds", "test duration").observe(0.5)
+    second.write_snapshot()
+
+    text = first.render()
+    assert 'test_calls_total{service="autocomplete"} 5' in text
+    assert 'test_calls_total{service="nominatim"} 1' in text
+    assert 'test_duration_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_duration_seconds_bucket{le="1"} 2' in text
+    assert "test_duration_seconds_count 2" in text
+    assert 'test_cache_size{pid="1"} 10' in text
+    assert 'test_cache_size{pid="2"} 20' in text
+
+    # a recycled worker - its counters are kept, its gauges are gone
+    second.disable_multiprocess()
+    mark_process_dead(str(tmp_path), 2)
+    first.counter("test_calls_total", "test calls").inc(service="autocomplete")
+    text = first.render()
+    first.disable_multiprocess()
+    assert 'test_calls_total{service="autocomplete"} 6' in text
+    assert 'test_calls_total{service="nominatim"} 1' in text
+    assert "test_duration_seconds_count 2" in text
+    assert 'pid="2"' not in text
+
+
+def test_request_timer_observes_each_stage():
+    timer = RequestTimer("test_operation")
+    with timer.stage("gemini"):
+        pass
+    with timer.stage("gemini"):
+        pass
+    with pytest.raises(ValueError):
+        with timer.stage("validation"):
+            raise ValueError()
+
+    assert set(timer.stages) == {"gemini", "validation"}
+    assert STAGE_DURATION.get_count(operation="test_operation", stage="gemini") == 2
+    assert STAGE_DURATION.get_count(operation="test_operation", stage="validation") == 1
+
+
+def test_json_parse_failures_are_counted():
+    failures = JSON_PARSE_FAILURES.get()
+    with pytest.raises(ConvertAIResponseToJsonError):
+        UserService.convert_ai_response_to_json(FakeResponse('{"trip_itinerary": ['))
+    assert JSON_PARSE_FAILURES.get() == failures + 1
+
+
+def test_metrics_endpoint():
+    import main
+    response = main.app.test_client().get("/api/v1/management/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE voyage_stage_duration_seconds histogram" in text
+    assert "voyage_geo_validation_cache_hit_rate" in text
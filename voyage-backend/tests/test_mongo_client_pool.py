@@ -0,0 +1,94 @@
+import sys
+sys.path.append("../")
+
+import threading
+import pytest
+
+from src.resources.mongo_client_pool import MongoClientPool
+from src.helpers.error_handling import MongoConnectionError
+
+
+class FakeAdmin:
+    def __init__(self, client):
+        self.client = client
+
+    def command(self, name):
+        self.client.pings += 1
+        if self.client.fail_ping:
+            raise Exception("connection refused")
+        return {"ok": 1.0}
+
+
+class FakeMongoClient:
+    created = 0
+
+    def __init__(self, uri, **kwargs):
+        FakeMongoClient.created += 1
+        self.uri = uri
+        self.kwargs = kwargs
+        self.pings = 0
+        self.fail_ping = False
+        self.closed = False
+        self.admin = FakeAdmin(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool():
+    FakeMongoClient.created = 0
+    client_pool = MongoClientPool("mongodb://localhost", max_pool_size=7, health_check_interval=0,
+                                  client_factory=FakeMongoClient)
+    yield client_pool
+    client_pool.close()
+
+
+def test_client_is_created_once_and_shared(pool):
+    assert FakeMongoClient.created == 0
+    clients = [pool.get_client() for _ in range(5)]
+    assert FakeMongoClient.created == 1
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].pings == 1
+    assert clients[0].kwargs["maxPoolSize"] == 7
+
+
+def test_concurrent_first_use_creates_a_single_client(pool):
+    threads = [threading.Thread(target=pool.get_client) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert FakeMongoClient.created == 1
+
+
+def test_health_check_and_close(pool):
+    client = pool.get_client()
+    assert pool.is_healthy()
+    client.fail_ping = True
+    assert not pool.check_health()
+    assert not pool.is_healthy()
+    pool.close()
+    assert client.closed
+    assert not pool.is_healthy()
+
+
+def test_connection_failure_raises_mongo_connection_error():
+    class FailingClient(FakeMongoClient):
+        def __init__(self, uri, **kwargs):
+            super().__init__(uri, **kwargs)
+            self.fail_ping = True
+
+    client_pool = MongoClientPool("mongodb://localhost", health_check_interval=0, client_factory=FailingClient)
+    with pytest.raises(MongoConnectionError):
+        client_pool.get_client()
+
+
+def test_reset_after_fork_creates_a_new_client_without_closing_the_inherited_one(pool):
+    inherited_client = pool.get_client()
+    pool.reset_after_fork()
+    assert not pool.is_healthy()
+    new_client = pool.get_client()
+    assert new_client is not inherited_client
+    assert not inherited_client.closed
+    assert FakeMongoClient.created == 2
@@ -0,0 +1,89 @@
+import sys
+sys.path.append("../")
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.helpers.circuit_breaker import CircuitBreaker
+from src.helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from src.resources.pooled_http_client import PooledHttpClient
+
+
+@pytest.fixture
+def server():
+    """a keep-alive HTTP server that answers with the queued status codes (200 when the queue is empty)"""
+    statuses = []
+    served = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            status = statuses.pop(0) if statuses else 200
+            served.append(status)
+            body = b'{"predictions": []}'
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{http_server.server_port}/autocomplete", statuses, served
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def make_client(failure_threshold=3, reset_seconds=60.0):
+    return PooledHttpClient("autocomplete", pool_size=2, connect_timeout=1, read_timeout=1, max_retries=2,
+                            backoff_factor=0.01, backoff_jitter=0.01,
+                            circuit_breaker=CircuitBreaker(failure_threshold, reset_seconds))
+
+
+def test_connections_are_kept_alive(server):
+    url, _, served = server
+    client = make_client()
+
+    for _ in range(5):
+        assert client.get(url, params={"input": "Colosseum"}).status_code == 200
+    assert client.get_stats()["new_connections"] == 1
+    assert client.get_stats()["reused_connections"] == 4
+    client.close()
+
+
+def test_retryable_status_is_retried(server):
+    url, statuses, served = server
+    statuses.extend([503, 502])
+    client = make_client()
+
+    assert client.get(url).status_code == 200
+    assert served == [503, 502, 200]
+    assert client.get_stats()["circuit_open"] == 0
+    client.close()
+
+
+def test_circuit_opens_and_fails_fast(server):
+    url, statuses, served = server
+    statuses.extend([503] * 6)
+    client = make_client(failure_threshold=2, reset_seconds=0.2)
+
+    assert client.get(url).status_code == 503
+    assert client.get(url).status_code == 503
+    with pytest.raises(CouldNotGetValidResponseFromThirdParty) as error:
+        client.get(url)
+    assert error.value.error_status_code == 503
+    assert len(served) == 6 and client.get_stats()["circuit_rejected"] == 1
+
+    # after the reset time a trial call is let through, and its success closes the circuit
+    time.sleep(0.25)
+    assert client.get(url).status_code == 200
+    assert client.get_stats()["circuit_open"] == 0
+    client.close()
@@ -0,0 +1,40 @@
+import sys
+sys.path.append("../")
+
+import json
+
+from src.processors.prompt_builder import PromptBuilder, TRIP_JSON_MODEL, TRIP_PROMPT_INSTRUCTIONS
+
+
+def make_builder(trip_request, recommendations=()):
+    return (PromptBuilder()
+            .with_required_keys(trip_request)
+            .with_optional_keys({"city": "Rome"})
+            .with_optional_business_recommendations(list(recommendations)))
+
+
+def test_json_model_is_rendered_once():
+    assert PromptBuilder.get_json_model() is TRIP_JSON_MODEL
+    assert json.loads(TRIP_JSON_MODEL)["trip_itinerary"][1]["day"] == 2
+
+
+def test_retry_prompt_appends_only_the_errors(trip_request):
+    builder = make_builder(trip_request, [{"business_name": "Trattoria", "business_type": "restaurant",
+                                           "business_country": "Italy"}])
+    first_prompt = builder.build()
+    request_prompt = builder.build_request_prompt()
+    retry_prompt = builder.with_error_identification({"Trattoria is not in Italy": "invalid location"}).build()
+
+    assert first_prompt == request_prompt + TRIP_PROMPT_INSTRUCTIONS
+    assert "1)    Business name: Trattoria" in request_prompt and "the city should be: Rome" in request_prompt
+    assert retry_prompt.startswith(request_prompt) and retry_prompt.endswith(TRIP_PROMPT_INSTRUCTIONS)
+    assert "the following errors were found: {'Trattoria is not in Italy'" in retry_prompt
+    # the request section is reused by the retry
+    assert builder.build_request_prompt() is request_prompt
+
+
+def test_request_section_is_rebuilt_when_the_request_changes(trip_request):
+    builder = make_builder(trip_request)
+    assert "the vacation duration should be: 2 days" in builder.build()
+    builder.with_required_keys(dict(trip_request, duration="5 days"))
+    assert "the vacation duration should be: 5 days" in builder.build()
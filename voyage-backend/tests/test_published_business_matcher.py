@@ -0,0 +1,53 @@
+import sys
+sys.path.append("../")
+
+from src.processors.published_business_matcher import PublishedBusinessMatcher
+from src.services.user_service import UserService
+from tests.helpers import make_day
+
+
+def make_matcher(fuzzy=True):
+    second_day = make_day(2)
+    second_day["restaurants_recommendations"][0]["restaurant_name"] = "Trattoria da Mario"
+    second_day["evening_activity"][0]["content_name"] = "  Café-Roma  "
+    trip_itinerary = UserService.build_trip_itinerary_response({"trip_itinerary": [make_day(1), second_day]})
+    return PublishedBusinessMatcher(trip_itinerary, fuzzy=fuzzy)
+
+
+def test_normalised_names_are_matched_with_their_positions():
+    matcher = make_matcher()
+
+    assert matcher.match("HOTEL 1") == ("hotel 1", [{"day": 1, "slot": "accommodation_recommendations"}])
+    assert matcher.match("cafe roma") == ("cafe roma", [{"day": 2, "slot": "evening_activity"}])
+    assert matcher.match("Hotel 3") == (None, [])
+
+
+def test_near_miss_names_are_matched_only_when_fuzzy():
+    assert make_matcher().match("Trattoria Mario")[0] == "trattoria da mario"
+    assert make_matcher(fuzzy=False).match("Trattoria Mario") == (None, [])
+    # similar names with different numbers are different businesses
+    assert make_matcher().match("Restaurant 3") == (None, [])
+
+
+def test_names_with_other_words_are_not_near_misses():
+    second_day = make_day(2)
+    second_day["accommodation_recommendations"][0]["accommodation_name"] = "Grand Hotel Roma Centrale"
+    second_day["evening_activity"][0]["content_name"] = "Hotel Paris Opera"
+    second_day["restaurants_recommendations"][0]["restaurant_name"] = "Il Gatto"
+    trip_itinerary = UserService.build_trip_itinerary_response({"trip_itinerary": [make_day(1), second_day]})
+    matcher = PublishedBusinessMatcher(trip_itinerary, fuzzy=True)
+
+    assert matcher.match("Hotel Roma") == (None, [])
+    assert matcher.match("Hotel Paris") == (None, [])
+    # a name of filler words only, and a short name that is not similar enough
+    assert matcher.match("The") == (None, [])
+    assert matcher.match("Gatto") == (None, [])
+
+
+def test_every_published_recommendation_is_found(json_itinerary, db_resource):
+    recommendations = [{"_id": "1", "business_name": "Restaurant 2"}, {"_id": "2", "business_name": "Nowhere"},
+                       {"_id": "3", "business_name": "site 1 MORNING"}, {"_id": "4", "business_name": "Hotel 2"}]
+    trip_itinerary = UserService.build_trip_itinerary_response(json_itinerary)
+
+    assert UserService({}, db_resource).get_published_business_ids_from_itinerary(trip_itinerary, recommendations) == \
+        ["1", "3", "4"]
@@ -0,0 +1,31 @@
+import sys
+sys.path.append("../")
+
+from src.processors import data_validator
+from src.services.service_container import ServiceContainer
+
+
+def test_requests_share_the_components_but_not_their_state(db_resource, trip_request):
+    services = ServiceContainer(db_resource.client_pool)
+    first_service = services.create_user_service(dict(trip_request))
+    second_service = services.create_user_service(dict(trip_request))
+
+    assert first_service.db_resource is second_service.db_resource
+    assert first_service.business_ranker is second_service.business_ranker
+    assert first_service.response_builder is services.create_business_service({}).response_builder
+    first_service.data_validator.errors["error"] = "invalid location"
+    assert second_service.data_validator.errors == {}
+    assert first_service.prompt_builder is not second_service.prompt_builder
+
+
+def test_components_of_the_parent_process_are_recreated_after_fork(db_resource, trip_request, monkeypatch):
+    monkeypatch.setattr(data_validator, "_shared_geo_locator", None)
+    services = ServiceContainer(db_resource.client_pool)
+    shared_db_resource = services.get_db_resource()
+    geo_locator = services.create_user_service(dict(trip_request)).data_validator.geo_locator
+    assert services.create_user_service(dict(trip_request)).data_validator.geo_locator is geo_locator
+
+    services.restart_after_fork()
+
+    assert services.get_db_resource() is not shared_db_resource
+    assert services.create_user_service(dict(trip_request)).data_validator.geo_locator is not geo_locator
@@ -0,0 +1,129 @@
+import sys
+sys.path.append("../")
+
+import threading
+import time
+
+import pytest
+
+from src.helpers.single_flight import SingleFlight
+from src.helpers.metrics import COALESCED_REQUESTS, GEMINI_CALLS_SAVED
+from src.helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+from src.services.user_service import UserService
+
+
+def start_waiters(single_flight, key, function, count, results, timeout=5):
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do(key, function, timeout)))
+               for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_concurrent_calls_share_the_leader_result():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        release.wait(timeout=5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.do("key", function)))
+    leader.start()
+    while single_flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    waiters = start_waiters(single_flight, "key", function, 3, results)
+    while single_flight._calls["key"].waiters < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + waiters:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    # the key is forgotten once the call is done
+    assert single_flight.do("key", lambda: "new result") == ("new result", False)
+
+
+def test_waiter_timeout_and_shared_error():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def function():
+        release.wait(timeout=5)
+        raise ValueError("failed")
+
+    leader = threading.Thread(target=lambda: pytest.raises(ValueError, single_flight.do, "key", function))
+    leader.start()
+    while single_flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(TimeoutError):
+        single_flight.do("key", function, timeout=0.01)
+    waiter_errors = []
+    waiter = threading.Thread(target=lambda: waiter_errors.append(
+        pytest.raises(ValueError, single_flight.do, "key", function, 5)))
+    waiter.start()
+    while single_flight._calls["key"].waiters < 2:
+        time.sleep(0.001)
+    release.set()
+    leader.join()
+    waiter.join()
+
+    assert len(waiter_errors) == 1
+    assert single_flight.get_stats() == {"leaders": 1, "shared": 1, "timeouts": 1, "in_flight": 0}
+
+
+def test_identical_trip_requests_share_a_generation(db_resource, trip_request, json_itinerary):
+    single_flight = SingleFlight()
+    release = threading.Event()
+    generations = []
+    saved_calls = GEMINI_CALLS_SAVED.get()
+    shared_requests = COALESCED_REQUESTS.get(outcome="shared")
+
+    def get_a_valid_itinerary(service):
+        generations.append(1)
+        service.generation_calls += 2
+        release.wait(timeout=5)
+        return json_itinerary
+
+    def build_trip(request_body, responses):
+        service = UserService(request_body, db_resource, single_flight=single_flight)
+        service.get_a_valid_itinerary = lambda recommendations, c_name: get_a_valid_itinerary(service)
+        responses.append(service.build_trip())
+
+    responses = []
+    threads = [threading.Thread(target=build_trip, args=(trip_request, responses)) for _ in range(3)]
+    threads[0].start()
+    while single_flight.get_stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    for thread in threads[1:]:
+        thread.start()
+    while single_flight._calls[next(iter(single_flight._calls))].waiters < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(generations) == 1
+    assert len(responses) == 3 and all(response == responses[0] for response in responses)
+    # every request is still saved as its own trip
+    assert db_resource.generated_trip_collection.count_documents({}) == 3
+    assert COALESCED_REQUESTS.get(outcome="shared") == shared_requests + 2
+    assert GEMINI_CALLS_SAVED.get() == saved_calls + 4
+
+
+def test_coalesced_request_timeout(db_resource, trip_request):
+    single_flight = SingleFlight()
+    service = UserService(trip_request, db_resource, single_flight=single_flight)
+
+    def do(key, function, timeout):
+        raise TimeoutError()
+
+    single_flight.do = do
+    with pytest.raises(CouldNotGetValidResponseFromThirdParty) as e:
+        service.get_coalesced_itinerary("key", [], "Italy")
+    assert e.value.error_status_code == 504
+    assert COALESCED_REQUESTS.get(outcome="timeout") >= 1
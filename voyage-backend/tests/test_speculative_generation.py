@@ -0,0 +1,98 @@
+import sys
+sys.path.append("../")
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from src.helpers.metrics import SPECULATIVE_GENERATIONS
+from src.processors.data_validator import DataValidator
+from src.resources import generative_ai_resource
+from src.resources.generative_ai_resource import GenerativeAIQuota, SpeculativeGeneration, TokenAccounting
+from src.resources.geo_validation_cache import GeoValidationCache
+from src.services.user_service import UserService
+from tests.helpers import make_day
+
+
+class FakeModel:
+    """answers each generation by its temperature - after the delay, with the text"""
+
+    def __init__(self, responses_by_temperature):
+        self.responses_by_temperature = responses_by_temperature
+        self.temperatures = []
+
+    def generate_content(self, message, generation_config=None, request_options=None, stream=False):
+        temperature = generation_config["temperature"]
+        self.temperatures.append(temperature)
+        delay, text = self.responses_by_temperature[temperature]
+        time.sleep(delay)
+        return SimpleNamespace(text=text, candidates=[], usage_metadata=SimpleNamespace(total_token_count=1000))
+
+
+@pytest.fixture
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "generative_ai_quota", GenerativeAIQuota(3, 6000))
+    monkeypatch.setattr(generative_ai_resource, "token_accounting", TokenAccounting())
+    executor = ThreadPoolExecutor(max_workers=6)
+    monkeypatch.setattr(generative_ai_resource, "hedging_executor", executor)
+    yield
+    # the discarded generations of a test would release their quota slots into the quota of the next test
+    executor.shutdown(wait=True)
+
+
+def get_service(trip_request, db_resource, monkeypatch):
+    service = UserService(dict(trip_request), db_resource, speculative_generation=True)
+    service.data_validator = DataValidator(geo_cache=GeoValidationCache())
+    monkeypatch.setattr(service.data_validator, "validate_content_location",
+                        lambda content_name, requested_country_name: not content_name.startswith("Nowhere"))
+    monkeypatch.setattr(service.data_validator, "verify_long_lat_in_country",
+                        lambda longitude, latitude, c_name: False)
+    service.prepare_trip_request()
+    return service
+
+
+def test_the_first_valid_itinerary_wins(trip_request, db_resource, fresh_state, monkeypatch):
+    valid_itinerary = {"trip_itinerary": [make_day(1), make_day(2)]}
+    fake_model = FakeModel({0.4: (0, "not a json"), 0.8: (0.05, json.dumps(valid_itinerary)),
+                            1.0: (0.3, json.dumps({"trip_itinerary": [make_day(1), make_day(2, "Nowhere")]}))})
+    monkeypatch.setattr(generative_ai_resource, "model", fake_model)
+    service = get_service(trip_request, db_resource, monkeypatch)
+    won = SPECULATIVE_GENERATIONS.get(outcome="won")
+
+    assert service.get_a_valid_itinerary([], "Italy") == valid_itinerary
+    assert sorted(fake_model.temperatures) == [0.4, 0.8, 1.0]
+    assert service.generation_calls == 3
+    assert SPECULATIVE_GENERATIONS.get(outcome="won") == won + 1
+
+
+def test_a_repairable_itinerary_does_not_wait_for_the_slowest_generation(trip_request, db_resource, fresh_state,
+                                                                         monkeypatch):
+    repairable_itinerary = {"trip_itinerary": [make_day(1), make_day(2, "Nowhere")]}
+    monkeypatch.setattr(generative_ai_resource, "model",
+                        FakeModel({0.4: (0, "not a json"), 0.8: (0.05, json.dumps(repairable_itinerary)),
+                                   1.0: (0.5, json.dumps({"trip_itinerary": [make_day(1), make_day(2)]}))}))
+    service = get_service(trip_request, db_resource, monkeypatch)
+
+    start = time.monotonic()
+    json_itinerary, is_valid = service.get_speculative_itinerary("prompt", "Italy")
+
+    assert time.monotonic() - start < 0.4
+    assert (json_itinerary, is_valid) == (repairable_itinerary, False)
+    assert [entry["content_name"] for entry in service.data_validator.invalid_entries] == \
+        ["Nowhere 2 morning", "Nowhere 2 afternoon", "Nowhere 2 evening"]
+
+
+def test_the_cost_cap_and_the_quota_limit_the_generations(fresh_state, monkeypatch):
+    monkeypatch.setattr(generative_ai_resource, "model", FakeModel({0.4: (0, "a"), 0.8: (0, "b"), 1.0: (0, "c")}))
+    generative_ai_resource.token_accounting.record(total_tokens=10000)
+
+    speculative_generation = SpeculativeGeneration("prompt", generations=3, max_tokens=24000)
+    assert speculative_generation.start() == 2
+    speculative_generation.finish()
+
+    generative_ai_resource.generative_ai_quota.acquire(1)
+    generative_ai_resource.generative_ai_quota.acquire(1)
+    assert SpeculativeGeneration("prompt", generations=3, max_tokens=100000).start() == 1
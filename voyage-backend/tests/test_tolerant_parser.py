@@ -0,0 +1,62 @@
+import sys
+sys.path.append("../")
+
+import json
+
+from src.models.generated_trip import GeneratedTrip
+from src.processors.incremental_itinerary_parser import IncrementalItineraryParser
+from src.resources.generative_ai_resource import GenerativeAIResource
+from src.services import user_service
+from src.services.user_service import UserService
+from tests.helpers import make_day
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_fenced_json_is_parsed(json_itinerary):
+    fenced_text = f"```json\n{json.dumps(json_itinerary)}\n```"
+
+    assert IncrementalItineraryParser.parse_text(json.dumps(json_itinerary)) == (json_itinerary, None)
+    assert IncrementalItineraryParser.parse_text(fenced_text) == (json_itinerary, "fenced")
+
+
+def test_complete_days_of_a_truncated_itinerary_are_recovered():
+    text = json.dumps({"trip_itinerary": [make_day(1), make_day(2), make_day(3)]})
+    truncated_text = "```json\n" + text[:text.index('"day": 3') + 20]
+
+    json_itinerary, recovery = IncrementalItineraryParser.parse_text(truncated_text)
+    assert recovery == "truncated"
+    assert json_itinerary == {"trip_itinerary": [make_day(1), make_day(2)]}
+    assert IncrementalItineraryParser.parse_text("the itinerary is not available") == (None, None)
+
+
+def test_json_mode_generation_config():
+    resource = GenerativeAIResource("prompt", response_schema=GeneratedTrip, json_mode=True)
+    assert resource.generation_config == {"response_mime_type": "application/json", "response_schema": GeneratedTrip}
+    assert GenerativeAIResource("prompt", json_mode=False).generation_config is None
+
+
+def test_only_the_missing_days_are_generated(trip_request, db_resource, monkeypatch):
+    prompts = []
+
+    class FakeGenerativeAIResource:
+        def __init__(self, message, **kwargs):
+            prompts.append(message)
+
+        def get_generative_ai_response(self):
+            return FakeResponse(json.dumps({"trip_itinerary": [make_day(1, "New"), make_day(2, "New")]}))
+
+    monkeypatch.setattr(user_service, "GenerativeAIResource", FakeGenerativeAIResource)
+    service = UserService(dict(trip_request, duration="4 days"), db_resource)
+    service.required_request_keys = service.get_required_properties_dict()
+    service.optional_request_keys = service.get_optional_keys_dict()
+
+    json_itinerary = service.complete_missing_days({"trip_itinerary": [make_day(1), make_day(2)]}, 4)
+
+    assert [day["day"] for day in json_itinerary["trip_itinerary"]] == [1, 2, 3, 4]
+    assert json_itinerary["trip_itinerary"][2]["morning_activity"][0]["content_name"] == "New 1 morning"
+    assert "the vacation duration should be: 2 days" in prompts[0] and "Site 2 evening" in prompts[0]
+    assert service.generation_calls == 1
@@ -0,0 +1,169 @@
+import sys
+sys.path.append("../")
+
+import datetime
+import threading
+import time
+
+from src.resources.trip_job_queue import TripJobQueue
+from src.helpers.error_handling import CouldNotGetValidResponseFromThirdParty
+
+
+class FakeTripService:
+    """generates a trip (saved to the generated-trips collection) once it is released"""
+
+    def __init__(self, db_resource, request_body, release, fail=False):
+        self.db_resource = db_resource
+        self.request_body = request_body
+        self.release = release
+        self.fail = fail
+
+    def generate_trip(self):
+        self.release.wait(timeout=5)
+        if self.fail:
+            raise CouldNotGetValidResponseFromThirdParty("The generative AI did not respond in time", 504)
+        json_itinerary = {"trip_itinerary": [{"day": 1}]}
+        return json_itinerary, self.db_resource.add_new_generated_trip({"body": json_itinerary})
+
+
+def make_queue(db_resource, release, fail=False, **kwargs):
+    calls = []
+
+    def service_factory(request_body):
+        calls.append(request_body)
+        return FakeTripService(db_resource, request_body, release, fail)
+
+    return TripJobQueue(db_resource.client_pool, service_factory, **kwargs), calls
+
+
+def wait_for_jobs(trip_job_queue, timeout=5):
+    deadline = time.monotonic() + timeout
+    while trip_job_queue.get_stats()["in_process"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_job_is_done_and_its_trip_is_saved(db_resource, trip_request):
+    release = threading.Event()
+    release.set()
+    trip_job_queue, _ = make_queue(db_resource, release)
+    job_id, created = trip_job_queue.submit(trip_request, "key")
+    wait_for_jobs(trip_job_queue)
+
+    job = trip_job_queue.get_job(str(job_id))
+    assert created
+    assert job["status"] == "done" and job["attempts"] == 1
+    assert db_resource.get_generated_trip_from_db(job["trip_id"]) == {"trip_itinerary": [{"day": 1}]}
+    assert trip_job_queue.get_stats()["done"] == 1
+
+
+def test_identical_in_flight_requests_share_a_job(db_resource, trip_request):
+    release = threading.Event()
+    trip_job_queue, calls = make_queue(db_resource, release)
+    first_job_id, _ = trip_job_queue.submit(trip_request, "key")
+    second_job_id, created = trip_job_queue.submit(trip_request, "key")
+    other_job_id, _ = trip_job_queue.submit(trip_request, "other key")
+    release.set()
+    wait_for_jobs(trip_job_queue)
+
+    assert second_job_id == first_job_id and not created
+    assert other_job_id != first_job_id
+    assert len(calls) == 2
+    # a finished job is not joined by a new request
+    assert trip_job_queue.submit(trip_request, "key")[1]
+
+
+def test_identical_requests_of_different_processes_share_a_job(db_resource, trip_request):
+    db_resource.ensure_indexes()
+    release = threading.Event()
+    queues = [make_queue(db_resource, release)[0] for _ in range(2)]
+    start = threading.Barrier(8)
+    results = []
+
+    def submit(trip_job_queue):
+        start.wait()
+        results.append(trip_job_queue.submit(trip_request, "key"))
+
+    threads = [threading.Thread(target=submit, args=(queues[number % 2],)) for number in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    release.set()
+    for trip_job_queue in queues:
+        wait_for_jobs(trip_job_queue)
+
+    assert len({job_id for job_id, _ in results}) == 1
+    assert [created for _, created in results].count(True) == 1
+    assert db_resource.trip_jobs_collection.count_documents({}) == 1
+    # the in-flight key of a finished job is removed
+    assert db_resource.get_in_flight_trip_job("key") is None
+
+
+def test_failed_job_keeps_the_error(db_resource, trip_request):
+    release = threading.Event()
+    release.set()
+    trip_job_queue, _ = make_queue(db_resource, release, fail=True)
+    job_id, _ = trip_job_queue.submit(trip_request, "key")
+    wait_for_jobs(trip_job_queue)
+
+    job = trip_job_queue.get_job(str(job_id))
+    assert job["status"] == "failed" and job["status_code"] == 504
+
+
+def test_too_many_pending_jobs_are_rejected(db_resource, trip_request):
+    release = threading.Event()
+    trip_job_queue, _ = make_queue(db_resource, release, max_workers=1, max_pending=1)
+    trip_job_queue.submit(trip_request, "key")
+    try:
+        trip_job_queue.submit(trip_request, "other key")
+        assert False, "expected the job to be rejected"
+    except CouldNotGetValidResponseFromThirdParty as e:
+        assert e.error_status_code == 503
+    finally:
+        release.set()
+        trip_job_queue.close()
+
+
+def test_pending_and_stale_jobs_are_resumed(db_resource, trip_request):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    stale = now - datetime.timedelta(hours=1)
+    pending_id = db_resource.add_trip_job({"status": "pending", "request_body": trip_request, "request_key": "a",
+                                           "attempts": 0, "created_at": now, "updated_at": now})
+    stale_id = db_resource.add_trip_job({"status": "running", "request_body": trip_request, "request_key": "b",
+                                         "attempts": 1, "created_at": stale, "updated_at": stale})
+    running_id = db_resource.add_trip_job({"status": "running", "request_body": trip_request, "request_key": "c",
+                                           "attempts": 1, "created_at": now, "updated_at": now})
+    release = threading.Event()
+    release.set()
+    trip_job_queue, _ = make_queue(db_resource, release, stale_seconds=60)
+
+    assert trip_job_queue.resume_pending_jobs() == 2
+    wait_for_jobs(trip_job_queue)
+    assert db_resource.get_trip_job(pending_id)["status"] == "done"
+    assert db_resource.get_trip_job(stale_id)["attempts"] == 2
+    assert db_resource.get_trip_job(running_id)["status"] == "running"
+
+
+def test_stale_jobs_are_swept_periodically(db_resource, trip_request):
+    release = threading.Event()
+    release.set()
+    trip_job_queue, _ = make_queue(db_resource, release, stale_seconds=60, sweep_seconds=0.05)
+    assert trip_job_queue.resume_pending_jobs() == 0
+    # the worker of the job is gone after the serving process has started
+    stale = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=1)
+    stale_id = db_resource.add_trip_job({"status": "running", "request_body": trip_request, "request_key": "a",
+                                         "attempts": 1, "created_at": stale, "updated_at": stale})
+
+    deadline = time.monotonic() + 5
+    while db_resource.get_trip_job(stale_id)["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    trip_job_queue.close()
+
+    assert db_resource.get_trip_job(stale_id)["status"] == "done"
+    assert trip_job_queue.get_stats()["swept"] == 1
+
+
+def test_unknown_job_id(db_resource):
+    trip_job_queue, _ = make_queue(db_resource, threading.Event())
+    assert trip_job_queue.get_job("not-an-id") is None
+    assert trip_job_queue.get_job("0123456789ab0123456789ab") is None
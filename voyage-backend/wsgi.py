@@ -0,0 +1,4 @@
+"""the WSGI entry point of the production server: gunicorn -c gunicorn.conf.py wsgi:app"""
+from main import app
+
+application = app